@@ -0,0 +1,315 @@
+"""
+Benchmarks of the interaction hot paths of the viewers.
+
+Times the slice statistics, display transforms and the Compare slots that run
+on every cursor move, slice change, overlay threshold change and movie frame,
+as well as viewer construction, for every combination of image size, number of
+compared images and dtype.  GUI timings include drawing the canvases and
+processing the Qt events the slot posts, so they are close to the latency of
+the interaction.  Movie frames are drawn the way the animation draws them.
+Benchmarks ending in .cold clear the caches the slot would otherwise hit
+before every timed call, e.g. the slice cache for a slice change.
+
+Results are written as JSON.  With --baseline, benchmarks whose median time is
+more than --tolerance slower than in the baseline results are reported and the
+exit status is 1.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/hot_paths.py --sizes 256 512 --num-images 1 4 --output results.json
+    QT_QPA_PLATFORM=offscreen python benchmarks/hot_paths.py --baseline results.json
+"""
+import argparse
+import fnmatch
+import json
+import platform
+import sys
+import time
+
+import matplotlib
+import numpy as np
+from PyQt5 import QtCore, QtWidgets
+
+import vidi3d
+from vidi3d.definitions import ImageDisplayType
+from vidi3d.helpers import apply_display_type
+from vidi3d.image import MplImage
+
+# the Compare.movie_update benchmarks are last, every panel is left in movie mode
+VIEWER_BENCHMARKS = ('Compare.update_plots', 'Compare.on_z_change', 'Compare.on_z_change.cold',
+                     'Compare.get_roi_mask', 'Compare.get_roi_mask.cold', 'Compare.threshold_overlay',
+                     'Compare.movie_update', 'Compare.movie_update.cold')
+MOVIE_BENCHMARKS = ('Compare.movie_update', 'Compare.movie_update.cold')
+
+
+def make_images(num_images, shape, dtype):
+    rng = np.random.default_rng(0)
+    x, y = np.meshgrid(np.linspace(-1, 1, shape[0]), np.linspace(-1, 1, shape[1]), indexing='ij')
+    disk = (x ** 2 + y ** 2 < 0.6).astype(np.float32)
+    images = []
+    for indx in range(num_images):
+        image = np.empty(shape, dtype=dtype)
+        for z in range(shape[2]):
+            noise = rng.standard_normal(shape[:2] + shape[3:], dtype=np.float32) * 0.05
+            values = (disk * (1 + 0.1 * (z + indx) / shape[2]))[..., np.newaxis] + noise
+            if np.iscomplexobj(image):
+                values = values * np.exp(1j * np.pi * x / 4)[..., np.newaxis]
+            image[:, :, z] = values
+        images.append(image)
+    return images
+
+
+def make_overlay(shape):
+    x, y = np.meshgrid(np.linspace(-1, 1, shape[0]), np.linspace(-1, 1, shape[1]), indexing='ij')
+    return np.repeat((np.hypot(x, y) * 100)[..., np.newaxis], shape[2], axis=2).astype(np.float32)
+
+
+def process_events():
+    QtWidgets.QApplication.processEvents()
+
+
+def flush_viewer(viewer):
+    # pending draws and paints of every canvas, e.g. the 'lut' engine only schedules a paint
+    for canvas in viewer.image_figures + viewer.plots:
+        canvas.flush_events()
+
+
+def measure(function, repeat, warmup=1, setup=None):
+    # setup runs before every call and is not timed
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        function()
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1e3
+    return {'repeat': repeat,
+            'min_ms': float(times.min()),
+            'median_ms': float(np.median(times)),
+            'mean_ms': float(times.mean()),
+            'max_ms': float(times.max())}
+
+
+def cycle(values):
+    state = {'indx': 0}
+
+    def next_value():
+        state['indx'] = (state['indx'] + 1) % len(values)
+        return values[state['indx']]
+
+    return next_value
+
+
+def statistics_benchmarks(images):
+    # slice statistics and display transforms of the first image
+    complex_slice = images[0][:, :, 0, 0]
+    magnitude = apply_display_type(complex_slice, ImageDisplayType.mag)
+    benchmarks = {
+        'default_level': lambda: MplImage.default_level(magnitude),
+        'get_dynamic_range': lambda: MplImage.get_dynamic_range(magnitude),
+    }
+    for name in ('real', 'imag', 'mag', 'phase'):
+        display_type = getattr(ImageDisplayType, name)
+        benchmarks[f'apply_display_type.{name}'] = (
+            lambda display_type=display_type: apply_display_type(complex_slice, display_type))
+    return benchmarks
+
+
+def viewer_benchmarks(viewer, shape):
+    nx, ny, nz, nt = shape
+    next_z = cycle(list(range(nz)))
+    next_x = cycle(list(range(0, nx, max(1, nx // 16))))
+    next_frame = cycle(list(range(nt)))
+    lower, upper = 0.0, 100.0
+    next_threshold = cycle([(lower + step, upper - step) for step in range(0, 40, 5)])
+
+    def update_plots():
+        viewer.loc.x = next_x()
+        viewer.update_plots()
+        flush_viewer(viewer)
+
+    def on_z_change():
+        viewer.on_z_change(next_z())
+        flush_viewer(viewer)
+
+    def get_roi_mask():
+        viewer.get_roi_mask()
+
+    def threshold_overlay():
+        viewer.threshold_overlay(*next_threshold())
+        flush_viewer(viewer)
+
+    def movie_update():
+        # as the animation timer does: the slot, then blitting the artists it returns
+        viewer.movie_player._draw_next_frame(next_frame(), True)
+        flush_viewer(viewer)
+
+    return {'Compare.update_plots': update_plots,
+            'Compare.on_z_change': on_z_change,
+            'Compare.on_z_change.cold': on_z_change,
+            'Compare.get_roi_mask': get_roi_mask,
+            'Compare.get_roi_mask.cold': get_roi_mask,
+            'Compare.threshold_overlay': threshold_overlay,
+            'Compare.movie_update': movie_update,
+            'Compare.movie_update.cold': movie_update}
+
+
+def cold_setups(viewer):
+    # run before every call of the .cold benchmarks, so nothing is found in the caches
+    def clear_slices():
+        viewer.prefetcher.invalidate()
+        viewer.slice_cache.clear()
+        for image_figure in viewer.image_figures:
+            image_figure.pyramid.clear()
+
+    def clear_roi_masks():
+        for masks in viewer.roi_data.masks.values():
+            masks[:] = [None] * len(masks)
+
+    def clear_movie_frames():
+        viewer.movie_frame_renderer.invalidate()
+        viewer.movie_frame_cache.clear()
+
+    return {'Compare.on_z_change.cold': clear_slices,
+            'Compare.get_roi_mask.cold': clear_roi_masks,
+            'Compare.movie_update.cold': clear_movie_frames}
+
+
+def open_viewer(images, overlays):
+    viewer = vidi3d.compare3d(images, overlays=overlays, block=False)
+    viewer.show()
+    process_events()
+    return viewer
+
+
+def close_viewer(viewer):
+    viewer.close()
+    process_events()
+
+
+def draw_roi(viewer, shape):
+    # a square ROI in the middle of every slice
+    nx, ny, nz = shape[:3]
+    x0, x1, y0, y1 = nx / 4, 3 * nx / 4, ny / 4, 3 * ny / 4
+    for z in range(nz):
+        viewer.roi_data.start_new_lasso(x0, y0, z)
+        for x, y in ((x1, y0), (x1, y1), (x0, y1)):
+            viewer.roi_data.add_vertex(x, y, z)
+        viewer.roi_data.end_lasso(z)
+
+
+def start_movie_mode(viewer):
+    # every panel shows the movie, frames are stepped by the benchmark instead of the animation timer
+    for image_toolbar in viewer.image_toolbars:
+        image_toolbar.play_movie()
+    viewer.movie_player.event_source.stop()
+    viewer.movie_player.movie_paused = True
+    process_events()
+
+
+def run_case(size, num_images, dtype, args):
+    shape = (size, size, args.depth, args.frames)
+    images = make_images(num_images, shape, dtype)
+    overlays = [make_overlay(shape)] * num_images
+    results = []
+
+    def record(name, function, repeat=args.repeat, setup=None):
+        if not any(fnmatch.fnmatch(name, pattern) for pattern in args.only):
+            return
+        timing = measure(function, repeat, setup=setup)
+        params = {'size': size, 'num_images': num_images, 'dtype': np.dtype(dtype).name,
+                  'shape': list(shape)}
+        results.append(dict(name=name, params=params, id=benchmark_id(name, params), **timing))
+        print(f'{results[-1]["id"]:70s} {timing["median_ms"]:10.2f} ms')
+
+    for name, function in statistics_benchmarks(images).items():
+        record(name, function)
+
+    record('compare3d', lambda: close_viewer(open_viewer(images, overlays)), max(1, args.repeat // 3))
+
+    if not any(fnmatch.fnmatch(name, pattern) for name in VIEWER_BENCHMARKS for pattern in args.only):
+        return results
+    viewer = open_viewer(images, overlays)
+    try:
+        draw_roi(viewer, shape)
+        benchmarks = viewer_benchmarks(viewer, shape)
+        setups = cold_setups(viewer)
+        for name in VIEWER_BENCHMARKS:
+            if name not in MOVIE_BENCHMARKS:
+                record(name, benchmarks[name], setup=setups.get(name))
+        start_movie_mode(viewer)
+        for name in MOVIE_BENCHMARKS:
+            record(name, benchmarks[name], setup=setups.get(name))
+    finally:
+        close_viewer(viewer)
+    return results
+
+
+def benchmark_id(name, params):
+    return f'{name}[size={params["size"]},num_images={params["num_images"]},dtype={params["dtype"]}]'
+
+
+def environment():
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__,
+            'qt': QtCore.QT_VERSION_STR,
+            'qt_platform': QtWidgets.QApplication.platformName()}
+
+
+def find_regressions(results, baseline, tolerance):
+    baseline_times = {result['id']: result['median_ms'] for result in baseline['results']}
+    regressions = []
+    for result in results:
+        previous = baseline_times.get(result['id'])
+        if previous is not None and result['median_ms'] > previous * (1 + tolerance):
+            regressions.append((result['id'], previous, result['median_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 512])
+    parser.add_argument('--num-images', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--dtypes', nargs='+', default=['complex64', 'float32'])
+    parser.add_argument('--depth', type=int, default=16, help='number of slices')
+    parser.add_argument('--frames', type=int, default=8, help='number of time frames')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--only', nargs='+', default=['*'], help='glob patterns of the benchmark names to run')
+    parser.add_argument('--output', help='file to write the JSON results to')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='fraction a median may be slower than the baseline before it is reported')
+    args = parser.parse_args()
+
+    vidi3d.core.create_qapp()
+    results = []
+    for dtype in args.dtypes:
+        for size in args.sizes:
+            for num_images in args.num_images:
+                results.extend(run_case(size, num_images, np.dtype(dtype), args))
+
+    report = {'benchmark': 'hot_paths',
+              'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'environment': environment(),
+              'arguments': vars(args),
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for benchmark, previous, current in regressions:
+            print(f'regression: {benchmark} {previous:.2f} ms -> {current:.2f} ms')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
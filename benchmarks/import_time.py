@@ -0,0 +1,70 @@
+"""
+Benchmark of the cold import time of vidi3d.
+
+Each statement runs in a fresh interpreter, so nothing is cached in
+sys.modules, and the best of --repeat runs is reported together with whether
+Qt widgets and pyplot were loaded.  Pass --paths to time other checkouts of
+vidi3d too, e.g. a worktree of an earlier commit.
+
+    python benchmarks/import_time.py
+    git worktree add /tmp/vidi3d-old HEAD~1
+    python benchmarks/import_time.py --paths . /tmp/vidi3d-old --output import_time.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+STATEMENTS = (
+    'import vidi3d',
+    'from vidi3d import split_array',
+    'from vidi3d import open_volume',
+    'from vidi3d import export_slices',
+    'from vidi3d import compare3d',
+)
+HEAVY_MODULES = ('PyQt5.QtWidgets', 'matplotlib.pyplot')
+
+TIMER = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1e3, 'loaded': [module for module in {heavy_modules!r} if module in sys.modules]}}))
+"""
+
+
+def time_statement(statement, path):
+    # python -c puts the working directory first on sys.path, so it is run from path as well
+    path = os.path.abspath(path)
+    output = subprocess.run([sys.executable, '-c', TIMER.format(statement=statement, heavy_modules=HEAVY_MODULES)],
+                            env=dict(os.environ, PYTHONPATH=path), cwd=path,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--paths', nargs='+', default=[os.path.join(os.path.dirname(__file__), '..')],
+                        help='directories containing the vidi3d package to time')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='file to write the JSON results to')
+    args = parser.parse_args()
+
+    results = []
+    for path in args.paths:
+        print(os.path.abspath(path))
+        for statement in STATEMENTS:
+            runs = [time_statement(statement, path) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run['ms'])
+            results.append({'path': os.path.abspath(path), 'statement': statement, 'repeat': args.repeat,
+                            'min_ms': best['ms'], 'loaded': best['loaded']})
+            print(f'    {statement:40s} {best["ms"]:8.1f} ms  loaded: {", ".join(best["loaded"]) or "-"}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'import_time', 'python': sys.version, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
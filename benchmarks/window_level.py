@@ -0,0 +1,92 @@
+"""
+Benchmark of the default window/level estimate.
+
+Compares the previous implementation, which filtered the full array up to 25
+times per display type, against vidi3d.statistics.default_window_levels.
+
+    python benchmarks/window_level.py --shape 512 512 300
+"""
+import argparse
+import time
+
+import numpy as np
+
+from vidi3d import statistics
+
+
+def legacy_dynamic_range(img):
+    valid_values = img[np.logical_and(np.isfinite(img), np.abs(img).astype(bool))]
+    if valid_values.size == 0:
+        return 1
+    stdv = valid_values.std()
+    if stdv == 0:
+        return 1
+    return 3 * stdv
+
+
+def legacy_default_level(img, background_threshold=0.05):
+    valid_values = img[np.logical_and(np.isfinite(img), img.astype(bool))]
+    if valid_values.size == 0:
+        return 0
+    mean_prev = np.inf
+    mean = np.abs(valid_values).mean()
+    max_iter = 25
+    count = 0
+    while np.abs((mean_prev - mean) / mean) > 0.1 and count < max_iter:
+        valid_values = valid_values[np.abs(valid_values) > mean * background_threshold]
+        mean_prev = mean
+        mean = np.abs(valid_values).mean()
+        count += 1
+    return np.median(valid_values)
+
+
+def legacy_default_window_levels(complex_image, background_threshold=0.05):
+    windows = np.ones(4)
+    levels = np.zeros(4)
+    for display_type, values in ((0, complex_image.real), (1, complex_image.imag), (2, np.abs(complex_image))):
+        levels[display_type] = legacy_default_level(values, background_threshold)
+        windows[display_type] = legacy_dynamic_range(values)
+    levels[3] = 0.0
+    windows[3] = 2.0 * np.pi
+    return windows, levels
+
+
+def make_stack(shape, dtype):
+    rng = np.random.default_rng(0)
+    x, y = np.meshgrid(np.linspace(-1, 1, shape[0]), np.linspace(-1, 1, shape[1]), indexing='ij')
+    disk = (x ** 2 + y ** 2 < 0.6).astype(np.float32)
+    stack = np.empty(shape, dtype=dtype)
+    for z in range(shape[2]):
+        noise = rng.standard_normal(shape[:2], dtype=np.float32) * 0.05
+        stack[:, :, z] = (disk * (1 + 0.1 * z / shape[2]) + noise) * np.exp(1j * np.pi * x / 4)
+    return stack
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shape', type=int, nargs='+', default=[512, 512, 300])
+    parser.add_argument('--dtype', default='complex64')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    stack = make_stack(tuple(args.shape), np.dtype(args.dtype))
+    legacy_time, (legacy_windows, legacy_levels) = best_time(lambda: legacy_default_window_levels(stack), 1)
+    new_time, (windows, levels) = best_time(lambda: statistics.default_window_levels(stack), args.repeat)
+
+    print(f'shape {tuple(args.shape)} {args.dtype}')
+    print(f'legacy:  {legacy_time * 1e3:10.1f} ms  levels {np.round(legacy_levels, 4)} windows {np.round(legacy_windows, 4)}')
+    print(f'sampled: {new_time * 1e3:10.1f} ms  levels {np.round(levels, 4)} windows {np.round(windows, 4)}')
+    print(f'speedup: {legacy_time / new_time:.0f}x')
+
+
+if __name__ == '__main__':
+    main()
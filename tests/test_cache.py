@@ -0,0 +1,79 @@
+import numpy as np
+
+from vidi3d.cache import LRUCache
+
+
+def array(nbytes):
+    return np.zeros(nbytes, dtype=np.uint8)
+
+
+def test_get_missing_returns_default():
+    cache = LRUCache(100)
+    assert cache.get('a') is None
+    assert cache.get('a', 1) == 1
+    assert 'a' not in cache
+
+
+def test_evicts_least_recently_used_first():
+    cache = LRUCache(100)
+    for key in 'abc':
+        cache.put(key, array(30))
+    # reading a makes b the least recently used
+    cache.get('a')
+    cache.put('d', array(30))
+    assert 'b' not in cache
+    assert all(key in cache for key in 'acd')
+    cache.put('e', array(30))
+    assert 'c' not in cache
+    assert all(key in cache for key in 'ade')
+    assert cache.nbytes == 90
+
+
+def test_evicts_until_within_budget():
+    cache = LRUCache(100)
+    for key in 'abcd':
+        cache.put(key, array(25))
+    cache.put('e', array(60))
+    assert list(cache._entries) == ['d', 'e']
+    assert cache.nbytes == 85
+
+
+def test_value_larger_than_budget_is_not_stored():
+    cache = LRUCache(100)
+    cache.put('a', array(50))
+    cache.put('b', array(101))
+    assert 'b' not in cache
+    assert 'a' in cache
+    assert cache.nbytes == 50
+
+
+def test_replacing_a_key_updates_size_and_recency():
+    cache = LRUCache(100)
+    cache.put('a', array(40))
+    cache.put('b', array(40))
+    cache.put('a', array(10))
+    assert cache.nbytes == 50
+    assert len(cache) == 2
+    cache.put('c', array(60))
+    # a was put last, so b is evicted
+    assert 'b' not in cache
+    assert cache.get('a').nbytes == 10
+
+
+def test_size_of_tuples_and_other_values():
+    cache = LRUCache(100)
+    # display slices are cached with their dynamic range
+    cache.put('slice', (array(40), 1.5))
+    cache.put('nested', [array(10), (array(20), None)])
+    cache.put('scalar', 3)
+    assert cache.nbytes == 70
+    assert cache.get('scalar') == 3
+
+
+def test_clear():
+    cache = LRUCache(100)
+    cache.put('a', array(40))
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+    assert cache.get('a') is None
@@ -0,0 +1,84 @@
+import io
+import os
+import time
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from matplotlib.image import imread
+from PyQt5 import QtWidgets
+
+import vidi3d
+from vidi3d.definitions import ImageDisplayType
+
+
+def disk_volume():
+    x, y = np.meshgrid(np.linspace(-1, 1, 64), np.linspace(-1, 1, 48), indexing='ij')
+    disk = (x ** 2 + y ** 2 < 0.5) * (1 + 0.5 * x)
+    return np.repeat(disk[..., np.newaxis, np.newaxis], 2, axis=2).repeat(2, axis=3)
+
+
+def open_viewer(**kwargs):
+    viewer = vidi3d.compare3d([disk_volume()], block=False, **kwargs)
+    viewer.resize(900, 700)
+    viewer.show()
+    QtWidgets.QApplication.processEvents()
+    return viewer
+
+
+def saved_rgba(image_figure):
+    buf = io.BytesIO()
+    image_figure.fig.savefig(buf, format='png')
+    return imread(io.BytesIO(buf.getvalue()))
+
+
+@pytest.mark.parametrize('quantise', [False, True])
+def test_lut_engine_saves_the_slice(quantise):
+    expected = saved_rgba(open_viewer().image_figures[0])
+    viewer = open_viewer(render_engine='lut', quantise=quantise)
+    image_figure = viewer.image_figures[0]
+    if quantise:
+        start = time.time()
+        while image_figure.lut_renderer.codes is None and time.time() - start < 30:
+            QtWidgets.QApplication.processEvents()
+            time.sleep(0.01)
+        assert image_figure.lut_renderer.codes is not None
+    rgba = saved_rgba(image_figure)
+    assert rgba[..., 3].mean() == pytest.approx(1)
+    # same as the matplotlib engine, up to the quantisation of the values
+    assert np.abs(rgba - expected).max() <= (0.02 if quantise else 0)
+    # the artists are hidden again for painting
+    assert not image_figure.img.get_visible()
+    assert not image_figure.fig.patch.get_visible()
+    assert not image_figure.axes.patch.get_visible()
+    assert all(artist.get_animated() for artist in image_figure.cursor_artists)
+    viewer.close()
+
+
+def wait_for_codes(viewer, display_type):
+    start = time.time()
+    while (not all(display_type in volume.quantised for volume in viewer.complex_images)
+           and time.time() - start < 30):
+        QtWidgets.QApplication.processEvents()
+        time.sleep(0.01)
+    assert all(display_type in volume.quantised for volume in viewer.complex_images)
+
+
+@pytest.mark.parametrize('quantised_cache_mb, kept', [(1024, {ImageDisplayType.mag, ImageDisplayType.real}),
+                                                      (0, {ImageDisplayType.mag})])
+def test_quantised_volumes_are_kept_per_display_type(quantised_cache_mb, kept):
+    viewer = open_viewer(render_engine='lut', quantise=True, quantised_cache_mb=quantised_cache_mb)
+    volume = viewer.complex_images[0]
+    wait_for_codes(viewer, ImageDisplayType.mag)
+    viewer.change_display_type(ImageDisplayType.real)
+    wait_for_codes(viewer, ImageDisplayType.real)
+    viewer.change_display_type(ImageDisplayType.mag)
+    if quantised_cache_mb:
+        # shown again without quantising the volume again
+        assert ImageDisplayType.mag in volume.quantised
+    # the display type being shown is always kept, the others while they fit in the budget
+    wait_for_codes(viewer, ImageDisplayType.mag)
+    assert set(volume.quantised) == kept
+    viewer.close()
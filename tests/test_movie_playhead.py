@@ -0,0 +1,71 @@
+import itertools
+
+import pytest
+
+from vidi3d.compare.main import MoviePlayhead
+from vidi3d.definitions import MoviePlaybackMode
+
+
+def take(playhead, count):
+    return list(itertools.islice(playhead(), count))
+
+
+def test_forward_matches_previous_frames():
+    # the animation used to repeat frames=range(num_frames)
+    playhead = MoviePlayhead(5)
+    assert take(playhead, 12) == list(itertools.islice(itertools.cycle(range(5)), 12))
+
+
+def test_reverse_wraps_to_last_frame():
+    playhead = MoviePlayhead(4, MoviePlaybackMode.reverse)
+    assert take(playhead, 9) == [0, 3, 2, 1, 0, 3, 2, 1, 0]
+
+
+def test_ping_pong_does_not_repeat_end_frames():
+    playhead = MoviePlayhead(4, MoviePlaybackMode.ping_pong)
+    assert take(playhead, 10) == [0, 1, 2, 3, 2, 1, 0, 1, 2, 3]
+
+
+def test_ping_pong_keeps_reverse_direction():
+    playhead = MoviePlayhead(4, MoviePlaybackMode.reverse)
+    playhead.seek(2)
+    playhead.set_mode(MoviePlaybackMode.ping_pong)
+    assert take(playhead, 6) == [2, 1, 0, 1, 2, 3]
+
+
+@pytest.mark.parametrize('mode', [MoviePlaybackMode.forward, MoviePlaybackMode.reverse,
+                                  MoviePlaybackMode.ping_pong])
+def test_single_frame(mode):
+    playhead = MoviePlayhead(1, mode)
+    assert take(playhead, 3) == [0, 0, 0]
+    assert playhead.upcoming(4) == []
+
+
+def test_seek_and_mode_change_take_effect_on_next_frame():
+    playhead = MoviePlayhead(6)
+    frames = playhead()
+    assert [next(frames), next(frames)] == [0, 1]
+    playhead.seek(4)
+    playhead.set_mode(MoviePlaybackMode.reverse)
+    assert [next(frames), next(frames), next(frames)] == [3, 2, 1]
+
+
+def test_seek_is_clamped():
+    playhead = MoviePlayhead(6)
+    playhead.seek(10)
+    assert playhead.frame == 5
+    playhead.seek(-3)
+    assert playhead.frame == 0
+
+
+def test_upcoming_does_not_move_playhead():
+    playhead = MoviePlayhead(5, MoviePlaybackMode.ping_pong)
+    playhead.seek(3)
+    assert playhead.upcoming(3) == [4, 3, 2]
+    # at most every other frame is upcoming
+    assert playhead.upcoming(10) == [4, 3, 2, 1]
+    assert playhead.frame == 3
+    playhead.set_mode(MoviePlaybackMode.reverse)
+    assert playhead.upcoming(2) == [2, 1]
+    playhead.seek(0)
+    assert playhead.upcoming(2) == [4, 3]
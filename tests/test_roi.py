@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+from matplotlib import path
+
+from vidi3d.definitions import ImageDisplayType
+from vidi3d.helpers import apply_display_type
+from vidi3d.roi import rasterize_polygon, roi_mean_timecourse, roi_values
+from vidi3d.volume import Volume
+
+
+def previous_mask(verts, shape):
+    # Compare.get_roi_mask before rasterize_polygon, which tested every pixel centre
+    return path.Path(verts).contains_points(list(np.ndindex(shape))).reshape(shape)
+
+
+def full_mask(verts, shape):
+    (x_slice, y_slice), mask = rasterize_polygon(verts, shape)
+    full = np.zeros(shape, dtype=bool)
+    full[x_slice, y_slice] = mask
+    return full
+
+
+def lasso(verts):
+    # contours are closed by repeating the first vertex, see ROIData.end_lasso
+    return list(verts) + [verts[0]]
+
+
+POLYGONS = {
+    'square': lasso([(4.3, 5.1), (20.7, 5.1), (20.7, 17.9), (4.3, 17.9)]),
+    'integer_square': lasso([(4, 5), (20, 5), (20, 18), (4, 18)]),
+    'triangle': lasso([(1.5, 1.5), (30.2, 9.7), (8.1, 28.4)]),
+    'concave': lasso([(2, 2), (28, 2), (28, 28), (15.5, 10.5), (2, 28)]),
+    'self_intersecting': lasso([(3, 3), (27, 27), (27, 3), (3, 27)]),
+    'outside_bounds': lasso([(-10.5, -4.2), (40.3, 10.1), (12.2, 45.7)]),
+    'vertices_on_centres': lasso([(5, 5), (10, 10), (15, 5), (15, 20), (5, 20)]),
+    'unclosed': [(3.2, 4.1), (25.6, 6.3), (19.9, 24.8)],
+}
+
+
+@pytest.mark.parametrize('name', sorted(POLYGONS))
+def test_matches_contains_points(name):
+    shape = (32, 30)
+    verts = POLYGONS[name]
+    assert np.array_equal(full_mask(verts, shape), previous_mask(verts, shape))
+
+
+def test_random_polygons_match_contains_points():
+    rng = np.random.default_rng(0)
+    shape = (24, 20)
+    for _ in range(50):
+        num_verts = rng.integers(3, 12)
+        verts = rng.uniform(-4, 28, (num_verts, 2))
+        # half of the polygons have vertices on pixel centres
+        if rng.random() < 0.5:
+            verts = np.round(verts)
+        verts = lasso([tuple(vert) for vert in verts])
+        assert np.array_equal(full_mask(verts, shape), previous_mask(verts, shape))
+
+
+def test_mask_is_limited_to_bounding_box():
+    (x_slice, y_slice), mask = rasterize_polygon(POLYGONS['square'], (32, 30))
+    assert (x_slice, y_slice) == (slice(4, 22), slice(5, 19))
+    assert mask.shape == (18, 14)
+
+
+@pytest.mark.parametrize('verts', [
+    [],
+    [(3.0, 4.0)],
+    [(3.0, 4.0), (10.0, 12.0)],
+    lasso([(1.0, 1.0), (np.nan, 4.0), (6.0, 2.0)]),
+    # entirely outside the image
+    lasso([(40.0, 40.0), (50.0, 40.0), (45.0, 50.0)]),
+    lasso([(-9.0, -9.0), (-2.0, -9.0), (-5.0, -2.0)]),
+])
+def test_degenerate_polygons_are_empty(verts):
+    assert not full_mask(verts, (32, 30)).any()
+
+
+@pytest.mark.parametrize('verts', [
+    # collinear vertices have no area, pixel centres on upward edges are still inside
+    lasso([(2.0, 2.0), (8.0, 8.0), (14.0, 14.0)]),
+    lasso([(2.3, 2.1), (8.3, 8.1), (14.3, 14.1)]),
+    lasso([(2.0, 5.0), (20.0, 5.0), (11.0, 5.0)]),
+    lasso([(7.0, 2.0), (7.0, 20.0), (7.0, 11.0)]),
+])
+def test_zero_area_polygons_match_contains_points(verts):
+    shape = (32, 30)
+    assert np.array_equal(full_mask(verts, shape), previous_mask(verts, shape))
+
+
+def test_roi_data_mask_follows_contour_changes():
+    from vidi3d.compare.main import ROIData
+
+    shape = (32, 30, 3)
+    roi_data = ROIData()
+    roi_data.start_new_lasso(2.0, 2.0, 1)
+    for x, y in ((20.0, 3.0), (12.0, 25.0)):
+        roi_data.add_vertex(x, y, 1)
+    roi_data.end_lasso(1)
+    expected = np.zeros(shape, dtype=bool)
+    expected[..., 1] = previous_mask(roi_data.verts[1][0], shape[:2])
+    assert np.array_equal(roi_data.get_mask(shape), expected)
+    # the cached mask is used the second time
+    assert np.array_equal(roi_data.get_mask(shape), expected)
+
+    roi_data.start_new_lasso(25.0, 25.0, 1)
+    for x, y in ((30.0, 25.0), (30.0, 29.0)):
+        roi_data.add_vertex(x, y, 1)
+    roi_data.end_lasso(1)
+    expected[..., 1] |= previous_mask(roi_data.verts[1][1], shape[:2])
+    assert np.array_equal(roi_data.get_mask(shape), expected)
+
+    roi_data.delete_last_lasso(1)
+    expected[..., 1] = previous_mask(roi_data.verts[1][0], shape[:2])
+    assert np.array_equal(roi_data.get_mask(shape), expected)
+    roi_data.clear()
+    assert not roi_data.get_mask(shape).any()
+
+
+def roi_volume():
+    rng = np.random.default_rng(3)
+    shape = (12, 10, 4, 7)
+    volume = (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(np.complex64)
+    mask = rng.random(shape[:3]) < 0.3
+    return volume, mask
+
+
+@pytest.mark.parametrize('display_type', range(4))
+@pytest.mark.parametrize('chunk_bytes', [2 ** 30, 1])
+def test_roi_mean_timecourse_matches_previous(display_type, chunk_bytes):
+    volume, mask = roi_volume()
+    # plot_roi_avg_timeseries before roi_mean_timecourse transformed the whole volume
+    expected = apply_display_type(volume, display_type)[mask].mean(axis=0)
+    timecourse = roi_mean_timecourse(Volume(volume), mask, display_type, chunk_bytes=chunk_bytes)
+    assert np.allclose(timecourse, expected, rtol=1e-5)
+
+
+def test_roi_values_match_previous():
+    volume, mask = roi_volume()
+    for t in (0, 6):
+        expected = apply_display_type(volume, ImageDisplayType.mag)[..., t][mask]
+        assert np.array_equal(roi_values(volume, mask, ImageDisplayType.mag, t), expected)
@@ -0,0 +1,188 @@
+import threading
+
+import numpy as np
+import pytest
+
+from vidi3d import statistics
+from vidi3d.definitions import ImageDisplayType
+
+
+def previous_default_level(img, background_threshold=0.05):
+    # MplImage.default_level before vidi3d.statistics, which removed background values from copies
+    valid_values = img[np.logical_and(np.isfinite(img), img.astype(bool))]
+    if valid_values.size == 0:
+        return 0
+    mean_prev = np.inf
+    mean = np.abs(valid_values).mean()
+    max_iter = 25
+    count = 0
+    while np.abs((mean_prev - mean) / mean) > 0.1 and count < max_iter:
+        valid_values = valid_values[np.abs(valid_values) > mean * background_threshold]
+        mean_prev = mean
+        mean = np.abs(valid_values).mean()
+        count += 1
+    return np.median(valid_values)
+
+
+def previous_dynamic_range(img):
+    valid_values = img[np.logical_and(np.isfinite(img), np.abs(img).astype(bool))]
+    if valid_values.size == 0:
+        return 1
+    stdv = valid_values.std()
+    if stdv == 0:
+        return 1
+    return 3 * stdv
+
+
+def images():
+    rng = np.random.default_rng(0)
+    x, y = np.meshgrid(np.linspace(-1, 1, 64), np.linspace(-1, 1, 64), indexing='ij')
+    disk = (x ** 2 + y ** 2 < 0.5) * 100.0
+    yield disk + rng.standard_normal(disk.shape)
+    yield rng.standard_normal((50, 70))
+    yield rng.exponential(size=(33, 31)) * 1e-6
+    # many equal values
+    yield rng.integers(-3, 4, (40, 40)).astype(float)
+    yield np.where(rng.random((32, 32)) < 0.2, np.nan, rng.random((32, 32)))
+    yield np.full((8, 8), 5.0)
+    yield np.array([[1.0]])
+
+
+@pytest.mark.parametrize('img', list(images()))
+def test_default_level_matches_previous(img):
+    sample = statistics.strided_sample(img)
+    assert sample.size == img.size
+    assert statistics.default_level(img) == pytest.approx(previous_default_level(img))
+    assert statistics.default_level(img, 0.5) == pytest.approx(previous_default_level(img, 0.5))
+
+
+@pytest.mark.parametrize('img', list(images()))
+def test_dynamic_range_matches_previous(img):
+    assert statistics.dynamic_range(img) == pytest.approx(previous_dynamic_range(img))
+
+
+@pytest.mark.parametrize('img', [np.zeros((0,)), np.zeros((16, 16)), np.full((16, 16), np.nan),
+                                 np.full((4, 4), np.inf)])
+def test_no_valid_values(img):
+    assert statistics.default_level(img) == 0
+    assert statistics.dynamic_range(img) == 1
+
+
+def test_default_level_of_valid_median_of_kept_tails():
+    # the background values around zero are removed, the median is taken of the two tails
+    values = np.array([-10.0, -9.0, 0.01, -0.01, 0.02, 11.0, 12.0, 13.0])
+    assert statistics.default_level_of_valid(values) == pytest.approx(11.0)
+    assert statistics.default_level_of_valid(np.zeros(0)) == 0
+
+
+def test_strided_sample_is_bounded_and_spread():
+    data = np.arange(512 * 512).reshape(512, 512)
+    sample = statistics.strided_sample(data, 1000)
+    assert sample.size <= 1000
+    assert sample.min() == 0
+    assert sample.max() > data.size * 0.9
+
+
+def test_default_window_levels_match_each_display_type():
+    rng = np.random.default_rng(1)
+    complex_image = (rng.standard_normal((48, 48)) + 1j * rng.standard_normal((48, 48))) * 10
+    complex_image[:4] = np.nan
+    windows, levels = statistics.default_window_levels(complex_image)
+    for display_type, values in ((ImageDisplayType.real, np.real(complex_image)),
+                                 (ImageDisplayType.imag, np.imag(complex_image)),
+                                 (ImageDisplayType.mag, np.abs(complex_image))):
+        assert levels[display_type] == pytest.approx(previous_default_level(values))
+        assert windows[display_type] == pytest.approx(previous_dynamic_range(values))
+    assert levels[ImageDisplayType.phase] == 0
+    assert windows[ImageDisplayType.phase] == pytest.approx(2 * np.pi)
+
+
+def test_default_window_levels_all_nan():
+    windows, levels = statistics.default_window_levels(np.full((8, 8), np.nan, dtype=complex))
+    assert np.all(levels[:3] == 0)
+    assert np.all(windows[:3] == 1)
+
+
+def display_values(volume, display_type):
+    values = {ImageDisplayType.real: np.real, ImageDisplayType.imag: np.imag,
+              ImageDisplayType.mag: np.abs, ImageDisplayType.phase: np.angle}[display_type](volume)
+    if display_type in (ImageDisplayType.mag, ImageDisplayType.phase):
+        return values[np.isfinite(volume) & (volume != 0)]
+    return values[np.isfinite(values) & (values != 0)]
+
+
+@pytest.mark.parametrize('chunk_bytes', [2 ** 30, 4 * 16 * 16 * 8])
+def test_compute_volume_statistics_exact_moments(chunk_bytes):
+    rng = np.random.default_rng(2)
+    volume = (rng.standard_normal((16, 16, 5, 3)) + 1j * rng.standard_normal((16, 16, 5, 3))).astype(np.complex64)
+    volume[:4] = 0
+    volume[0, 0, 0, 0] = np.nan
+    volume_statistics = statistics.compute_volume_statistics(volume, chunk_bytes=chunk_bytes)
+    for display_type in range(4):
+        values = display_values(volume, display_type).astype(np.float64)
+        assert volume_statistics.count[display_type] == values.size
+        assert volume_statistics.mean[display_type] == pytest.approx(values.mean(), abs=1e-6)
+        assert volume_statistics.std[display_type] == pytest.approx(values.std(), rel=1e-5)
+        assert volume_statistics.min[display_type] == values.min()
+        assert volume_statistics.max[display_type] == values.max()
+        counts, edges = volume_statistics.histograms[display_type]
+        assert counts.sum() == values.size
+    mag = display_values(volume, ImageDisplayType.mag)
+    assert volume_statistics.levels[ImageDisplayType.mag] == pytest.approx(previous_default_level(mag))
+    assert volume_statistics.windows[ImageDisplayType.mag] == pytest.approx(previous_dynamic_range(mag), rel=1e-5)
+    assert volume_statistics.levels[ImageDisplayType.phase] == 0
+
+
+def test_compute_volume_statistics_all_nan():
+    volume = np.full((8, 8, 2, 2), np.nan, dtype=np.float32)
+    volume_statistics = statistics.compute_volume_statistics(volume)
+    assert np.all(volume_statistics.count == 0)
+    assert np.all(volume_statistics.mean == 0)
+    assert np.all(volume_statistics.std == 0)
+    assert np.all(volume_statistics.levels == 0)
+    assert np.all(volume_statistics.windows[:3] == 1)
+    assert np.all(volume_statistics.dynamic_range == 1)
+    assert np.all(volume_statistics.histograms[ImageDisplayType.mag][0] == 0)
+
+
+def test_compute_volume_statistics_cancelled():
+    cancel_event = threading.Event()
+    cancel_event.set()
+    volume = np.ones((8, 8, 2, 2))
+    assert statistics.compute_volume_statistics(volume, cancel_event=cancel_event) is None
+
+
+def test_scan_finite_range_matches_finite_values():
+    rng = np.random.default_rng(4)
+    first = rng.standard_normal((40, 30, 6)).astype(np.float32) * 50
+    first[3, 4] = np.inf
+    first[5, :, 2] = -np.inf
+    first[7] = np.nan
+    second = rng.standard_normal((20, 30, 6)) + 120
+    ranks = (1, 50, 99)
+    for chunk_bytes in (2 ** 30, 30 * 6 * 4):
+        minimum, maximum, percentiles = statistics.scan_finite_range([first, None, second], ranks,
+                                                                     chunk_bytes=chunk_bytes, max_workers=2)
+        values = np.concatenate([first[np.isfinite(first)], second.ravel()])
+        assert minimum == values.min()
+        assert maximum == values.max()
+        # every value is in the sample when the arrays are small
+        assert np.allclose(percentiles, np.percentile(values, ranks))
+
+
+def test_scan_finite_range_no_finite_values():
+    minimum, maximum, percentiles = statistics.scan_finite_range([np.full((4, 4), np.nan),
+                                                                  np.array([np.inf, -np.inf])], (5, 95))
+    assert np.isnan(minimum) and np.isnan(maximum)
+    assert percentiles.shape == (2,) and np.all(np.isnan(percentiles))
+    minimum, maximum, percentiles = statistics.scan_finite_range([None, np.zeros((0, 3))])
+    assert np.isnan(minimum) and np.isnan(maximum)
+
+
+def test_scan_finite_range_scalar_and_memmap(tmp_path):
+    data = np.arange(24, dtype=np.float64).reshape(4, 6)
+    fname = tmp_path / 'data.npy'
+    np.save(fname, data)
+    minimum, maximum, _ = statistics.scan_finite_range([np.load(fname, mmap_mode='r'), np.float64(-2)],
+                                                       chunk_bytes=6 * 8)
+    assert (minimum, maximum) == (-2, 23)
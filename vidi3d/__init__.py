@@ -1,2 +1,41 @@
-from vidi3d.viewers import compare2d, compare3d, imshow3d
-from vidi3d.core import split_array, close, pause
+"""
+The viewers and helpers are imported when they are first used, so importing
+vidi3d does not load Qt or matplotlib until a viewer or renderer needs them.
+"""
+import importlib
+
+# module each public name is imported from
+_lazy_attributes = {
+    'compare2d': 'viewers',
+    'compare3d': 'viewers',
+    'imshow3d': 'viewers',
+    'split_array': 'core',
+    'close': 'core',
+    'pause': 'core',
+    'Volume': 'volume',
+    'open_volume': 'volume',
+    'SliceExport': 'export',
+    'all_slices': 'export',
+    'export_montage': 'export',
+    'export_slices': 'export',
+}
+_submodules = ('cache', 'compare', 'coordinates', 'core', 'definitions', 'export', 'helpers', 'image', 'imshow',
+               'navigation', 'plot', 'prefetch', 'profiling', 'pyramid', 'remote', 'render', 'roi', 'scheduler',
+               'signals', 'statistics', 'viewers', 'volume')
+
+__all__ = list(_lazy_attributes)
+
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        value = getattr(importlib.import_module('.' + _lazy_attributes[name], __name__), name)
+    elif name in _submodules:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes) | set(_submodules))
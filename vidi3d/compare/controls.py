@@ -7,7 +7,7 @@ from PyQt5 import QtCore
 from PyQt5 import QtWidgets
 from copy import deepcopy
 
-from ..definitions import ImageDisplayType
+from ..definitions import ImageDisplayType, MoviePlaybackMode
 from ..signals import Signals
 
 
@@ -197,9 +197,25 @@ class CompareControlWidget(Signals, QtWidgets.QWidget):
         frame_control_layout.addWidget(label, 0, 0)
         frame_control_layout.addWidget(self.movie_frame_spinbox, 0, 1)
         frame_control_layout.addWidget(self.movie_goto_frame_button, 0, 2)
+        self.movie_playback_mode = QtWidgets.QComboBox()
+        self.movie_playback_mode.addItem("Forward")
+        self.movie_playback_mode.addItem("Reverse")
+        self.movie_playback_mode.addItem("Ping-pong")
+        self.combo_index_to_playback_mode = {0: MoviePlaybackMode.forward,
+                                             1: MoviePlaybackMode.reverse,
+                                             2: MoviePlaybackMode.ping_pong}
+        frame_control_layout.addWidget(self.movie_playback_mode, 0, 3)
+        self.movie_export_button = QtWidgets.QPushButton("Export")
+        frame_control_layout.addWidget(self.movie_export_button, 0, 4)
+
+        # timeline, dragging the slider scrubs through the frames
+        self.movie_timeline_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.movie_timeline_slider.setMinimum(0)
+        self.movie_timeline_slider.setMaximum(img_shape[-1] - 1)
 
         movie_layout.addLayout(interval_layout)
         movie_layout.addLayout(frame_control_layout)
+        movie_layout.addWidget(self.movie_timeline_slider)
 
         movie_widget = QtWidgets.QGroupBox()
         movie_widget.setTitle('Movie Control')
@@ -432,6 +448,9 @@ class CompareControlWidget(Signals, QtWidgets.QWidget):
         self.movie_interval_spinbox.valueChanged.connect(self.movie_interval_spinbox_changed)
         self.movie_goto_frame_button.clicked.connect(self.movie_goto_frame)
         self.movie_pause_button.clicked.connect(self.movie_pause)
+        self.movie_export_button.clicked.connect(self.movie_export)
+        self.movie_timeline_slider.valueChanged.connect(self.movie_timeline_slider_changed)
+        self.movie_playback_mode.currentIndexChanged.connect(self.movie_playback_mode_changed)
 
     def quiet_set_value(self, control, value):
         control.blockSignals(True)
@@ -585,5 +604,18 @@ class CompareControlWidget(Signals, QtWidgets.QWidget):
         frame = self.movie_frame_spinbox.value()
         self.sig_movie_goto_frame.emit(frame)
 
+    def movie_timeline_slider_changed(self, frame):
+        self.sig_movie_goto_frame.emit(frame)
+
+    def movie_playback_mode_changed(self, index):
+        self.sig_movie_playback_mode_change.emit(self.combo_index_to_playback_mode[index])
+
+    def change_movie_frame(self, frame):
+        # follow the playhead without emitting a seek
+        self.quiet_set_value(self.movie_timeline_slider, frame)
+
     def movie_pause(self):
         self.sig_movie_pause.emit()
+
+    def movie_export(self):
+        self.sig_movie_export.emit()
@@ -2,23 +2,43 @@
 Sets up the main window for the compare viewer. Creates MplImage, MplPlot, 
 and ControlWidget objects and connects their Qt Signals to local functions.
 """
+import time
+from collections import deque
+
 import matplotlib.pyplot as plt
 import numpy as np
 from PyQt5 import QtCore, QtWidgets
-from matplotlib import path
 from matplotlib.animation import FuncAnimation
 
 from . import controls
-from .. import core
+from .. import core, profiling
+from ..cache import LRUCache
 from ..coordinates import XYZTCoord, XYZCoord
-from ..definitions import ImageDisplayType, PlotColours
-from ..helpers import apply_display_type
+from ..definitions import ImageDisplayType, MoviePlaybackMode, PlotColours
+from ..export import movie_frames, overlay_blend_weights
 from ..image import MplImage
 from ..navigation import NavigationToolbar
 from ..plot import MplPlot
-
-
+from ..prefetch import MovieExportWorker, MovieFrameRenderer, SlicePrefetcher, StatisticsWorker
+from ..render import ColourLUT
+from ..roi import rasterize_polygon, roi_mean_timecourse, roi_values
+from ..scheduler import UpdateScheduler
+from ..statistics import scan_finite_range
+from ..volume import Volume, as_volume, gather_profiles
+
+
+@profiling.instrument('change_display_type', 'change_location', 'on_z_change', 'on_t_change', 'update_plot_lock',
+                      'change_window_level', 'set_window_level_to_default', 'set_volume_statistics', 'clear_roi',
+                      'delete_last_roi', 'plot_roi_avg_timeseries', 'plot_roi_psc_timeseries',
+                      'plot_roi_1vol_histogram', 'initialize_roi', 'destruct_roi', 'start_new_roi', 'update_roi',
+                      'end_roi', 'cancel_roi', 'threshold_overlay', 'set_overlay_alpha', 'movie_update',
+                      'initialize_movie', 'destruct_movie', 'change_movie_interval', 'pause_movie', 'movie_goto_frame',
+                      'set_movie_playback_mode', 'export_movie', 'show_movie_export_progress',
+                      'movie_export_finished', 'set_quantised_volume')
 class Compare(QtWidgets.QMainWindow):
+    # volumes larger than this have their statistics computed in a background thread
+    background_statistics_nbytes = 256 * 2 ** 20
+
     def __init__(self,
                  complex_images,
                  background_threshold=0.05,
@@ -31,8 +51,16 @@ class Compare(QtWidgets.QMainWindow):
                  cmaps=[None, ],
                  overlays=[None, ],
                  overlay_cmaps=[None, ],
-                 mmb_callback=None
+                 mmb_callback=None,
+                 slice_cache_mb=256,
+                 prefetch_depth=2,
+                 movie_cache_mb=256,
+                 volume_statistics=False,
+                 render_engine='matplotlib',
+                 quantise=False,
+                 quantised_cache_mb=1024,
                  ):
+        core.create_qapp()
         super().__init__()
         self.setWindowTitle('Vidi3d: compare')
         self.viewer_number = 0
@@ -44,16 +72,16 @@ class Compare(QtWidgets.QMainWindow):
                 out_list = singleton * list_len
             return out_list
 
-        self.complex_images = complex_images
+        self.complex_images = [as_volume(img) for img in complex_images]
         cmaps = broadcast_singleton(cmaps, complex_images)
 
         self.overlays = broadcast_singleton(overlays, complex_images)
         enable_overlay = not all(v is None for v in overlays)
         overlay_range = [0, 0]
         if enable_overlay:
-            mins = [np.ma.masked_invalid(overlay).min() for overlay in self.overlays if overlay is not None]
-            maxs = [np.ma.masked_invalid(overlay).max() for overlay in self.overlays if overlay is not None]
-            overlay_range = [np.min(mins), np.max(maxs)]
+            overlay_min, overlay_max, _ = scan_finite_range(self.overlays)
+            if overlay_min <= overlay_max:
+                overlay_range = [overlay_min, overlay_max]
         overlay_cmaps = broadcast_singleton(overlay_cmaps, self.overlays)
 
         # a few image parameters
@@ -66,6 +94,43 @@ class Compare(QtWidgets.QMainWindow):
         # initial cursor_loc
         self.loc = XYZTCoord(img_shape, int(img_shape[0] / 2), int(img_shape[1] / 2), int(img_shape[2] / 2), 0)
 
+        # display data of slices already viewed, shared by all image panels
+        self.slice_cache = LRUCache(slice_cache_mb * 2 ** 20)
+        self.prefetcher = SlicePrefetcher(self.complex_images, self.slice_cache, depth=prefetch_depth)
+
+        # colour-mapped movie frames, rendered ahead of the playhead so looping playback only blits
+        self.movie_frame_cache = LRUCache(movie_cache_mb * 2 ** 20)
+        self.movie_frame_renderer = MovieFrameRenderer(self.complex_images, self.movie_frame_cache)
+        self.movie_export_worker = MovieExportWorker()
+        # codes of quantised volumes are kept for the display types shown most recently, see set_quantised_volume
+        self.quantised_cache_bytes = quantised_cache_mb * 2 ** 20
+        self.quantised_display_types = []
+        self.movie_export_worker.sig_movie_export_progress.connect(self.show_movie_export_progress)
+        self.movie_export_worker.sig_movie_export_finished.connect(self.movie_export_finished)
+
+        # cursor and window/level changes from mouse motion are applied at most once per display frame
+        self.update_scheduler = UpdateScheduler(self)
+
+        # statistics of each whole volume give default window/levels that don't change from slice to slice
+        # large volumes are read in a background thread and the defaults are applied when they are ready
+        self.window_level_modified = False
+        self.background_threshold = background_threshold
+        self.use_volume_statistics = volume_statistics or quantise
+        self.statistics_worker = StatisticsWorker()
+        self.statistics_worker.sig_volume_statistics_ready.connect(self.set_volume_statistics)
+        self.statistics_worker.sig_volume_quantised.connect(self.set_quantised_volume)
+        if quantise:
+            # quantised volumes are drawn by the LUT engine, see quantise_volumes
+            render_engine = 'lut'
+        if self.use_volume_statistics:
+            for indx, volume in enumerate(self.complex_images):
+                if volume.statistics is not None:
+                    continue
+                if volume.nbytes <= self.background_statistics_nbytes:
+                    volume.compute_statistics(background_threshold)
+                elif not quantise:
+                    self.statistics_worker.compute(indx, volume, background_threshold)
+
         # ensure each image has a title
         if type(subplot_titles) is list and len(subplot_titles) != 1 and len(subplot_titles) != num_images:
             subplot_titles = None
@@ -106,6 +171,11 @@ class Compare(QtWidgets.QMainWindow):
                               overlay=overlay,
                               overlay_cmap=overlay_cmaps[indx],
                               mmb_callback=mmb_callback,
+                              slice_cache=self.slice_cache,
+                              slice_key=(indx, self.loc.z, self.loc.t),
+                              volume_statistics=self.complex_images[indx].statistics,
+                              render_engine=render_engine,
+                              quantised_volume=self.complex_images[indx] if quantise else None,
                               ))
             self.image_toolbars.append(NavigationToolbar(self.image_figures[indx], self.image_figures[indx], indx))
             # give MplImageSlice a new attribute NavigationToolbar
@@ -139,27 +209,23 @@ class Compare(QtWidgets.QMainWindow):
         # Set up Movie
         num_frames = self.complex_images[0].shape[-1]
         init_interval = self.control_widget.movie_interval_spinbox.value()
+        # the playhead is the frame source of the animation, seeking moves it without walking a frame iterator
+        self.movie_playhead = MoviePlayhead(num_frames)
         self.movie_player = FuncAnimationCustom(self.image_figures[0].fig,
                                                 self.movie_update,
-                                                frames=range(num_frames),
+                                                frames=self.movie_playhead,
                                                 interval=init_interval,
                                                 blit=True,
                                                 repeat_delay=0,
+                                                cache_frame_data=False,
                                                 )
         self.current_movie_frame = 0
 
         # Set up plots
         self.plots_panel_widget = QtWidgets.QWidget(self)
         self.plots = []
-        x_plot_data = []
-        y_plot_data = []
-        z_plot_data = []
-        t_plot_data = []
-        for img in self.complex_images:
-            x_plot_data.append(img[:, self.loc.y, self.loc.z, self.loc.t])
-            y_plot_data.append(img[self.loc.x, :, self.loc.z, self.loc.t])
-            z_plot_data.append(img[self.loc.x, self.loc.y, :, self.loc.t])
-            t_plot_data.append(img[self.loc.x, self.loc.y, self.loc.z, :])
+        x_plot_data, y_plot_data, z_plot_data, t_plot_data = gather_profiles(
+            self.complex_images, self.loc.x, self.loc.y, self.loc.z, self.loc.t)
         self.xplot = MplPlot(complex_data=x_plot_data,
                              title=location_labels[0],
                              display_type=display_type,
@@ -214,6 +280,7 @@ class Compare(QtWidgets.QMainWindow):
         # self.statusBar().showMessage('Ready')
 
 
+        self.quantise_volumes(display_type)
         self.make_connections()
 
         self.show()
@@ -238,15 +305,19 @@ class Compare(QtWidgets.QMainWindow):
         self.control_widget.sig_roi_1vol_histogram.connect(self.plot_roi_1vol_histogram)
         self.control_widget.sig_movie_interval_change.connect(self.change_movie_interval)
         self.control_widget.sig_movie_pause.connect(self.pause_movie)
-        self.control_widget.sig_movie_goto_frame.connect(self.movie_goto_frame)
-        self.control_widget.sig_overlay_lower_thresh_change.connect(self.threshold_overlay)
-        self.control_widget.sig_overlay_upper_thresh_change.connect(self.threshold_overlay)
+        self.control_widget.sig_movie_goto_frame.connect(self.update_scheduler.coalesced(self.movie_goto_frame))
+        self.control_widget.sig_movie_playback_mode_change.connect(self.set_movie_playback_mode)
+        self.control_widget.sig_movie_export.connect(self.export_movie)
+        # dragging a threshold slider thresholds and draws each overlay at most once per display frame
+        threshold_overlay = self.update_scheduler.coalesced(self.threshold_overlay)
+        self.control_widget.sig_overlay_lower_thresh_change.connect(threshold_overlay)
+        self.control_widget.sig_overlay_upper_thresh_change.connect(threshold_overlay)
         self.control_widget.sig_overlay_alpha_change.connect(self.set_overlay_alpha)
 
         # Connect signals from imagePanel
         for image_figure in self.image_figures:
-            image_figure.sig_cursor_change.connect(self.change_location)
-            image_figure.sig_window_level_change.connect(self.change_window_level)
+            image_figure.sig_cursor_change.connect(self.update_scheduler.coalesced(self.change_location))
+            image_figure.sig_window_level_change.connect(self.update_scheduler.coalesced(self.change_window_level))
             image_figure.sig_z_change.connect(self.on_z_change)
 
         # Connect signals from imagePanel toolbars
@@ -255,7 +326,8 @@ class Compare(QtWidgets.QMainWindow):
             image_toolbar.signal_roi_destruct.connect(self.destruct_roi)
             image_toolbar.sig_roi_start.connect(self.start_new_roi)
             image_toolbar.sig_roi_change.connect(self.update_roi)
-            image_toolbar.sig_roi_end.connect(self.end_roi)
+            # end_roi does not use the release position
+            image_toolbar.sig_roi_end.connect(lambda x, y: self.end_roi())
             image_toolbar.sig_roi_cancel.connect(self.cancel_roi)
             image_toolbar.sig_movie_init.connect(self.initialize_movie)
             image_toolbar.sig_movie_destruct.connect(self.destruct_movie)
@@ -263,6 +335,63 @@ class Compare(QtWidgets.QMainWindow):
     def set_viewer_number(self, number):
         self.viewer_number = number
 
+    # changes made by scripts, e.g. through a vidi3d.remote viewer
+    def set_location(self, x=None, y=None, z=None, t=None):
+        """
+        Move the cursor.  Coordinates left as None keep their current value.
+        """
+        if x is not None or y is not None:
+            self.change_location(self.loc.x if x is None else x, self.loc.y if y is None else y)
+        if z is not None:
+            self.on_z_change(z)
+        if t is not None:
+            self.control_widget.tcontrol.setValue(t)
+            self.on_t_change(t)
+
+    def set_image(self, indx, image):
+        """
+        Show image in panel indx.  It must have the same number of values as
+        the image it replaces, which it is reshaped to.
+        """
+        if not isinstance(image, Volume):
+            image = np.reshape(image, self.complex_images[indx].shape)
+        image = as_volume(image)
+        if image.shape != self.complex_images[indx].shape:
+            raise ValueError(f'image shape {image.shape} does not match {self.complex_images[indx].shape}')
+        self.complex_images[indx] = image
+        if self.image_figures[indx].quantised_volume is not None:
+            self.image_figures[indx].quantised_volume = image
+        self.refresh()
+
+    def refresh(self):
+        """
+        Redraw the images, plots and overlays after their data was changed in
+        place.  The window/levels are kept unless they are the defaults, which
+        follow the statistics of the changed volumes.
+        """
+        self.slice_cache.clear()
+        self.movie_frame_cache.clear()
+        self.prefetcher.invalidate()
+        self.movie_frame_renderer.invalidate()
+        self.statistics_worker.invalidate()
+        for indx, volume in enumerate(self.complex_images):
+            recompute_statistics = self.use_volume_statistics or volume.statistics is not None
+            volume.statistics = None
+            volume.quantised.clear()
+            self.image_figures[indx].set_volume_statistics(None)
+            if recompute_statistics:
+                self.compute_volume_statistics(indx)
+        self.quantise_volumes(self.image_figures[0].display_type)
+        for indx, image_figure in enumerate(self.image_figures):
+            image_figure.set_complex_image(self.complex_images[indx][:, :, self.loc.z, self.loc.t],
+                                           (indx, self.loc.z, self.loc.t))
+            image_figure.set_mpl_img()
+            self.update_overlay(indx)
+            image_figure.blit_image_and_lines()
+        self.update_plots()
+        self.update_display_values()
+        self.redraw_paused_movie_frame()
+
     # todo: slot naming convention?
     # slots dealing with image appearance
     def change_display_type(self, display_type):
@@ -274,6 +403,8 @@ class Compare(QtWidgets.QMainWindow):
 
         for image_figure in self.image_figures:
             image_figure.show_display_type_change(display_type)
+        self.quantise_volumes(display_type)
+        self.prefetcher.prefetch(self.loc.z, self.loc.t, display_type)
 
     def keyPressEvent(self, event):
         key = event.key()
@@ -288,14 +419,72 @@ class Compare(QtWidgets.QMainWindow):
         event.ignore()
 
     def change_window_level(self, new_window, new_level):
+        self.window_level_modified = True
         self.control_widget.change_window_level(new_window, new_level)
         for image_figure in self.image_figures:
             image_figure.show_window_level_change(new_window, new_level)
+        self.redraw_paused_movie_frame()
 
     def set_window_level_to_default(self):
+        self.window_level_modified = False
         self.control_widget.change_window_level(0, 0)
         for image_figure in self.image_figures:
             image_figure.show_set_window_level_to_default()
+        self.redraw_paused_movie_frame()
+
+    def compute_volume_statistics(self, indx):
+        volume = self.complex_images[indx]
+        if volume.nbytes <= self.background_statistics_nbytes:
+            self.set_volume_statistics(indx, volume.compute_statistics(self.background_threshold))
+        elif self.image_figures[indx].quantised_volume is None:
+            self.statistics_worker.compute(indx, volume, self.background_threshold)
+        # otherwise the statistics are computed in the background before the volume is quantised
+
+    def quantise_volumes(self, display_type):
+        # codes are computed in the background, until they are ready the slices are display transformed
+        if display_type in self.quantised_display_types:
+            self.quantised_display_types.remove(display_type)
+        self.quantised_display_types.append(display_type)
+        for indx, image_figure in enumerate(self.image_figures):
+            volume = self.complex_images[indx]
+            if image_figure.quantised_volume is not None and display_type not in volume.quantised:
+                self.statistics_worker.quantise(indx, volume, display_type, self.background_threshold)
+
+    def set_quantised_volume(self, indx, quantised):
+        if quantised.display_type not in self.quantised_display_types:
+            # evicted while it was being quantised
+            return
+        self.complex_images[indx].quantised[quantised.display_type] = quantised
+        self.evict_quantised_volumes()
+        image_figure = self.image_figures[indx]
+        if image_figure.display_type == quantised.display_type:
+            image_figure.set_mpl_img()
+            image_figure.blit_image_and_lines()
+            self.redraw_paused_movie_frame()
+
+    def evict_quantised_volumes(self):
+        """
+        Drop the codes of the display types shown least recently until the codes
+        of all volumes fit in quantised_cache_mb.  The codes of the display type
+        being shown are always kept, the others are quantised again if they are
+        shown again.
+        """
+        shown = self.image_figures[0].display_type
+        for display_type in list(self.quantised_display_types):
+            nbytes = sum(quantised.nbytes for volume in self.complex_images for quantised in volume.quantised.values())
+            if nbytes <= self.quantised_cache_bytes:
+                return
+            if display_type == shown:
+                continue
+            self.quantised_display_types.remove(display_type)
+            for volume in self.complex_images:
+                volume.quantised.pop(display_type, None)
+
+    def set_volume_statistics(self, indx, volume_statistics):
+        self.complex_images[indx].statistics = volume_statistics
+        self.image_figures[indx].set_volume_statistics(volume_statistics)
+        if not self.window_level_modified:
+            self.image_figures[indx].show_set_window_level_to_default()
 
     # slots dealing with a cursor_loc change
     def change_location(self, x, y):
@@ -342,32 +531,29 @@ class Compare(QtWidgets.QMainWindow):
 
         for image_figure in self.image_figures:
             image_figure.cursor_loc.z = newz
-        for indx in range(len(self.image_figures)):
-            self.image_figures[indx].show_complex_image_change(self.complex_images[indx][:, :, self.loc.z, self.loc.t])
-            self.threshold_overlay(self.control_widget.lower_thresh_spinbox.value(),
-                                   self.control_widget.upper_thresh_spinbox.value())
+        for indx, image_figure in enumerate(self.image_figures):
+            image_figure.set_complex_image(self.complex_images[indx][:, :, self.loc.z, self.loc.t],
+                                           (indx, self.loc.z, self.loc.t))
+            image_figure.set_mpl_img()
+            self.update_overlay(indx)
+            image_figure.blit_image_and_lines()
         self.update_plots()
         self.update_display_values()
+        self.prefetcher.prefetch(self.loc.z, self.loc.t, self.image_figures[0].display_type)
 
     def on_t_change(self, value):
         self.loc.t = value
         for indx in range(len(self.image_figures)):
             self.image_figures[indx].show_complex_image_change(
-                self.complex_images[indx][:, :, self.loc.z, self.loc.t])
+                self.complex_images[indx][:, :, self.loc.z, self.loc.t], (indx, self.loc.z, self.loc.t))
         self.update_plots()
         self.update_display_values()
+        self.prefetcher.prefetch(self.loc.z, self.loc.t, self.image_figures[0].display_type)
 
     def update_plots(self):
-        x_plot_data = []
-        y_plot_data = []
-        z_plot_data = []
-        t_plot_data = []
-        for img in self.complex_images:
-            x_plot_data.append(img[:, self.loc.y, self.loc.z, self.loc.t])
-            y_plot_data.append(img[self.loc.x, :, self.loc.z, self.loc.t])
-            z_plot_data.append(img[self.loc.x, self.loc.y, :, self.loc.t])
-            t_plot_data.append(img[self.loc.x, self.loc.y, self.loc.z, :])
-
+        with profiling.stage('gather_profiles'):
+            x_plot_data, y_plot_data, z_plot_data, t_plot_data = gather_profiles(
+                self.complex_images, self.loc.x, self.loc.y, self.loc.z, self.loc.t)
         self.xplot.show_complex_data_and_markers_change(x_plot_data, self.loc.x)
         self.yplot.show_complex_data_and_markers_change(y_plot_data, self.loc.y)
         self.zplot.show_complex_data_and_markers_change(z_plot_data, self.loc.z)
@@ -384,7 +570,9 @@ class Compare(QtWidgets.QMainWindow):
     def initialize_roi(self, img_index):
         self.control_widget.roi_analysis_widget.setEnabled(True)
         if self.image_toolbars[img_index].canvas.receivers(self.image_toolbars[img_index].canvas.sig_cursor_change) > 0:
-            self.image_toolbars[img_index].canvas.sig_cursor_change.disconnect(self.change_location)
+            self.image_toolbars[img_index].canvas.sig_cursor_change.disconnect(
+                self.update_scheduler.coalesced(self.change_location))
+            self.update_scheduler.discard(self.change_location)
 
     def destruct_roi(self, img_index):
         at_least_one_active = False
@@ -393,11 +581,12 @@ class Compare(QtWidgets.QMainWindow):
                 at_least_one_active = True
         if not at_least_one_active:
             self.control_widget.roi_analysis_widget.setEnabled(False)
-        self.image_toolbars[img_index].canvas.sig_cursor_change.connect(self.change_location)
+        self.image_toolbars[img_index].canvas.sig_cursor_change.connect(
+            self.update_scheduler.coalesced(self.change_location))
 
     def update_roi(self, x, y):
+        self.roi_data.add_vertex(x, y, self.loc.z)
         curr_roi_verts = self.roi_data.verts[self.loc.z][-1]
-        curr_roi_verts.append((x, y))
         for image_toolbar in self.image_toolbars:
             currentLine = image_toolbar.roi_lines.mpl_line_objects[self.loc.z][-1]
             currentLine.set_data(zip(*curr_roi_verts))
@@ -408,6 +597,7 @@ class Compare(QtWidgets.QMainWindow):
             # do we need to draw all these lines?
             for currentLine in image_toolbar.roi_lines.mpl_line_objects[self.loc.z]:
                 image_toolbar.ax.draw_artist(currentLine)
+            image_toolbar.canvas.invalidate_cursor_background()
             image_toolbar.canvas.blit(image_toolbar.ax.bbox)
 
     def start_new_roi(self, x, y):
@@ -420,8 +610,8 @@ class Compare(QtWidgets.QMainWindow):
                 currentline.set_visible(False)
 
     def end_roi(self):
+        self.roi_data.end_lasso(self.loc.z)
         curr_roi_verts = self.roi_data.verts[self.loc.z][-1]
-        curr_roi_verts.append(curr_roi_verts[0])
         for image_toolbar in self.image_toolbars:
             curr_line = image_toolbar.roi_lines.mpl_line_objects[self.loc.z][-1]
             curr_line.set_data(zip(*curr_roi_verts))
@@ -433,17 +623,10 @@ class Compare(QtWidgets.QMainWindow):
             curr_line.remove()
             if image_toolbar.mode.name=='ROI':
                 image_toolbar.canvas.draw()
-        self.roi_data.verts[self.loc.z].pop()
+        self.roi_data.delete_last_lasso(self.loc.z)
 
     def get_roi_mask(self):
-        mask = np.zeros(self.complex_images[0].shape[:-1], dtype='bool')
-        for z in self.roi_data.verts:
-            for contour in self.roi_data.verts[z]:
-                mypath = path.Path(contour)
-                tmp = mypath.contains_points(list(np.ndindex(self.complex_images[0].shape[:2])))
-                tmp = tmp.reshape(self.complex_images[0].shape[:2])
-                mask[..., z] = np.logical_or(mask[..., z], tmp)
-        return mask
+        return self.roi_data.get_mask(self.complex_images[0].shape[:-1])
 
     def plot_roi_avg_timeseries(self):
         mask = self.get_roi_mask()
@@ -453,9 +636,7 @@ class Compare(QtWidgets.QMainWindow):
         for index in range(len(self.image_toolbars)):
             image_toolbar = self.image_toolbars[index]
             if image_toolbar.mode.name=='ROI':
-                data = self.complex_images[index]
-                data = apply_display_type(data, display_type)
-                avgTimeseries = data[mask].mean(axis=0)
+                avgTimeseries = roi_mean_timecourse(self.complex_images[index], mask, display_type)
                 if fig == None:
                     fig = plt.figure()
                 plt.plot(avgTimeseries, self.colours[index], label=self.subplot_titles[index])
@@ -474,9 +655,7 @@ class Compare(QtWidgets.QMainWindow):
         for index in range(len(self.image_toolbars)):
             image_toolbar = self.image_toolbars[index]
             if image_toolbar.mode.name=='ROI':
-                data = self.complex_images[index]
-                data = apply_display_type(data, display_type)
-                psc_timeseries = data[mask].mean(axis=0)
+                psc_timeseries = roi_mean_timecourse(self.complex_images[index], mask, display_type)
                 psc_timeseries = psc_timeseries + np.finfo(float).eps
                 psc_timeseries = (psc_timeseries - psc_timeseries[0]) / psc_timeseries[0] * 100
                 if fig == None:
@@ -500,9 +679,7 @@ class Compare(QtWidgets.QMainWindow):
         for index in range(len(self.image_toolbars)):
             image_toolbar = self.image_toolbars[index]
             if image_toolbar.mode.name=='ROI':
-                data = self.complex_images[index]
-                data = apply_display_type(data, display_type)
-                data_list.append(data[..., self.loc.t][mask])
+                data_list.append(roi_values(self.complex_images[index], mask, display_type, self.loc.t))
                 color_list.append(self.colours[index])
                 label_list.append(self.subplot_titles[index])
                 # y,binEdges,_=plt.hist(data[...,self.cursor_loc.t][mask],bins=num_bins,color=self.colours[index], alpha=0.04)
@@ -518,7 +695,7 @@ class Compare(QtWidgets.QMainWindow):
         plt.show()
 
     def clear_roi(self):
-        self.roi_data.verts = {}
+        self.roi_data.clear()
         z = self.loc.z
         for image_toolbar in self.image_toolbars:
             if image_toolbar.mode.name=='ROI':
@@ -532,7 +709,7 @@ class Compare(QtWidgets.QMainWindow):
 
     def delete_last_roi(self):
         z = self.loc.z
-        self.roi_data.verts[z].pop()
+        self.roi_data.delete_last_lasso(z)
         for image_toolbar in self.image_toolbars:
             if image_toolbar.mode.name=='ROI':
                 if z in image_toolbar.roi_lines.mpl_line_objects:
@@ -547,38 +724,63 @@ class Compare(QtWidgets.QMainWindow):
     def threshold_overlay(self, lower_thresh, upper_thresh):
         for indx in range(len(self.image_figures)):
             if self.overlays[indx] is not None:
-                overlay = self.overlays[indx][:, :, self.loc.z]
-                lower_thresh_mask = overlay >= lower_thresh
-                upper_thresh_mask = overlay <= upper_thresh
-                mask = (lower_thresh_mask * upper_thresh_mask).astype('bool')
-                if self.control_widget.overlay_invert_checkbox.isChecked():
-                    mask = np.invert(mask)
-                thresholded = np.ma.masked_where(mask, overlay)
-                self.image_figures[indx].set_overlay(thresholded)
+                self.update_overlay(indx, lower_thresh, upper_thresh)
                 self.image_figures[indx].blit_image_and_lines()
 
+    def update_overlay(self, indx, lower_thresh=None, upper_thresh=None):
+        # threshold the overlay of the current slice without drawing, thresholds default to the control values
+        if self.overlays[indx] is None:
+            return
+        if lower_thresh is None:
+            lower_thresh = self.control_widget.lower_thresh_spinbox.value()
+        if upper_thresh is None:
+            upper_thresh = self.control_widget.upper_thresh_spinbox.value()
+        self.image_figures[indx].set_thresholded_overlay(self.overlays[indx][:, :, self.loc.z],
+                                                         lower_thresh,
+                                                         upper_thresh,
+                                                         self.control_widget.overlay_invert_checkbox.isChecked())
+
     def set_overlay_alpha(self, value):
         for indx in range(len(self.image_figures)):
             if self.overlays[indx] is not None:
                 self.image_figures[indx].overlay.set_alpha(value)
+                self.image_figures[indx].invalidate_cursor_background()
                 self.image_figures[indx].blit_image_and_lines()
 
     # slots for movie tool
     def movie_update(self, frame):
         z = self.loc.z
         self.current_movie_frame = frame
-        display_type = self.image_figures[0].display_type
+        self.movie_playhead.seek(frame)
+        self.control_widget.change_movie_frame(frame)
+        upcoming_frames = self.movie_playhead.upcoming(self.movie_frame_renderer.depth)
         artists_to_update = []
         for indx in range(len(self.image_toolbars)):
             image_toolbar = self.image_toolbars[indx]
             if image_toolbar.mode.name == "MOVIE":
-                new_data = apply_display_type(self.complex_images[indx][..., z, frame].T, display_type)
-                image_toolbar.movieText.set_text("frame: " + str(frame))
-                self.image_figures[indx].img.set_data(new_data)
+                image_figure = self.image_figures[indx]
+                complex_image = self.complex_images[indx][..., z, frame]
+                # the cursor value follows the frame shown
+                image_figure.set_complex_image(complex_image, (indx, z, frame))
+                rgba_key = image_figure.get_rgba_key()
+                rgba = self.movie_frame_cache.get((indx, z, frame) + rgba_key)
+                if rgba is None:
+                    rgba = image_figure.get_rgba_frame(complex_image, (indx, z, frame))
+                    self.movie_frame_cache.put((indx, z, frame) + rgba_key, rgba)
+                self.movie_frame_renderer.prefetch(indx, z, upcoming_frames, rgba_key, image_figure.img.get_cmap())
+                image_toolbar.movieText.set_text("frame: {}  {:.1f} fps  dropped: {}".format(
+                    frame, self.movie_player.stats.fps, self.movie_player.stats.frames_dropped))
+                image_figure.set_img_data(rgba)
                 artists_to_update.append(image_toolbar.movieText)
                 artists_to_update.append(self.image_figures[indx].img)
         return artists_to_update
 
+    def redraw_paused_movie_frame(self):
+        # movie frames are colour-mapped when they are drawn, so a paused frame is stale after a window/level change
+        if self.movie_player.movie_paused and any(image_toolbar.mode.name == 'MOVIE'
+                                                  for image_toolbar in self.image_toolbars):
+            self.movie_player._draw_next_frame(self.current_movie_frame, True)
+
     def initialize_movie(self, img_index):
         num_active = 0
         for image_toolbar in self.image_toolbars:
@@ -588,12 +790,16 @@ class Compare(QtWidgets.QMainWindow):
             self.control_widget.movie_widget.setEnabled(True)
             self.control_widget.movie_pause_button.setChecked(False)
             self.movie_player.movie_paused = False
+            self.movie_player.stats.reset()
+            self.movie_player.restart_clock()
             if not self.movie_player.movie_paused:
                 self.movie_player.event_source.start()
 
         if self.image_toolbars[img_index].canvas.receivers(
                 self.image_toolbars[img_index].canvas.sig_cursor_change) > 0:
-            self.image_toolbars[img_index].canvas.sig_cursor_change.disconnect(self.change_location)
+            self.image_toolbars[img_index].canvas.sig_cursor_change.disconnect(
+                self.update_scheduler.coalesced(self.change_location))
+            self.update_scheduler.discard(self.change_location)
         if self.overlays[img_index] is not None:
             self.image_figures[img_index].overlay.set_visible(False)
         self.movie_player._draw_next_frame(self.current_movie_frame, True)
@@ -607,31 +813,104 @@ class Compare(QtWidgets.QMainWindow):
             self.control_widget.movie_widget.setEnabled(False)
             self.movie_player.event_source.stop()
             self.movie_player.movie_paused = True
-        self.image_toolbars[img_index].canvas.sig_cursor_change.connect(self.change_location)
+        self.image_toolbars[img_index].canvas.sig_cursor_change.connect(
+            self.update_scheduler.coalesced(self.change_location))
         if self.overlays[img_index] is not None:
             self.image_figures[img_index].overlay.set_visible(True)
         self.image_figures[img_index].show_complex_image_change(
-            self.complex_images[img_index][:, :, self.loc.z, self.loc.t])
+            self.complex_images[img_index][:, :, self.loc.z, self.loc.t], (img_index, self.loc.z, self.loc.t))
 
     def change_movie_interval(self, interval):
         self.movie_player._interval = interval
+        self.movie_player.event_source.interval = interval
+        self.movie_player.restart_clock()
 
     def pause_movie(self):
         self.movie_player.movie_paused = self.control_widget.movie_pause_button.isChecked()
         if self.movie_player.movie_paused:
             self.movie_player.event_source.stop()
         else:
+            self.movie_player.restart_clock()
             self.movie_player.event_source.start()
 
+    @property
+    def movie_stats(self):
+        # MoviePlaybackStats of the movie tool
+        return self.movie_player.stats
+
     def movie_goto_frame(self, frame):
-        new_frame_seq = self.movie_player.new_frame_seq()
-        for i in range(frame):
-            next(new_frame_seq)
-        self.movie_player.frame_seq = new_frame_seq
-        self.movie_player._draw_next_frame(frame, True)
+        self.movie_playhead.seek(frame)
+        self.movie_player._draw_next_frame(self.movie_playhead.frame, True)
+
+    def set_movie_playback_mode(self, mode):
+        self.movie_playhead.set_mode(mode)
+
+    def export_movie(self, fname=None, fps=None):
+        """
+        Export the movie of the panels in movie mode, or of every panel if none
+        is, at the current z with their current display type, window/level,
+        colormap and overlay.  Frames are rendered on a worker thread and
+        encoded in another process, see export.MovieWriter.
+        """
+        if fname is None:
+            fname, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Export movie', '',
+                                                             'GIF (*.gif);;Video (*.mp4 *.avi *.mkv);;'
+                                                             'PNG sequence (*.png)')
+            if not fname:
+                return
+        if fps is None:
+            fps = 1000.0 / self.movie_player._interval
+        panels = [indx for indx, image_toolbar in enumerate(self.image_toolbars) if image_toolbar.mode.name == "MOVIE"]
+        if not panels:
+            panels = list(range(len(self.image_figures)))
+
+        luts = []
+        overlay_weights = []
+        for indx in panels:
+            image_figure = self.image_figures[indx]
+            luts.append(ColourLUT(image_figure.img.get_cmap(), *image_figure.img.get_clim()))
+            weights = None
+            if self.overlays[indx] is not None and image_figure.overlay.get_visible():
+                overlay = np.asarray(self.overlays[indx][:, :, self.loc.z])
+                threshold = (self.control_widget.lower_thresh_spinbox.value(),
+                             self.control_widget.upper_thresh_spinbox.value(),
+                             self.control_widget.overlay_invert_checkbox.isChecked())
+                weights = overlay_blend_weights(overlay, image_figure.overlay_lut(overlay.T),
+                                                image_figure.overlay.get_alpha(), threshold)
+            overlay_weights.append(weights)
+
+        frames = list(range(self.complex_images[0].shape[-1]))
+        if self.movie_playhead.mode == MoviePlaybackMode.reverse:
+            frames.reverse()
+        elif self.movie_playhead.mode == MoviePlaybackMode.ping_pong:
+            frames = frames + frames[-2:0:-1]
+        frame_iterator = movie_frames([self.complex_images[indx] for indx in panels],
+                                      self.loc.z,
+                                      luts,
+                                      [self.image_figures[indx].display_type for indx in panels],
+                                      overlay_weights,
+                                      frames,
+                                      self.image_figures[0].img.origin)
+        self.control_widget.movie_export_button.setEnabled(False)
+        self.movie_export_worker.export(fname, frame_iterator, len(frames), fps)
+
+    def show_movie_export_progress(self, frame, num_frames):
+        self.statusBar().showMessage(f'Exporting movie: frame {frame} of {num_frames}')
+
+    def movie_export_finished(self, fname, error):
+        self.control_widget.movie_export_button.setEnabled(True)
+        if error is None:
+            self.statusBar().showMessage(f'Movie exported to {fname}', 5000)
+        else:
+            self.statusBar().showMessage(f'Movie export failed: {error}')
 
     def closeEvent(self, event):
         self.movie_player.event_source.stop()
+        self.update_scheduler.clear()
+        self.prefetcher.shutdown()
+        self.movie_frame_renderer.shutdown()
+        self.statistics_worker.shutdown()
+        self.movie_export_worker.shutdown()
         if self.viewer_number:
             del core._open_viewers[self.viewer_number]
         event.accept()
@@ -641,12 +920,92 @@ class Compare(QtWidgets.QMainWindow):
 class ROIData():
     def __init__(self):
         self.verts = {}
+        # rasterised mask of each contour, None until it is needed or after the contour changes
+        self.masks = {}
 
     def start_new_lasso(self, x, y, z):
         if z in self.verts:
             self.verts[z].append([(x, y), ])
         else:
             self.verts[z] = [[(x, y), ], ]
+        self.masks.setdefault(z, []).append(None)
+
+    def add_vertex(self, x, y, z):
+        self.verts[z][-1].append((x, y))
+        self.masks[z][-1] = None
+
+    def end_lasso(self, z):
+        curr_roi_verts = self.verts[z][-1]
+        curr_roi_verts.append(curr_roi_verts[0])
+        self.masks[z][-1] = None
+
+    def delete_last_lasso(self, z):
+        self.verts[z].pop()
+        self.masks[z].pop()
+
+    def clear(self):
+        self.verts = {}
+        self.masks = {}
+
+    def get_mask(self, shape):
+        mask = np.zeros(shape, dtype='bool')
+        for z in self.verts:
+            for indx, contour in enumerate(self.verts[z]):
+                if self.masks[z][indx] is None:
+                    self.masks[z][indx] = rasterize_polygon(contour, shape[:2])
+                (x_slice, y_slice), contour_mask = self.masks[z][indx]
+                mask[x_slice, y_slice, z] |= contour_mask
+        return mask
+
+
+class MoviePlayhead:
+    """
+    Frame source for the movie.  Calling the playhead returns a generator of
+    frame indices for FuncAnimation.  The generator reads the current frame
+    each time, so seek and set_mode take effect on the next frame without
+    rebuilding the generator.
+    """
+
+    def __init__(self, num_frames, mode=MoviePlaybackMode.forward):
+        self.num_frames = num_frames
+        self.frame = 0
+        self.mode = mode
+        self.step = 1
+        self.set_mode(mode)
+
+    def __call__(self):
+        while True:
+            yield self.frame
+            self.frame, self.step = self.next_frame(self.frame, self.step)
+
+    def seek(self, frame):
+        self.frame = int(min(max(frame, 0), self.num_frames - 1))
+
+    def set_mode(self, mode):
+        self.mode = mode
+        if mode == MoviePlaybackMode.forward:
+            self.step = 1
+        elif mode == MoviePlaybackMode.reverse:
+            self.step = -1
+
+    def next_frame(self, frame, step):
+        if self.num_frames == 1:
+            return 0, step
+        if self.mode == MoviePlaybackMode.ping_pong:
+            # reverse direction at either end without repeating the end frame
+            if not 0 <= frame + step < self.num_frames:
+                step = -step
+            return frame + step, step
+        return (frame + step) % self.num_frames, step
+
+    def upcoming(self, count):
+        # frames that will be played after the current one
+        frames = []
+        frame, step = self.frame, self.step
+        for _ in range(min(count, self.num_frames - 1)):
+            frame, step = self.next_frame(frame, step)
+            frames.append(frame)
+        return frames
 
 
 class MplImageSlice(MplImage):
@@ -657,10 +1016,78 @@ class MplImageSlice(MplImage):
             self.sig_z_change.emit(self.cursor_loc.z - 1)
 
 
+class MoviePlaybackStats:
+    """
+    Measured movie playback: frames shown and dropped, time spent rendering
+    each frame and the frame rate achieved over the last frames shown.
+    """
+
+    def __init__(self, window=60):
+        self.frame_times = deque(maxlen=window)
+        self.render_times = deque(maxlen=window)
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+
+    def reset(self):
+        self.frame_times.clear()
+        self.render_times.clear()
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+
+    def record(self, frame_time, render_time, dropped):
+        self.frame_times.append(frame_time)
+        self.render_times.append(render_time)
+        self.frames_rendered += 1
+        self.frames_dropped += dropped
+
+    @property
+    def fps(self):
+        if len(self.frame_times) < 2 or self.frame_times[-1] == self.frame_times[0]:
+            return 0.0
+        return (len(self.frame_times) - 1) / (self.frame_times[-1] - self.frame_times[0])
+
+    @property
+    def mean_render_ms(self):
+        if not self.render_times:
+            return 0.0
+        return 1000 * sum(self.render_times) / len(self.render_times)
+
+    def summary(self):
+        return {'fps': self.fps,
+                'mean_render_ms': self.mean_render_ms,
+                'frames_rendered': self.frames_rendered,
+                'frames_dropped': self.frames_dropped}
+
+
 class FuncAnimationCustom(FuncAnimation):
     def __init__(self, *args, **keywords):
         FuncAnimation.__init__(self, *args, **keywords)
         self.movie_paused = True
+        self.stats = MoviePlaybackStats()
+        # wall clock time the next frame is due, None until playback (re)starts
+        self.next_frame_time = None
+
+    def restart_clock(self):
+        self.next_frame_time = None
+        self.stats.frame_times.clear()
+
+    def _step(self, *args):
+        # keep to the wall clock: frames that are already overdue are skipped instead of drawn late
+        start = time.perf_counter()
+        interval = self._interval / 1000.0
+        if self.next_frame_time is None:
+            self.next_frame_time = start
+        dropped = max(0, int((start - self.next_frame_time) // interval)) if interval > 0 else 0
+        for _ in range(dropped):
+            next(self.frame_seq)
+        self.next_frame_time += (dropped + 1) * interval
+        still_going = FuncAnimation._step(self, *args)
+        now = time.perf_counter()
+        self.stats.record(start, now - start, dropped)
+        # the timer fires when the next frame is due rather than a full interval after this one was drawn
+        if self.event_source is not None:
+            self.event_source.interval = max(1, int(1000 * (self.next_frame_time - now)))
+        return still_going
 
     def _start(self, *args):
         '''
@@ -676,7 +1103,9 @@ class FuncAnimationCustom(FuncAnimation):
 
         # Add our callback for stepping the animation and
         # actually start the event_source.
-        self.event_source.add_callback(self._step)
+        # newer matplotlib versions add the callback in __init__, adding it twice steps two frames per tick
+        if not any(callback[0] == self._step for callback in self.event_source.callbacks):
+            self.event_source.add_callback(self._step)
         # AK: ADDED A CHECK FOR MOVIE PAUSE
         if not self.movie_paused:
             self.event_source.start()
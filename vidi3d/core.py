@@ -1,21 +1,39 @@
 """
 Core functions for setting up the viewers.  Creating the qApp event loop and 
-a global dictionary of viewer objects.
+a global dictionary of viewer objects.  Qt and pyplot are imported when the
+first viewer is created, so split_array can be used without loading them.
 """
-import matplotlib.pyplot as plt
 import numpy as np
-from PyQt5 import QtWidgets, QtCore
-
-# Only one qApp can exist at a time, so check before creating one.
-app = QtWidgets.QApplication.instance()
-if not app:
-    app = QtWidgets.QApplication([" "])
-    app.quitOnLastWindowClosed()
 
+# the qApp, kept here so that it is not garbage collected
+app = None
 _open_viewers = {}
 
 
+def create_qapp():
+    """
+    Return the qApp, creating it the first time a viewer needs it.  It is not
+    created on import so that vidi3d can be used without a display, e.g. by
+    vidi3d.export.  Pyplot is switched to interactive mode at the same time, so
+    figures opened from the viewers do not block their event loop.
+    """
+    import matplotlib.pyplot as plt
+    from PyQt5 import QtWidgets
+
+    global app
+    plt.ion()
+    # Only one qApp can exist at a time, so check before creating one.
+    app = QtWidgets.QApplication.instance()
+    if not app:
+        app = QtWidgets.QApplication([" "])
+        app.quitOnLastWindowClosed()
+    return app
+
+
 def start_viewer(viewer, block, window_title=None):
+    import matplotlib.pyplot as plt
+    from PyQt5 import QtWidgets
+
     if block:
         if window_title is not None:
             viewer.setWindowTitle(window_title)
@@ -70,6 +88,9 @@ def pause(length_ms):
     Viewers will be updated and displayed, and the GUI event loop will run during the pause.
     """
 
+    from PyQt5 import QtCore
+
+    create_qapp()
     loop = QtCore.QEventLoop()
     timer = QtCore.QTimer()
     timer.singleShot(length_ms, loop.quit)
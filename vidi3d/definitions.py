@@ -9,6 +9,10 @@ class ImageDisplayType:
     real, imag, mag, phase = range(4)
 
 
+class MoviePlaybackMode:
+    forward, reverse, ping_pong = range(3)
+
+
 class PlotColours:
     # kelly's 22 colors of maximum contrast without black or white
     colours = ['#F3C300', '#875692', '#F38400', '#A1CAF1',
@@ -0,0 +1,430 @@
+"""
+Headless rendering of slices to PNG files, lightbox montages and movies.
+Slices are colour-mapped the same way the viewers show them, but without Qt: no
+qApp or window is created, so exports can run on machines without a display,
+e.g. to generate QA reports.  Rendering and PNG encoding are spread over a
+process pool, and movie frames are piped to an encoder in another process.
+Slices are read as they are handed to the pool, a few per worker at a time, so
+exporting a whole volume mapped from disk does not read it all into memory.
+"""
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import warnings
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib as mpl
+import numpy as np
+from matplotlib.image import imsave
+
+from . import statistics
+from .definitions import ImageDisplayType
+from .helpers import apply_display_type
+from .render import ColourLUT
+from .volume import Volume
+
+# one slice to render, window and level default to the values the viewers use for the slice
+# overlay is an array shaped like the image without its t dimension, as in compare3d
+SliceExport = namedtuple('SliceExport', 'image z t display_type window level overlay')
+SliceExport.__new__.__defaults__ = (0, 0, ImageDisplayType.mag, None, None, None)
+
+
+def all_slices(images, t=0, display_type=ImageDisplayType.mag, window=None, level=None, overlays=None):
+    """
+    SliceExport of every z slice at time t of every image, image by image.
+    """
+    if overlays is None:
+        overlays = [None] * len(images)
+    exports = []
+    for image, overlay in zip(images, overlays):
+        for z in range(image_shape(image)[2]):
+            exports.append(SliceExport(image, z, t, display_type, window, level, overlay))
+    return exports
+
+
+def image_shape(image):
+    # (x, y, z, t) shape of an image, missing dimensions have size 1
+    shape = tuple(image.shape)
+    return shape + (1,) * (4 - len(shape))
+
+
+def get_slice(data, z, t):
+    data = data.data if isinstance(data, Volume) else data
+    data = np.asanyarray(data)
+    while data.ndim < 4:
+        data = data[..., np.newaxis]
+    return np.asarray(data[:, :, z, t])
+
+
+def get_overlay_slice(overlay, z):
+    overlay = np.asanyarray(overlay)
+    while overlay.ndim < 3:
+        overlay = overlay[..., np.newaxis]
+    return np.asarray(overlay[:, :, z])
+
+
+def colour_map(values, cmap, vmin, vmax):
+    cmap = mpl.colormaps[cmap] if isinstance(cmap, str) else cmap
+    return cmap(mpl.colors.Normalize(vmin, vmax)(np.ma.masked_invalid(values)), bytes=True)
+
+
+def render_slice(complex_slice, display_type=ImageDisplayType.mag, window=None, level=None, cmap=None,
+                 overlay=None, overlay_cmap=None, overlay_alpha=0.3, overlay_threshold=None, origin='lower'):
+    """
+    Render an (x, y) slice to a uint8 RGBA image in the orientation the viewers
+    show it: x along the columns and, for origin 'lower', y increasing upwards.
+
+    overlay_threshold is (lower, upper, invert) as set in the compare viewer's
+    overlay thresholding controls.  Overlay values between lower and upper are
+    hidden, or only those values are shown if invert is True.
+    """
+    if display_type == ImageDisplayType.phase:
+        cmap = mpl.cm.hsv
+        window, level = 2 * np.pi, 0.0
+    elif window is None or level is None:
+        windows, levels = statistics.default_window_levels(complex_slice)
+        window = windows[display_type] if window is None else window
+        level = levels[display_type] if level is None else level
+    cmap = cmap if cmap is not None else mpl.cm.Greys_r
+    intensity = apply_display_type(complex_slice, display_type)
+    rgba = opaque(colour_map(intensity.T, cmap, level - 0.5 * window, level + 0.5 * window))
+
+    if overlay is not None:
+        overlay_level = statistics.default_level(overlay)
+        half_window = statistics.dynamic_range(overlay) / 2.0
+        overlay_rgba = colour_map(overlay.T, overlay_cmap if overlay_cmap is not None else mpl.cm.Reds,
+                                  overlay_level - half_window, overlay_level + half_window)
+        blend_overlay(rgba, overlay_blend_weights(overlay, overlay_rgba, overlay_alpha, overlay_threshold))
+
+    if origin == 'lower':
+        rgba = rgba[::-1]
+    return np.ascontiguousarray(rgba)
+
+
+def opaque(rgba):
+    # NaNs are transparent, the viewers show the black axes background through them
+    rgba[rgba[..., 3] == 0] = (0, 0, 0, 255)
+    return rgba
+
+
+def overlay_blend_weights(overlay, overlay_rgba, overlay_alpha=0.3, overlay_threshold=None):
+    """
+    Overlay colour weighted by its alpha, and the weight of the image under it,
+    for an (x, y) overlay slice and its transposed colour-mapped image.  The
+    weights can be reused to blend the same overlay into many frames.
+    """
+    alpha = overlay_rgba[..., 3:] * (overlay_alpha / 255.0)
+    if overlay_threshold is not None:
+        lower, upper, invert = overlay_threshold
+        overlay = overlay.T
+        shown = (overlay >= lower) & (overlay <= upper)
+        alpha *= (shown if invert else ~shown)[..., np.newaxis]
+    return overlay_rgba[..., :3] * alpha, 1 - alpha
+
+
+def blend_overlay(rgba, weights):
+    colour, image_weight = weights
+    rgba[..., :3] = np.rint(rgba[..., :3] * image_weight + colour)
+    return rgba
+
+
+def render_png(args):
+    # runs in a worker process, the slices are read by the parent and sent with the arguments
+    complex_slice, overlay, export, options, fname = args
+    rgba = render_slice(complex_slice, export.display_type, export.window, export.level, overlay=overlay, **options)
+    imsave(fname, rgba, format='png')
+    return fname
+
+
+def render_tile(args):
+    complex_slice, overlay, export, options = args
+    return render_slice(complex_slice, export.display_type, export.window, export.level, overlay=overlay, **options)
+
+
+def iter_render_args(exports):
+    # slices are read in the parent so that volumes mapped from disk are not pickled
+    for export in exports:
+        overlay = get_overlay_slice(export.overlay, export.z) if export.overlay is not None else None
+        yield get_slice(export.image, export.z, export.t), overlay, export._replace(image=None, overlay=None)
+
+
+def map_renders(function, args, max_workers, renders_per_worker=2):
+    """
+    Yield function(arg) for each of args, in order.  args is only advanced
+    while fewer than renders_per_worker renders per worker are in flight.
+    """
+    if max_workers == 0:
+        yield from map(function, args)
+        return
+    max_workers = max_workers if max_workers is not None else os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = deque()
+        for arg in args:
+            if len(in_flight) >= max_workers * renders_per_worker:
+                yield in_flight.popleft().result()
+            in_flight.append(executor.submit(function, arg))
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def export_slices(exports, fnames, max_workers=None, **options):
+    """
+    Render each SliceExport to a PNG file.  Rendering and encoding are done in
+    a pool of max_workers processes, or in this process if max_workers is 0.
+    Keyword options are passed to render_slice.  Returns the file names.
+    """
+    if len(exports) != len(fnames):
+        raise ValueError(f'{len(exports)} slices but {len(fnames)} file names')
+    args = ((complex_slice, overlay, export, options, os.fspath(fname))
+            for (complex_slice, overlay, export), fname in zip(iter_render_args(exports), fnames))
+    return list(map_renders(render_png, args, max_workers))
+
+
+def montage(tiles, columns=None, spacing=2, background=(0, 0, 0, 255), num_tiles=None):
+    """
+    Arrange RGBA tiles of the same shape in a grid, row by row.  If num_tiles
+    is given, tiles can be an iterator, e.g. of tiles still being rendered, and
+    each tile is pasted into the montage as it arrives.
+    """
+    if num_tiles is None:
+        tiles = list(tiles)
+        num_tiles = len(tiles)
+    if num_tiles == 0:
+        raise ValueError('no tiles to arrange')
+    columns = columns if columns is not None else int(np.ceil(np.sqrt(num_tiles)))
+    rows = int(np.ceil(num_tiles / columns))
+    image = None
+    for indx, tile in enumerate(tiles):
+        if image is None:
+            height, width = tile.shape[:2]
+            image = np.empty((rows * height + (rows - 1) * spacing, columns * width + (columns - 1) * spacing, 4),
+                             dtype=np.uint8)
+            image[:] = background
+        elif tile.shape[:2] != (height, width):
+            raise ValueError('all tiles of a montage must have the same shape')
+        row, column = divmod(indx, columns)
+        top = row * (height + spacing)
+        left = column * (width + spacing)
+        image[top:top + height, left:left + width] = tile
+    return image
+
+
+def export_montage(exports, fname, columns=None, spacing=2, max_workers=None, **options):
+    """
+    Render SliceExports into a lightbox montage saved as a PNG file, e.g.
+    export_montage(all_slices(images), 'qa.png').  Tiles are rendered in a
+    pool of max_workers processes and pasted into the montage as they are
+    done.  Keyword options are passed to render_slice.  Returns the montage as
+    a uint8 RGBA array.
+    """
+    args = ((complex_slice, overlay, export, options) for complex_slice, overlay, export in iter_render_args(exports))
+    image = montage(map_renders(render_tile, args, max_workers), columns, spacing, num_tiles=len(exports))
+    imsave(os.fspath(fname), image, format='png')
+    return image
+
+
+def movie_frames(images, z, luts, display_types, overlay_weights=None, frames=None, origin='lower'):
+    """
+    Yield the RGBA movie frames of images at slice z, side by side, one frame
+    at a time.  Each image is colour-mapped through its ColourLUT in luts, the
+    same lookup the 'lut' render engine uses, and blended with its overlay
+    weights, see overlay_blend_weights.  frames defaults to every t.
+    """
+    if overlay_weights is None:
+        overlay_weights = [None] * len(images)
+    if frames is None:
+        frames = range(image_shape(images[0])[3])
+    for t in frames:
+        tiles = []
+        for image, lut, display_type, weights in zip(images, luts, display_types, overlay_weights):
+            rgba = opaque(lut(apply_display_type(get_slice(image, z, t), display_type).T))
+            if weights is not None:
+                blend_overlay(rgba, weights)
+            tiles.append(rgba[::-1] if origin == 'lower' else rgba)
+        yield tiles[0] if len(tiles) == 1 else montage(tiles, columns=len(tiles))
+
+
+def movie_kind(fname, ffmpeg):
+    extension = os.path.splitext(fname)[1].lower()
+    if ffmpeg is not None and extension != '.png':
+        return 'ffmpeg'
+    if extension == '.gif':
+        if importlib.util.find_spec('PIL') is None:
+            raise RuntimeError(f'{fname} needs ffmpeg or Pillow to be installed, neither was found')
+        return 'gif'
+    if extension != '.png':
+        warnings.warn(f'ffmpeg was not found, {fname} is written as a PNG sequence')
+    return 'png'
+
+
+def png_sequence_name(fname, indx):
+    return f'{os.path.splitext(fname)[0]}_{indx:05d}.png'
+
+
+def write_gif(frames, fname, fps):
+    """
+    Write RGBA frames to an endlessly looping GIF as they are received.  Each
+    frame is quantised to its own palette by Pillow and appended to the file,
+    so only the frame being encoded is held in memory.
+    """
+    from PIL import GifImagePlugin, Image
+
+    duration = int(round(1000 / fps))
+    with open(fname, 'wb') as f:
+        for indx, rgba in enumerate(frames):
+            image = Image.fromarray(rgba).convert('RGB').convert('P', palette=Image.Palette.ADAPTIVE)
+            if indx == 0:
+                header, _ = GifImagePlugin.getheader(image, info={'loop': 0, 'duration': duration})
+                f.write(b''.join(header))
+            f.write(b''.join(GifImagePlugin.getdata(image, duration=duration, include_color_table=True)))
+        if f.tell() > 0:
+            # trailer
+            f.write(b';')
+
+
+def encode_frames(stream, fname, fps, kind, width, height):
+    """
+    Runs in the encoder process, reading raw RGBA frames from stream until it
+    is closed.  PNG sequences and GIFs are written frame by frame.
+    """
+    fps, width, height = float(fps), int(width), int(height)
+    frame_bytes = width * height * 4
+
+    def receive():
+        while True:
+            buffer = stream.read(frame_bytes)
+            if len(buffer) < frame_bytes:
+                return
+            yield np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 4)
+
+    if kind == 'png':
+        for indx, rgba in enumerate(receive()):
+            imsave(png_sequence_name(fname, indx), rgba, format='png')
+    else:
+        write_gif(receive(), fname, fps)
+
+
+class MovieWriter:
+    """
+    Encodes RGBA frames to a movie in another process, so that the process
+    producing the frames never holds more than one of them.  Raw frames are
+    piped to ffmpeg if it is installed, which can write any format it
+    supports.  Otherwise they are piped to a Python process that writes GIFs
+    with Pillow, and other names as a PNG sequence, name_00000.png, ...
+    """
+
+    def __init__(self, fname, fps=10, ffmpeg=None):
+        self.fname = os.fspath(fname)
+        self.fps = fps
+        self.ffmpeg = ffmpeg if ffmpeg is not None else shutil.which('ffmpeg')
+        self.kind = movie_kind(self.fname, self.ffmpeg)
+        self.frame_shape = None
+        self.process = None
+        self.errors = None
+        self.num_frames = 0
+
+    def start(self, frame_shape):
+        self.frame_shape = frame_shape
+        height, width = frame_shape[:2]
+        env = None
+        if self.kind == 'ffmpeg':
+            args = [self.ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                    '-s', f'{width}x{height}', '-framerate', str(self.fps), '-i', '-']
+            if not self.fname.lower().endswith('.gif'):
+                # most video codecs need even dimensions and planar yuv
+                args += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p']
+            args.append(self.fname)
+        else:
+            # a new interpreter rather than a fork, frames are often produced by a thread of a Qt application
+            code = 'import sys; from vidi3d.export import encode_frames; encode_frames(sys.stdin.buffer, *sys.argv[1:])'
+            args = [sys.executable, '-c', code, self.fname, str(self.fps), self.kind, str(width), str(height)]
+            package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            env = dict(os.environ)
+            env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_parent, env.get('PYTHONPATH')]))
+        # errors go to a file, a full stderr pipe would block the encoder while frames are written
+        self.errors = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stderr=self.errors, env=env)
+
+    def write(self, rgba):
+        rgba = np.ascontiguousarray(rgba, dtype=np.uint8)
+        if self.process is None:
+            self.start(rgba.shape)
+        elif rgba.shape != self.frame_shape:
+            raise ValueError(f'frame shape {rgba.shape} differs from the first frame shape {self.frame_shape}')
+        # writes block while the encoder is behind, so frames don't pile up in memory
+        self.process.stdin.write(rgba.data)
+        self.num_frames += 1
+
+    def close(self):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        process.stdin.close()
+        returncode = process.wait()
+        self.errors.seek(0)
+        errors = self.errors.read().decode(errors='replace')
+        self.errors.close()
+        if returncode != 0:
+            raise RuntimeError(f'failed to write {self.fname}: {errors}')
+
+    def abort(self):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        process.kill()
+        process.wait()
+        process.stdin.close()
+        self.errors.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def export_movie(images, fname, z=0, fps=10, display_type=ImageDisplayType.mag, windows=None, levels=None,
+                 cmaps=None, overlays=None, overlay_cmaps=None, overlay_alpha=0.3, overlay_threshold=None,
+                 origin='lower'):
+    """
+    Write the movie of images at slice z, side by side, to fname, see
+    MovieWriter.  Window and level of each image default to the viewer
+    defaults of its first frame.  Returns the number of frames written.
+    """
+    luts = []
+    overlay_weights = []
+    for indx, image in enumerate(images):
+        window = windows[indx] if windows is not None else None
+        level = levels[indx] if levels is not None else None
+        cmap = cmaps[indx] if cmaps is not None else None
+        cmap = mpl.colormaps[cmap] if isinstance(cmap, str) else cmap if cmap is not None else mpl.cm.Greys_r
+        if display_type == ImageDisplayType.phase:
+            cmap, window, level = mpl.cm.hsv, 2 * np.pi, 0.0
+        elif window is None or level is None:
+            default_windows, default_levels = statistics.default_window_levels(get_slice(image, z, 0))
+            window = default_windows[display_type] if window is None else window
+            level = default_levels[display_type] if level is None else level
+        luts.append(ColourLUT(cmap, level - 0.5 * window, level + 0.5 * window))
+        overlay = overlays[indx] if overlays is not None else None
+        if overlay is None:
+            overlay_weights.append(None)
+            continue
+        overlay = get_overlay_slice(overlay, z)
+        overlay_cmap = overlay_cmaps[indx] if overlay_cmaps is not None else None
+        overlay_level = statistics.default_level(overlay)
+        half_window = statistics.dynamic_range(overlay) / 2.0
+        overlay_rgba = colour_map(overlay.T, overlay_cmap if overlay_cmap is not None else mpl.cm.Reds,
+                                  overlay_level - half_window, overlay_level + half_window)
+        overlay_weights.append(overlay_blend_weights(overlay, overlay_rgba, overlay_alpha, overlay_threshold))
+
+    with MovieWriter(fname, fps) as writer:
+        for rgba in movie_frames(images, z, luts, [display_type] * len(images), overlay_weights, origin=origin):
+            writer.write(rgba)
+    return writer.num_frames
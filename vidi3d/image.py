@@ -5,20 +5,24 @@ class are also used to show the 3 cross sectional views of a 3D image.
 """
 import matplotlib as mpl
 import numpy as np
-from PyQt5 import QtCore
+from PyQt5 import QtCore, QtGui
 from PyQt5.QtWidgets import QSizePolicy
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.transforms import Bbox
 
+from . import profiling, statistics
 from .coordinates import XYCoord
 from .definitions import ImageDisplayType
 from .helpers import apply_display_type, Event
+from .pyramid import downsample2, downsample_display_slice, level_bounds, pyramid_level
+from .render import ColourLUT, LUTRenderer
 from .signals import Signals
 
 
 def mpl_imshow_popup(self):
     vmin, vmax = self.img.get_clim()
     mpl.pyplot.figure()
-    popout_figure = mpl.pyplot.imshow(self.img.get_array(),
+    popout_figure = mpl.pyplot.imshow(self.get_display_image(),
                                       cmap=self.img.get_cmap(),
                                       origin=self.img.origin,
                                       aspect=self.img.axes.get_aspect(),
@@ -30,6 +34,8 @@ def mpl_imshow_popup(self):
     mpl.pyplot.show()
 
 
+@profiling.instrument('mouse_press', 'mouse_move', 'mouse_release', 'set_mpl_img', 'blit_image_and_lines',
+                      'blit_lines')
 class MplImage(Signals, FigureCanvas):
     def __init__(self,
                  complex_image,
@@ -43,7 +49,12 @@ class MplImage(Signals, FigureCanvas):
                  cursor_labels=None,
                  cmap=None,
                  overlay_cmap=None,
-                 mmb_callback=None):
+                 mmb_callback=None,
+                 slice_cache=None,
+                 slice_key=None,
+                 volume_statistics=None,
+                 render_engine='matplotlib',
+                 quantised_volume=None):
         self.fig = mpl.figure.Figure()
         FigureCanvas.__init__(self, self.fig)
         FigureCanvas.setSizePolicy(self, QSizePolicy.Expanding, QSizePolicy.Expanding)
@@ -53,6 +64,7 @@ class MplImage(Signals, FigureCanvas):
         self._idMove = self.mpl_connect('motion_notify_event', self.mouse_move)
         self._idPress = self.mpl_connect('button_press_event', self.mouse_press)
         self._idRelease = self.mpl_connect('button_release_event', self.mouse_release)
+        self._idDraw = self.mpl_connect('draw_event', self.on_draw)
         self.left_mouse_press = False
         self.middle_mouse_press = False
         MplImage.middle_mouse_callback = mmb_callback or mpl_imshow_popup
@@ -60,6 +72,13 @@ class MplImage(Signals, FigureCanvas):
 
         # Internal data initialization
         self.complex_image_data = complex_image
+        # display data for each slice is kept in slice_cache under slice_key + (display_type,)
+        self.slice_cache = slice_cache
+        self.slice_key = slice_key
+        # statistics of the whole volume, if available they replace the statistics of each slice
+        self.volume_statistics = volume_statistics
+        # Volume whose QuantisedVolume codes are drawn by the 'lut' engine, slice_key is (index, z, t)
+        self.quantised_volume = quantised_volume
 
         # Threshold to use to ignore background values in stats used for default window/level values
         self.background_threshold = background_threshold
@@ -85,6 +104,16 @@ class MplImage(Signals, FigureCanvas):
                                          interpolation=interpolation,
                                          origin=origin,
                                          cmap=self.cmap)
+        # with the 'lut' engine the image is painted by Qt underneath a transparent matplotlib canvas
+        if render_engine == 'lut':
+            self.lut_renderer = LUTRenderer(self.img)
+            self.img.set_visible(False)
+            self.fig.patch.set_visible(False)
+            self.axes.patch.set_visible(False)
+        elif render_engine == 'matplotlib':
+            self.lut_renderer = None
+        else:
+            raise ValueError(f"render_engine must be 'matplotlib' or 'lut', not {render_engine!r}")
         if overlay is not None:
             level = self.default_level(overlay)
             half_window = self.get_dynamic_range(overlay) / 2.0
@@ -97,8 +126,24 @@ class MplImage(Signals, FigureCanvas):
                                                  vmin=level - half_window,
                                                  vmax=level + half_window,
                                                  )
+            # thresholded overlays are colour-mapped into a reused RGBA buffer, see set_thresholded_overlay
+            self.overlay_lut = ColourLUT(self.overlay.get_cmap(), *self.overlay.get_clim())
+            self.overlay_rgba = None
+            self.overlay_shown = None
+        # when zoomed in only the visible part of the slice, plus a margin, is display transformed and drawn
+        # the image extent is moved with the crop, so the view limits must not follow the image extent
+        self.image_crop = None
+        self.viewport_margin = 0.25
+        # zoomed out views of large slices draw a downsampled level, see get_pyramid_level
+        # levels of the current slice are kept here when the slice cache can't be used
+        self.image_level = 0
+        self.pyramid = {}
+        self.viewport_update_pending = False
+        self.axes.set_autoscale_on(False)
         self.display_type = ImageDisplayType.mag
         self.set_mpl_img()
+        self.axes.callbacks.connect('xlim_changed', self.on_view_change)
+        self.axes.callbacks.connect('ylim_changed', self.on_view_change)
         self.title = self.axes.text(0.5,
                                     1.08,
                                     cursor_labels[2]['textLabel'],
@@ -126,6 +171,12 @@ class MplImage(Signals, FigureCanvas):
                                    bbox={'facecolor': 'white', 'alpha': 0.7},
                                    va='top',
                                    ha='center')
+        # cursor artists are left out of full draws and blitted over a cached background instead
+        self.cursor_artists = [self.hline, self.htxt, self.vline, self.vtxt]
+        for artist in self.cursor_artists:
+            artist.set_animated(True)
+        self.cursor_background = None
+        self.cursor_background_key = None
 
         # Initialize parameters for data visualization
         # todo: too many window level attributes, need to clean up, maybe a class for namespace?
@@ -153,16 +204,22 @@ class MplImage(Signals, FigureCanvas):
         return self.axes.imshow(img.T, *args, **kwargs)
 
     def get_image_value(self, coord):
-        return self.img.get_array().data[coord.y, coord.x]
+        # computed from the complex data, the image array can hold colour-mapped movie frames
+        return apply_display_type(self.complex_image_data[coord.x, coord.y], self.display_type)
 
     @property
     def cursor_val(self):
         return self.get_image_value(self.cursor_loc)
 
+    def get_display_image(self):
+        # the whole display slice, transposed like the image data, even when only a crop is shown
+        intensity_image, _ = self.get_display_slice(self.complex_image_data, self.slice_key)
+        return intensity_image.T
+
     def save(self, fname):
         vmin, vmax = self.img.get_clim()
         mpl.pyplot.imsave(fname=fname + '.png',
-                          arr=self.img.get_array(),
+                          arr=self.get_display_image(),
                           cmap=self.img.get_cmap(),
                           origin=self.img.origin,
                           vmin=vmin,
@@ -219,17 +276,136 @@ class MplImage(Signals, FigureCanvas):
     def emit_cursor_change(self, coord):
         self.sig_cursor_change.emit(int(coord[0]), int(coord[1]))
 
+    def on_view_change(self, axes):
+        # x and y limits change one after the other when zooming, so the crop is updated once both are set
+        if not self.viewport_update_pending:
+            self.viewport_update_pending = True
+            QtCore.QTimer.singleShot(0, self.update_viewport)
+
+    def resizeEvent(self, event):
+        FigureCanvas.resizeEvent(self, event)
+        # the pyramid level depends on the size of the axes on screen
+        self.on_view_change(self.axes)
+
+    def update_viewport(self):
+        self.viewport_update_pending = False
+        if self.crop_needs_update() or self.get_pyramid_level() != self.image_level:
+            self.set_mpl_img()
+            self.draw_idle()
+
+    def get_viewport_crop(self, margin=0.0):
+        """
+        (x0, x1, y0, y1) bounds of the slice visible in the axes, grown by
+        margin times the visible size on each side.  None if the whole slice
+        is visible.
+        """
+        nx, ny = self.complex_image_data.shape[:2]
+        bounds = []
+        for (low, high), size in ((sorted(self.axes.get_xlim()), nx), (sorted(self.axes.get_ylim()), ny)):
+            pad = margin * (high - low)
+            # pixel i covers i - 0.5 to i + 0.5 in data coordinates
+            bounds.append(max(0, int(np.floor(low + 0.5 - pad))))
+            bounds.append(min(size, int(np.ceil(high + 0.5 + pad))))
+        x0, x1, y0, y1 = bounds
+        if x0 >= x1 or y0 >= y1 or (x0, x1, y0, y1) == (0, nx, 0, ny):
+            return None
+        return x0, x1, y0, y1
+
+    def crop_needs_update(self):
+        visible = self.get_viewport_crop()
+        wanted = self.get_viewport_crop(self.viewport_margin)
+        current = self.image_crop
+        if current is None:
+            return wanted is not None and self.crop_size(None) > 4 * self.crop_size(wanted)
+        if visible is None:
+            return True
+        contained = (current[0] <= visible[0] and visible[1] <= current[1] and
+                     current[2] <= visible[2] and visible[3] <= current[3])
+        # re-extract when panned outside the crop, or zoomed in far enough that most of the crop is hidden
+        return not contained or self.crop_size(current) > 4 * self.crop_size(wanted)
+
+    def crop_size(self, crop):
+        if crop is None:
+            return self.complex_image_data.shape[0] * self.complex_image_data.shape[1]
+        return (crop[1] - crop[0]) * (crop[3] - crop[2])
+
+    def get_crop_extent(self, crop, level=0):
+        # pixels of a pyramid level cover 2**level pixels of the slice, the last ones can extend past the slice
+        scale = 2 ** level
+        x0, x1, y0, y1 = (bound * scale for bound in level_bounds(crop, self.complex_image_data.shape, level))
+        if self.img.origin == 'upper':
+            return x0 - 0.5, x1 - 0.5, y1 - 0.5, y0 - 0.5
+        return x0 - 0.5, x1 - 0.5, y0 - 0.5, y1 - 0.5
+
+    def on_draw(self, event):
+        if event.canvas.is_saving():
+            # saved figures are drawn with the cursor artists, see print_figure, and are not what the screen shows
+            return
+        # the figure was drawn without the cursor artists, keep it as the background for cursor changes
+        self.cursor_background = self.copy_from_bbox(self.fig.bbox)
+        self.cursor_background_key = self.get_background_key()
+        self.draw_cursor_artists()
+
+    def print_figure(self, *args, **kwargs):
+        # animated artists are left out of full draws, but the cursor belongs in a saved figure
+        for artist in self.cursor_artists:
+            artist.set_animated(False)
+        # the 'lut' engine paints the image in paintEvent, a saved figure is drawn by matplotlib
+        hidden_artists = [self.img, self.fig.patch, self.axes.patch] if self.lut_renderer is not None else []
+        for artist in hidden_artists:
+            artist.set_visible(True)
+        img_data = None
+        if self.lut_renderer is not None and self.lut_renderer.codes is not None:
+            # the image artist is not updated for quantised slices, it is drawn from the decoded codes
+            img_data = self.img.get_array()
+            self.img.set_data(self.lut_renderer.code_values[self.lut_renderer.codes])
+        try:
+            return FigureCanvas.print_figure(self, *args, **kwargs)
+        finally:
+            for artist in self.cursor_artists:
+                artist.set_animated(True)
+            for artist in hidden_artists:
+                artist.set_visible(False)
+            if img_data is not None:
+                self.img.set_data(img_data)
+
     # Methods that set internal data
-    def set_complex_image(self, new_image):
+    def set_complex_image(self, new_image, slice_key=None):
         self.complex_image_data = new_image
+        self.slice_key = slice_key
+        self.pyramid.clear()
 
     def set_overlay(self, new_overlay_data):
+        self.invalidate_cursor_background()
         # this class uses coordinates complex_image[x,y]
         # we would like x (first dimension) to be on horizontal axis
         # imshow visualizes matrices where first column is rows (vertical axis)
         # therefore, we must transpose the data
         self.overlay.set_data(new_overlay_data.T)
 
+    def set_thresholded_overlay(self, new_overlay_data, lower_thresh, upper_thresh, invert=False):
+        """
+        Show the overlay with values between lower_thresh and upper_thresh
+        hidden, or only those values if invert is True.  Hidden values get zero
+        alpha in the RGBA buffer instead of being masked.
+        """
+        overlay = np.asarray(new_overlay_data).T
+        if self.overlay_rgba is None or self.overlay_rgba.shape[:2] != overlay.shape:
+            self.overlay_rgba = np.empty(overlay.shape + (4,), dtype=np.uint8)
+            self.overlay_shown = np.empty(overlay.shape, dtype=bool)
+            self.overlay_below = np.empty(overlay.shape, dtype=bool)
+        shown = self.overlay_shown
+        np.take(self.overlay_lut.table, self.overlay_lut.indices(overlay), axis=0, out=self.overlay_rgba)
+        np.greater_equal(overlay, lower_thresh, out=shown)
+        np.less_equal(overlay, upper_thresh, out=self.overlay_below)
+        np.logical_and(shown, self.overlay_below, out=shown)
+        if not invert:
+            np.logical_not(shown, out=shown)
+        alpha = self.overlay_rgba[..., 3]
+        np.multiply(alpha, shown, out=alpha, casting='unsafe')
+        self.invalidate_cursor_background()
+        self.overlay.set_data(self.overlay_rgba)
+
     def set_cursor_loc(self, new_loc):
         # todo: loc set multiple times
         self.cursor_loc.x = new_loc[0]
@@ -256,103 +432,172 @@ class MplImage(Signals, FigureCanvas):
             vmin = self.intensity_level - (self.intensity_window * 0.5)
             vmax = self.intensity_level + (self.intensity_window * 0.5)
             self.img.set_clim(vmin, vmax)
+            if self.lut_renderer is not None:
+                self.lut_renderer.set_clim(vmin, vmax)
 
-    def set_window_level_to_default(self):
-        self.intensity_level_cache[ImageDisplayType.imag] = self.default_level(self.complex_image_data.imag,
-                                                                               self.background_threshold)
-        self.intensity_window_cache[ImageDisplayType.imag] = self.get_dynamic_range(self.complex_image_data.imag)
-
-        self.intensity_level_cache[ImageDisplayType.real] = self.default_level(self.complex_image_data.real,
-                                                                               self.background_threshold)
-        self.intensity_window_cache[ImageDisplayType.real] = self.get_dynamic_range(self.complex_image_data.real)
-
-        self.intensity_level_cache[ImageDisplayType.phase] = 0.0
-        self.intensity_window_cache[ImageDisplayType.phase] = 2.0 * np.pi
-
-        self.intensity_level_cache[ImageDisplayType.mag] = self.default_level(np.abs(self.complex_image_data),
-                                                                              self.background_threshold)
-        self.intensity_window_cache[ImageDisplayType.mag] = self.get_dynamic_range(np.abs(self.complex_image_data))
+    def set_volume_statistics(self, volume_statistics):
+        # None goes back to the statistics of each slice, e.g. while the statistics of changed data are computed
+        self.volume_statistics = volume_statistics
+        if volume_statistics is not None:
+            self.img_dynamic_range = volume_statistics.dynamic_range[self.display_type]
 
+    def set_window_level_to_default(self):
+        if self.volume_statistics is not None:
+            windows, levels = self.volume_statistics.windows, self.volume_statistics.levels
+        else:
+            windows, levels = statistics.default_window_levels(self.complex_image_data, self.background_threshold)
+        self.intensity_window_cache[:] = windows
+        self.intensity_level_cache[:] = levels
         self.set_window_level(self.intensity_window_cache[self.display_type],
                               self.intensity_level_cache[self.display_type])
 
     # Methods updating objects that visualize internal data
     def set_mpl_img_cmap(self, cmap):
+        self.invalidate_cursor_background()
         self.img.set_cmap(cmap)
+        if self.lut_renderer is not None:
+            self.lut_renderer.set_cmap(cmap)
 
     @staticmethod
     def get_dynamic_range(img):
-        valid_values = img[np.logical_and(np.isfinite(img), np.abs(img).astype(bool))]
-        if valid_values.size == 0:
-            return 1
-
-        # not very robust
-        # dynamic_range = np.float(np.max(valid_values)) - np.float(np.min(valid_values))
-
-        # use n_stdv*stdv for dynamic range
-        n_stdv = 3
-        stdv = valid_values.std()
-        # for masks, stdv of valid values is 0 but we still want a dynamic range
-        if stdv == 0:
-            return 1
-
-        remove_outliers = False
-        if remove_outliers:
-            # remove outliers from stdv
-            mean = valid_values.mean()
-            stdv_prev = np.inf
-            max_iter = 25
-            count = 0
-            while np.abs((stdv_prev - stdv) / stdv) > 0.1 and count < max_iter:
-                if stdv == 0:
-                    if mean:
-                        return 2 * mean
-                    else:
-                        return 1
-                valid_values = valid_values[np.abs(valid_values - mean) < n_stdv * stdv]
-                # median = np.median(valid_values)
-                mean = valid_values.mean()
-                stdv_prev = stdv
-                stdv = valid_values.std()
-                count += 1
-
-        return n_stdv * stdv
+        # use 3*stdv of the non-zero finite values for dynamic range
+        return statistics.dynamic_range(img)
 
     @staticmethod
     def default_level(img, background_threshold=0.05):
-        valid_values = img[np.logical_and(np.isfinite(img), img.astype(bool))]
-        if valid_values.size == 0:
-            return 0
-
-        # background zeroes cause these values to be too small
-        # default_level = valid_values.mean()
-        # default_level = np.median(valid_values) 
-
-        # background removal
-        # compare the absolute pixel value to the mean value of the absolute image
-        # keep all values whose absolute value is above 5% of the absolute mean value
-        # then recalculate the absolute mean and iterate, gradually removing the low outlier values
-        mean_prev = np.inf
-        mean = np.abs(valid_values).mean()
-
-        max_iter = 25
-        count = 0
-        while np.abs((mean_prev - mean) / mean) > 0.1 and count < max_iter:
-            valid_values = valid_values[np.abs(valid_values) > mean * background_threshold]
-            mean_prev = mean
-            mean = np.abs(valid_values).mean()
-            count += 1
-
-        return np.median(valid_values)
+        # median of the values left after iteratively removing background values
+        return statistics.default_level(img, background_threshold)
+
+    @staticmethod
+    def compute_display_slice(complex_image, display_type, with_dynamic_range=True):
+        with profiling.stage('apply_display_type'):
+            intensity_image = apply_display_type(complex_image, display_type).astype(np.float32, copy=False)
+        with profiling.stage('dynamic_range'):
+            dynamic_range = MplImage.get_dynamic_range(intensity_image) if with_dynamic_range else None
+        return intensity_image, dynamic_range
+
+    def get_display_slice(self, complex_image, slice_key=None, crop=None):
+        # the dynamic range of each slice is not needed when the volume statistics are known
+        with_dynamic_range = self.volume_statistics is None
+        cache_key = None
+        if self.slice_cache is not None and slice_key is not None:
+            cache_key = tuple(slice_key) + (self.display_type,)
+            cached = self.slice_cache.get(cache_key)
+            if cached is not None and (cached[1] is not None or not with_dynamic_range):
+                if crop is not None:
+                    x0, x1, y0, y1 = crop
+                    return cached[0][x0:x1, y0:y1], cached[1]
+                return cached
+        if crop is not None:
+            # only the crop is transformed, and it is not cached
+            # the dynamic range is estimated from a sample of the whole slice, as for an uncropped slice
+            x0, x1, y0, y1 = crop
+            intensity_image, _ = self.compute_display_slice(complex_image[x0:x1, y0:y1], self.display_type, False)
+            dynamic_range = self.get_sampled_dynamic_range(complex_image) if with_dynamic_range else None
+            return intensity_image, dynamic_range
+        display_slice = self.compute_display_slice(complex_image, self.display_type, with_dynamic_range)
+        if cache_key is not None:
+            self.slice_cache.put(cache_key, display_slice)
+        return display_slice
+
+    def get_sampled_dynamic_range(self, complex_image):
+        # dynamic range of the whole slice estimated without display transforming all of it
+        sample = apply_display_type(statistics.strided_sample(complex_image), self.display_type)
+        return statistics.dynamic_range_of_valid(statistics.valid_values(sample))
+
+    def get_pyramid_level(self):
+        # level with about one level pixel per screen pixel of the current view
+        nx, ny = self.complex_image_data.shape[:2]
+        view_size = (abs(np.diff(self.axes.get_xlim())[0]), abs(np.diff(self.axes.get_ylim())[0]))
+        screen_size = (self.axes.bbox.width, self.axes.bbox.height)
+        return pyramid_level(view_size, screen_size, max(0, int(np.log2(max(min(nx, ny), 1))) - 1))
+
+    def get_pyramid_slice(self, level):
+        """
+        Display slice downsampled 2**level times.  Each level is built from the
+        one below the first time it is needed and kept in the slice cache, or
+        with the current slice if the slice has no cache key.
+        """
+        key = (self.display_type, 'level', level)
+        if self.slice_cache is not None and self.slice_key is not None:
+            cache, key = self.slice_cache, tuple(self.slice_key) + key
+        else:
+            cache = None
+        pyramid_slice = cache.get(key) if cache is not None else self.pyramid.get(key)
+        if pyramid_slice is None:
+            if level == 1:
+                pyramid_slice = downsample_display_slice(self.complex_image_data, self.display_type)
+            else:
+                pyramid_slice = downsample2(self.get_pyramid_slice(level - 1), self.display_type)
+            if cache is not None:
+                cache.put(key, pyramid_slice)
+            else:
+                self.pyramid[key] = pyramid_slice
+        return pyramid_slice
+
+    @staticmethod
+    def compute_rgba_frame(intensity_image, cmap, vmin, vmax):
+        # colour-mapped image, transposed the same way as the data given to self.img
+        return cmap(mpl.colors.Normalize(vmin, vmax)(intensity_image.T), bytes=True)
+
+    def get_rgba_key(self):
+        # everything other than the slice that the colour-mapped image depends on
+        return (self.display_type,) + tuple(self.img.get_clim()) + (self.img.get_cmap().name,)
+
+    def get_rgba_frame(self, complex_image, slice_key=None):
+        intensity_image, _ = self.get_display_slice(complex_image, slice_key)
+        vmin, vmax = self.img.get_clim()
+        return self.compute_rgba_frame(intensity_image, self.img.get_cmap(), vmin, vmax)
 
     def set_mpl_img(self):
-        intensity_image = apply_display_type(self.complex_image_data, self.display_type)
-        self.img_dynamic_range = self.get_dynamic_range(intensity_image)
+        crop = self.get_viewport_crop(self.viewport_margin)
+        level = self.get_pyramid_level()
+        quantised = None
+        if (self.quantised_volume is not None and self.lut_renderer is not None and self.slice_key is not None
+                and level == 0):
+            # codes are computed in the background, until then the slice is display transformed
+            quantised = self.quantised_volume.quantised.get(self.display_type)
+        if quantised is not None:
+            # the codes replace the display transform, the hidden image artist keeps its previous data
+            z, t = self.slice_key[1:3]
+            codes = quantised.slice_codes(z, t)
+            if crop is not None:
+                codes = codes[crop[2]:crop[3], crop[0]:crop[1]]
+            self.set_img_crop(crop)
+            self.lut_renderer.set_codes(codes, quantised.code_values)
+            self.invalidate_cursor_background()
+        elif level > 0:
+            x0, x1, y0, y1 = level_bounds(crop, self.complex_image_data.shape, level)
+            intensity_image = self.get_pyramid_slice(level)[x0:x1, y0:y1]
+            self.img_dynamic_range = None
+            if self.volume_statistics is None:
+                self.img_dynamic_range = self.get_sampled_dynamic_range(self.complex_image_data)
+        else:
+            intensity_image, self.img_dynamic_range = self.get_display_slice(self.complex_image_data,
+                                                                             self.slice_key,
+                                                                             crop)
+        if self.volume_statistics is not None:
+            self.img_dynamic_range = self.volume_statistics.dynamic_range[self.display_type]
         # this class uses coordinates complex_image[x,y]
         # we would like x (first dimension) to be on horizontal axis
         # imshow visualizes matrices where first column is rows (vertical axis)
         # therefore, we must transpose the data
-        self.img.set_data(intensity_image.T)
+        if quantised is None:
+            self.set_img_data(intensity_image.T, crop, level)
+
+    def set_img_crop(self, crop, level=0):
+        self.image_crop = crop
+        self.image_level = level
+        self.img.set_extent(self.get_crop_extent(crop, level))
+
+    def set_img_data(self, data, crop=None, level=0):
+        # data is already transposed, either a display slice or a colour-mapped RGBA frame
+        # crop is the part of the slice data covers, None for the whole slice, at pyramid level
+        self.set_img_crop(crop, level)
+        self.img.set_data(data)
+        if self.lut_renderer is not None:
+            self.lut_renderer.set_data(data)
+        self.invalidate_cursor_background()
 
     def set_mpl_lines(self):
         self.hline.set_ydata([self.cursor_loc.y, self.cursor_loc.y])
@@ -360,13 +605,38 @@ class MplImage(Signals, FigureCanvas):
         self.htxt.set_y(self.cursor_loc.y)
         self.vtxt.set_x(self.cursor_loc.x)
 
+    def get_background_key(self):
+        # what the cached background depends on: slice, display type, window/level, zoom and canvas size
+        # the 'lut' engine paints the image under the matplotlib canvas, so its window/level is not in the background
+        window_level = (self.intensity_window, self.intensity_level) if self.lut_renderer is None else ()
+        return ((self.slice_key, self.display_type) + window_level +
+                (tuple(self.axes.get_xlim()), tuple(self.axes.get_ylim()), self.fig.bbox.bounds))
+
+    def invalidate_cursor_background(self):
+        # call when the image is changed without a full draw, e.g. artists drawn directly onto the canvas
+        self.cursor_background = None
+
+    def draw_cursor_artists(self):
+        for artist in self.cursor_artists:
+            self.axes.draw_artist(artist)
+
     def blit_image_and_lines(self):
         #if self.fig._cachedRenderer is not None:
             #print(hasattr(self.fig,'_cachedRenderer'))
-            self.fig.canvas.draw()
+            with profiling.stage('MplImage.canvas.draw'):
+                self.fig.canvas.draw()
             self.blit(self.fig.bbox)
             return
 
+    def blit_lines(self):
+        # only the cursor artists changed, draw them over the cached background
+        if self.cursor_background is None or self.cursor_background_key != self.get_background_key():
+            self.blit_image_and_lines()
+            return
+        self.restore_region(self.cursor_background)
+        self.draw_cursor_artists()
+        self.blit(self.fig.bbox)
+
     def blit_image_for_roi_drawing(self):
         # not using this function anymore, just always draw the entire canvas
         #if self.fig._cachedRenderer is not None:
@@ -381,13 +651,13 @@ class MplImage(Signals, FigureCanvas):
             self.blit(self.fig.bbox)
 
     # Convenience methods to change data and update visualizing objects
-    def show_complex_image_change(self, new_complex_image):
-        self.set_complex_image(new_complex_image)
+    def show_complex_image_change(self, new_complex_image, slice_key=None):
+        self.set_complex_image(new_complex_image, slice_key)
         self.set_mpl_img()
         self.blit_image_and_lines()
 
-    def show_complex_image_and_overlay_change(self, new_complex_image, new_overlay_data):
-        self.set_complex_image(new_complex_image)
+    def show_complex_image_and_overlay_change(self, new_complex_image, new_overlay_data, slice_key=None):
+        self.set_complex_image(new_complex_image, slice_key)
         self.set_overlay(new_overlay_data)
         self.set_mpl_img()
         self.blit_image_and_lines()
@@ -396,7 +666,7 @@ class MplImage(Signals, FigureCanvas):
         # todo: loc set multiple times
         self.set_cursor_loc(new_cursor_loc)
         self.set_mpl_lines()
-        self.blit_image_and_lines()
+        self.blit_lines()
 
     def show_display_type_change(self, display_type):
         self.set_display_type(display_type)
@@ -409,12 +679,43 @@ class MplImage(Signals, FigureCanvas):
 
     def show_window_level_change(self, new_window, new_level):
         self.set_window_level(new_window, new_level)
-        self.blit_image_and_lines()
+        self.redraw_window_level()
 
     def show_set_window_level_to_default(self):
         self.set_window_level_to_default()
-        self.blit_image_and_lines()
+        self.redraw_window_level()
+
+    def redraw_window_level(self):
+        if self.lut_renderer is not None:
+            # only the colour table of the image painted under the matplotlib canvas changed
+            self.update()
+        else:
+            self.blit_image_and_lines()
 
     # Methods related to Qt
     def sizeHint(self):
         return QtCore.QSize(450, 450)
+
+    def paintEvent(self, event):
+        if self.lut_renderer is None:
+            FigureCanvas.paintEvent(self, event)
+            return
+        self._draw_idle()
+        if not hasattr(self, 'renderer'):
+            return
+        # the figure background and the image are painted first, then the transparent Agg buffer on top
+        painter = QtGui.QPainter(self)
+        try:
+            rect = event.rect()
+            painter.fillRect(rect, QtGui.QColor.fromRgbF(*self.fig.patch.get_facecolor()))
+            self.lut_renderer.paint(painter, self)
+            left, top = self.mouseEventCoords(rect.topLeft())
+            bbox = Bbox([[left, top - rect.height() * self.device_pixel_ratio],
+                         [left + rect.width() * self.device_pixel_ratio, top]])
+            buf = memoryview(self.copy_from_bbox(bbox))
+            qimage = QtGui.QImage(buf, buf.shape[1], buf.shape[0], QtGui.QImage.Format_RGBA8888)
+            qimage.setDevicePixelRatio(self.device_pixel_ratio)
+            painter.drawImage(QtCore.QPoint(rect.left(), rect.top()), qimage)
+            self._draw_rect_callback(painter)
+        finally:
+            painter.end()
@@ -7,12 +7,16 @@ cursor line changes and image changes to match the current viewing cursor_loc in
 import numpy as np
 from PyQt5 import QtCore
 
+from .. import profiling
 from ..coordinates import XYZCoord
 from ..image import MplImage
 from ..navigation import NavigationToolbarSimple as NavigationToolbar
 from ..plot import MplPlot
+from ..volume import as_volume
 
 
+@profiling.instrument('on_x_change', 'on_y_change', 'on_z_change', 'on_t_change', 'on_display_type_change',
+                      'on_window_level_change', 'on_window_level_reset')
 class Image4D(QtCore.QObject):
     def __init__(self,
                  complex_image,
@@ -21,9 +25,11 @@ class Image4D(QtCore.QObject):
                  display_type,
                  pixdim,
                  interpolation,
+                 render_engine='matplotlib',
                  ):
         super(Image4D, self).__init__()
 
+        complex_image = as_volume(complex_image)
         self.complex_image = complex_image
         img_shape = np.array(complex_image.shape)
         self.cursor_loc = cursor_loc
@@ -44,7 +50,8 @@ class Image4D(QtCore.QObject):
                              display_type=display_type,
                              cursor_labels=labels,
                              aspect=aspect_z,
-                             interpolation=interpolation)
+                             interpolation=interpolation,
+                             render_engine=render_engine)
         self.z_nav = NavigationToolbar(self.zslice, self.zslice)
 
         labels = [{'color': 'g', 'textLabel': "X"}, {'color': 'b', 'textLabel': "Z"},
@@ -55,7 +62,8 @@ class Image4D(QtCore.QObject):
                              display_type=display_type,
                              cursor_labels=labels,
                              aspect=aspect_y,
-                             interpolation=interpolation)
+                             interpolation=interpolation,
+                             render_engine=render_engine)
         self.y_nav = NavigationToolbar(self.yslice, self.yslice)
 
         labels = [{'color': 'r', 'textLabel': "Z"}, {'color': 'g', 'textLabel': "Y"},
@@ -66,7 +74,8 @@ class Image4D(QtCore.QObject):
                              display_type=display_type,
                              cursor_labels=labels,
                              aspect=aspect_x,
-                             interpolation=interpolation)
+                             interpolation=interpolation,
+                             render_engine=render_engine)
         self.x_nav = NavigationToolbar(self.xslice, self.xslice)
 
         self.xplot = MplPlot([complex_image[:, cursor_loc.y, cursor_loc.z, cursor_loc.t], ],
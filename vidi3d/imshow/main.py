@@ -4,6 +4,7 @@ ControlWidget4D.  Also connections are made between QT signals sent by other
 classes and functions within this class.
 """
 
+import numpy as np
 from PyQt5 import QtCore, QtWidgets
 
 from . import controls
@@ -11,6 +12,8 @@ from . import image4d
 from .. import core
 from ..coordinates import XYZTCoord
 from ..definitions import ImageDisplayType
+from ..scheduler import UpdateScheduler
+from ..volume import Volume, as_volume
 
 
 class Imshow3d(QtWidgets.QMainWindow):
@@ -19,7 +22,9 @@ class Imshow3d(QtWidgets.QMainWindow):
                  background_threshold=0.05,
                  pixdim=None,
                  interpolation='bicubic',
+                 render_engine='matplotlib',
                  ):
+        core.create_qapp()
         super(Imshow3d, self).__init__()
         self.setWindowTitle('Vidi3d: imshow3d')
         self.viewer_number = 0
@@ -34,6 +39,7 @@ class Imshow3d(QtWidgets.QMainWindow):
                                        display_type,
                                        pixdim,
                                        interpolation,
+                                       render_engine,
                                        )
         self.controls = controls._ControlWidget4D(img_shape,
                                                   cursor_loc,
@@ -65,6 +71,8 @@ class Imshow3d(QtWidgets.QMainWindow):
         self.setCentralWidget(splitter)
         # self.statusBar().showMessage('Ready')
 
+        # cursor and window/level changes from mouse motion are applied at most once per display frame
+        self.update_scheduler = UpdateScheduler(self)
         self.make_connections()
 
         self.show()
@@ -75,17 +83,17 @@ class Imshow3d(QtWidgets.QMainWindow):
         self.controls.sig_img_disp_type_change.connect(self.image4d.on_display_type_change)
 
         # when cursor moves, update lines
-        self.image4d.zslice.sig_x_change.connect(self.image4d.on_x_change)
-        self.image4d.zslice.sig_y_change.connect(self.image4d.on_y_change)
-        self.image4d.zslice.sig_z_change.connect(self.image4d.on_z_change)
+        self.image4d.zslice.sig_x_change.connect(self.update_scheduler.coalesced(self.image4d.on_x_change))
+        self.image4d.zslice.sig_y_change.connect(self.update_scheduler.coalesced(self.image4d.on_y_change))
+        self.image4d.zslice.sig_z_change.connect(self.update_scheduler.coalesced(self.image4d.on_z_change))
 
-        self.image4d.xslice.sig_x_change.connect(self.image4d.on_x_change)
-        self.image4d.xslice.sig_y_change.connect(self.image4d.on_y_change)
-        self.image4d.xslice.sig_z_change.connect(self.image4d.on_z_change)
+        self.image4d.xslice.sig_x_change.connect(self.update_scheduler.coalesced(self.image4d.on_x_change))
+        self.image4d.xslice.sig_y_change.connect(self.update_scheduler.coalesced(self.image4d.on_y_change))
+        self.image4d.xslice.sig_z_change.connect(self.update_scheduler.coalesced(self.image4d.on_z_change))
 
-        self.image4d.yslice.sig_x_change.connect(self.image4d.on_x_change)
-        self.image4d.yslice.sig_y_change.connect(self.image4d.on_y_change)
-        self.image4d.yslice.sig_z_change.connect(self.image4d.on_z_change)
+        self.image4d.yslice.sig_x_change.connect(self.update_scheduler.coalesced(self.image4d.on_x_change))
+        self.image4d.yslice.sig_y_change.connect(self.update_scheduler.coalesced(self.image4d.on_y_change))
+        self.image4d.yslice.sig_z_change.connect(self.update_scheduler.coalesced(self.image4d.on_z_change))
 
         # when cursor moves, update control_widget
         self.image4d.xslice.sig_x_change.connect(self.controls.on_x_change)
@@ -101,9 +109,12 @@ class Imshow3d(QtWidgets.QMainWindow):
         self.image4d.zslice.sig_z_change.connect(self.controls.on_z_change)
 
         # when right button pressed, update window/level of images
-        self.image4d.xslice.sig_window_level_change.connect(self.image4d.on_window_level_change)
-        self.image4d.yslice.sig_window_level_change.connect(self.image4d.on_window_level_change)
-        self.image4d.zslice.sig_window_level_change.connect(self.image4d.on_window_level_change)
+        self.image4d.xslice.sig_window_level_change.connect(
+            self.update_scheduler.coalesced(self.image4d.on_window_level_change))
+        self.image4d.yslice.sig_window_level_change.connect(
+            self.update_scheduler.coalesced(self.image4d.on_window_level_change))
+        self.image4d.zslice.sig_window_level_change.connect(
+            self.update_scheduler.coalesced(self.image4d.on_window_level_change))
 
         # when right button pressed, update window/level control_widget
         self.image4d.xslice.sig_window_level_change.connect(self.controls.on_window_level_change)
@@ -142,6 +153,39 @@ class Imshow3d(QtWidgets.QMainWindow):
     def set_viewer_number(self, number):
         self.viewer_number = number
 
+    # changes made by scripts, e.g. through a vidi3d.remote viewer
+    def set_location(self, x=None, y=None, z=None, t=None):
+        """
+        Move the cursor.  Coordinates left as None keep their current value.
+        """
+        for value, image4d_slot, control_slot in ((x, self.image4d.on_x_change, self.controls.on_x_change),
+                                                  (y, self.image4d.on_y_change, self.controls.on_y_change),
+                                                  (z, self.image4d.on_z_change, self.controls.on_z_change)):
+            if value is not None:
+                image4d_slot(value)
+                control_slot(value)
+        if t is not None:
+            self.controls.tcontrol.setValue(t)
+            self.image4d.on_t_change(t)
+
+    def set_image(self, image):
+        """
+        Show image instead of the current data.  It must have the same number
+        of values, it is reshaped to the current shape.
+        """
+        if not isinstance(image, Volume):
+            image = np.reshape(image, self.image4d.complex_image.shape)
+        image = as_volume(image)
+        if image.shape != self.image4d.complex_image.shape:
+            raise ValueError(f'image shape {image.shape} does not match {self.image4d.complex_image.shape}')
+        self.image4d.complex_image = image
+        self.refresh()
+
+    def refresh(self):
+        # redraw the slices and plots after the data was changed in place
+        self.image4d.on_t_change(self.image4d.cursor_loc.t)
+
     def closeEvent(self, event):
+        self.update_scheduler.clear()
         if self.viewer_number:
             del core._open_viewers[self.viewer_number]
@@ -1,17 +1,23 @@
 """
 Base class for plots shown in the viewers. Instances of this class are used
-to show the plot along MpImage cursor lines.
+to show the plot along MpImage cursor lines.  The lines of all images are
+stored as one stacked array, so the display type is applied once per update and
+the axis limits are computed from that array.
 """
+import warnings
+
 import matplotlib as mpl
 import numpy as np
 from PyQt5 import QtCore, QtWidgets
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
 
+from . import profiling
 from .definitions import ImageDisplayType, PlotColours
 from .helpers import apply_display_type
 
 
+@profiling.instrument('set_lines', 'autoscale', 'draw_lines_and_markers')
 class MplPlot(FigureCanvas):
     def __init__(self,
                  complex_data,
@@ -63,24 +69,32 @@ class MplPlot(FigureCanvas):
         if event.button == 2:
             # the toolbar home button does not always respect that the graph has new limits
             #self.toolbar.home()
-            self.axes.relim()
-            self.axes.autoscale()
+            self.autoscale()
             self.draw()
 
     # Methods that set internal data
     def set_complex_data(self, new_complex_data):
-        self.complex_data = new_complex_data
+        # one row per image
+        self.complex_data = np.atleast_2d(np.asarray(new_complex_data))
+        self.display_data = None
 
     def set_display_type(self, display_type):
         self.display_type = display_type
+        self.display_data = None
+
+    def get_display_data(self):
+        if self.display_data is None:
+            self.display_data = apply_display_type(self.complex_data, self.display_type)
+        return self.display_data
 
     def set_marker_posn(self, new_marker_posn):
         self.marker_posn = np.minimum(np.maximum(new_marker_posn, 0), self.complex_data[0].shape[0] - 1)
 
     # Methods updating objects that visualize internal data
     def set_lines(self):
-        for indx in range(len(self.complex_data)):
-            self.lines[indx][0].set_ydata(apply_display_type(self.complex_data[indx], self.display_type))
+        display_data = self.get_display_data()
+        for indx in range(len(display_data)):
+            self.lines[indx][0].set_ydata(display_data[indx])
 
         if self.lock_xaxis and self.lock_yaxis:
             return
@@ -90,33 +104,51 @@ class MplPlot(FigureCanvas):
             axis='y'
         else:
             axis='both'
-        self.axes.relim()
-        # self.axes.set_ylim(auto=True)
-        # self.axes.autoscale_view()
-        self.axes.autoscale(axis=axis)
+        self.autoscale(axis=axis)
 
     def set_markers(self):
         if self.marker_posn is not None:
-            for plot_num in range(len(self.complex_data)):
-                self.markers[plot_num][0].set_data([self.marker_posn,], [apply_display_type(
-                    self.complex_data[plot_num][self.marker_posn], self.display_type),])
+            marker_values = self.get_display_data()[:, self.marker_posn]
+            for plot_num in range(len(marker_values)):
+                self.markers[plot_num][0].set_data([self.marker_posn,], [marker_values[plot_num],])
+
+    def autoscale(self, axis='both'):
+        # same limits as relim() followed by autoscale(), without visiting every line artist
+        display_data = self.get_display_data()
+        x_margin, y_margin = self.axes.margins()
+        if axis in ('x', 'both'):
+            self.axes.set_xlim(self.padded_limits(self.axes.xaxis, 0, display_data.shape[1] - 1, x_margin))
+        if axis in ('y', 'both'):
+            with np.errstate(invalid='ignore'), warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                y_min = np.nanmin(display_data)
+                y_max = np.nanmax(display_data)
+            if np.isfinite(y_min) and np.isfinite(y_max):
+                self.axes.set_ylim(self.padded_limits(self.axes.yaxis, y_min, y_max, y_margin))
+
+    @staticmethod
+    def padded_limits(axis, vmin, vmax, margin):
+        vmin, vmax = axis.get_major_locator().nonsingular(vmin, vmax)
+        padding = (vmax - vmin) * margin
+        return vmin - padding, vmax + padding
 
     def create_lines(self):
         self.lines = []
-        for indx in range(len(self.complex_data)):
-            self.lines.append(
-                self.axes.plot(apply_display_type(self.complex_data[indx], self.display_type), color=self.colors[indx]))
+        display_data = self.get_display_data()
+        for indx in range(len(display_data)):
+            self.lines.append(self.axes.plot(display_data[indx], color=self.colors[indx]))
         self.axes.set_xlim(0, self.complex_data[0].shape[0] - 1 + np.finfo('float').eps)
 
     def create_markers(self):
         if self.marker_posn is not None:
             self.markers = []
-            for plot_num in range(len(self.complex_data)):
-                self.markers.append(self.axes.plot(self.marker_posn, apply_display_type(
-                    self.complex_data[plot_num][self.marker_posn], self.display_type), 'kx'))
+            marker_values = self.get_display_data()[:, self.marker_posn]
+            for plot_num in range(len(marker_values)):
+                self.markers.append(self.axes.plot(self.marker_posn, marker_values[plot_num], 'kx'))
 
     def draw_lines_and_markers(self):
-        self.draw()
+        with profiling.stage('MplPlot.canvas.draw'):
+            self.draw()
 
     # Convenience methods
     def show_data_type_change(self, index):
@@ -0,0 +1,260 @@
+"""
+Work done on worker threads ahead of when the viewers need it.  Slices next to
+the one being viewed are read, display transformed and their statistics
+computed before they are requested, movie frames ahead of the playhead are
+colour-mapped, statistics of whole volumes are computed in chunks and exported
+movies are rendered.  Results are handed to the GUI thread through Qt signals,
+so the slice cache and the viewers are only ever touched from the GUI thread.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PyQt5 import QtCore
+
+from . import profiling
+from .export import MovieWriter
+from .image import MplImage
+from .signals import Signals
+from .statistics import compute_volume_statistics
+from .volume import quantise_volume
+
+
+class WorkerPool(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor that can cancel the work it has not started yet, which
+    shutdown(cancel_futures=True) only does from python 3.9.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.futures = set()
+        self.futures_lock = threading.Lock()
+
+    def submit(self, *args, **kwargs):
+        future = super().submit(*args, **kwargs)
+        with self.futures_lock:
+            self.futures.add(future)
+        future.add_done_callback(self.forget)
+        return future
+
+    def forget(self, future):
+        with self.futures_lock:
+            self.futures.discard(future)
+
+    def cancel_pending(self):
+        with self.futures_lock:
+            futures = list(self.futures)
+        for future in futures:
+            future.cancel()
+
+    def shutdown(self, wait=True):
+        self.cancel_pending()
+        super().shutdown(wait=wait)
+
+
+class SlicePrefetcher(Signals, QtCore.QObject):
+    def __init__(self, volumes, slice_cache, depth=2, max_workers=2):
+        QtCore.QObject.__init__(self)
+        self.volumes = volumes
+        self.slice_cache = slice_cache
+        self.depth = depth
+        self.executor = WorkerPool(max_workers=max_workers, thread_name_prefix='vidi3d-prefetch')
+        self.pending = set()
+        # incremented when the volumes change, slices prepared from an earlier generation are dropped
+        self.generation = 0
+        self.last_zt = None
+        # direction of the last z or t change, used to predict the next slices
+        self.direction = (1, 0)
+        self.sig_slice_ready.connect(self.store_slice)
+
+    def predict(self, z, t):
+        if self.last_zt is not None:
+            step = (int(np.sign(z - self.last_zt[0])), int(np.sign(t - self.last_zt[1])))
+            if any(step):
+                self.direction = step
+        self.last_zt = (z, t)
+        dz, dt = self.direction
+        neighbours = [(z + dz * k, t + dt * k) for k in range(1, self.depth + 1)]
+        # one slice behind in case the scroll direction reverses
+        neighbours.append((z - dz, t - dt))
+        nz, nt = self.volumes[0].shape[2:4]
+        return [(pz, pt) for pz, pt in neighbours if 0 <= pz < nz and 0 <= pt < nt]
+
+    def prefetch(self, z, t, display_type):
+        if self.depth <= 0:
+            return
+        for pz, pt in self.predict(z, t):
+            for indx in range(len(self.volumes)):
+                key = (indx, pz, pt, display_type)
+                if key in self.pending or key in self.slice_cache or display_type in self.volumes[indx].quantised:
+                    # quantised volumes are drawn from their codes without display transforming the slice
+                    continue
+                self.pending.add(key)
+                self.executor.submit(self.prepare_slice, self.generation, key)
+
+    def prepare_slice(self, generation, key):
+        # runs on a worker thread
+        indx, z, t, display_type = key
+        volume = self.volumes[indx]
+        try:
+            display_slice = MplImage.compute_display_slice(np.asarray(volume[:, :, z, t]), display_type,
+                                                           with_dynamic_range=volume.statistics is None)
+        except Exception:
+            display_slice = None
+        self.sig_slice_ready.emit(generation, key, display_slice)
+
+    def store_slice(self, generation, key, display_slice):
+        if generation != self.generation or key not in self.pending:
+            # prepared before the volumes changed
+            return
+        self.pending.discard(key)
+        if display_slice is not None:
+            self.slice_cache.put(key, display_slice)
+
+    def invalidate(self):
+        # slices being prepared are from data that has changed and will not be cached
+        self.generation += 1
+        self.pending.clear()
+        self.executor.cancel_pending()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class MovieFrameRenderer(Signals, QtCore.QObject):
+    def __init__(self, volumes, frame_cache, depth=8, max_workers=1):
+        QtCore.QObject.__init__(self)
+        self.volumes = volumes
+        self.frame_cache = frame_cache
+        self.depth = depth
+        self.executor = WorkerPool(max_workers=max_workers, thread_name_prefix='vidi3d-movie')
+        self.pending = set()
+        # as for SlicePrefetcher, frames rendered from an earlier generation of the volumes are dropped
+        self.generation = 0
+        self.sig_movie_frame_ready.connect(self.store_frame)
+
+    def prefetch(self, indx, z, frames, rgba_key, cmap):
+        # frames are the next frames to be played, rgba_key is MplImage.get_rgba_key()
+        for frame in frames[:self.depth]:
+            key = (indx, z, frame) + rgba_key
+            if key in self.pending or key in self.frame_cache:
+                continue
+            self.pending.add(key)
+            self.executor.submit(self.render_frame, self.generation, key, cmap)
+
+    def render_frame(self, generation, key, cmap):
+        # runs on a worker thread
+        indx, z, frame, display_type, vmin, vmax = key[:6]
+        try:
+            intensity_image, _ = MplImage.compute_display_slice(np.asarray(self.volumes[indx][:, :, z, frame]),
+                                                                display_type, with_dynamic_range=False)
+            rgba = MplImage.compute_rgba_frame(intensity_image, cmap, vmin, vmax)
+        except Exception:
+            rgba = None
+        self.sig_movie_frame_ready.emit(generation, key, rgba)
+
+    def store_frame(self, generation, key, rgba):
+        if generation != self.generation or key not in self.pending:
+            return
+        self.pending.discard(key)
+        if rgba is not None:
+            self.frame_cache.put(key, rgba)
+
+    def invalidate(self):
+        self.generation += 1
+        self.pending.clear()
+        self.executor.cancel_pending()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class StatisticsWorker(Signals, QtCore.QObject):
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self.executor = WorkerPool(max_workers=1, thread_name_prefix='vidi3d-statistics')
+        self.cancel_event = threading.Event()
+        # as for SlicePrefetcher, statistics of an earlier generation of the volumes are dropped
+        self.generation = 0
+        # (index, display type) of the volumes being quantised
+        self.pending = set()
+        self.sig_statistics_computed.connect(self.store_statistics)
+        self.sig_quantised_computed.connect(self.store_quantised)
+
+    def compute(self, indx, volume, background_threshold):
+        self.executor.submit(self.compute_statistics, self.generation, indx, volume, background_threshold)
+
+    def quantise(self, indx, volume, display_type, background_threshold):
+        # the statistics are computed first if the volume has none, and are reported too
+        if (indx, display_type) in self.pending:
+            return
+        self.pending.add((indx, display_type))
+        self.executor.submit(self.compute_quantised, self.generation, indx, volume, display_type,
+                             background_threshold)
+
+    def compute_statistics(self, generation, indx, volume, background_threshold):
+        # runs on a worker thread
+        volume_statistics = compute_volume_statistics(volume, background_threshold, cancel_event=self.cancel_event)
+        if volume_statistics is not None:
+            self.sig_statistics_computed.emit(generation, indx, volume_statistics)
+
+    def compute_quantised(self, generation, indx, volume, display_type, background_threshold):
+        # runs on a worker thread
+        volume_statistics = volume.statistics
+        if volume_statistics is None:
+            volume_statistics = compute_volume_statistics(volume, background_threshold,
+                                                          cancel_event=self.cancel_event)
+            if volume_statistics is None:
+                return
+            self.sig_statistics_computed.emit(generation, indx, volume_statistics)
+        with profiling.stage('quantise'):
+            quantised = quantise_volume(volume, volume_statistics, display_type)
+        self.sig_quantised_computed.emit(generation, indx, quantised)
+
+    def store_statistics(self, generation, indx, volume_statistics):
+        if generation == self.generation:
+            self.sig_volume_statistics_ready.emit(indx, volume_statistics)
+
+    def store_quantised(self, generation, indx, quantised):
+        if generation == self.generation:
+            self.pending.discard((indx, quantised.display_type))
+            self.sig_volume_quantised.emit(indx, quantised)
+
+    def invalidate(self):
+        self.generation += 1
+        self.pending.clear()
+        self.executor.cancel_pending()
+
+    def shutdown(self):
+        self.cancel_event.set()
+        self.executor.shutdown(wait=False)
+
+
+class MovieExportWorker(Signals, QtCore.QObject):
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self.executor = WorkerPool(max_workers=1, thread_name_prefix='vidi3d-movie-export')
+        self.cancel_event = threading.Event()
+
+    def export(self, fname, frames, num_frames, fps):
+        # frames is an iterator of RGBA frames, e.g. export.movie_frames, consumed on the worker thread
+        self.executor.submit(self.write_movie, fname, frames, num_frames, fps)
+
+    def write_movie(self, fname, frames, num_frames, fps):
+        # runs on a worker thread, frames are rendered here and encoded in another process
+        error = None
+        try:
+            with MovieWriter(fname, fps) as writer:
+                for rgba in frames:
+                    if self.cancel_event.is_set():
+                        raise RuntimeError(f'export of {fname} was cancelled')
+                    writer.write(rgba)
+                    self.sig_movie_export_progress.emit(writer.num_frames, num_frames)
+        except Exception as exception:
+            error = exception
+        self.sig_movie_export_finished.emit(fname, error)
+
+    def shutdown(self):
+        self.cancel_event.set()
+        self.executor.shutdown(wait=False)
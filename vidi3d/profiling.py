@@ -0,0 +1,223 @@
+"""
+Opt-in latency instrumentation of the viewers.  When enabled, the signal
+connected slots and render methods named by the instrumented viewer classes,
+and the named stages inside them, e.g. the display transform or the canvas
+draw, are timed.  Each name keeps a rolling
+histogram of its latest latencies, and every call is recorded as a Chrome
+trace event that can be saved and opened in chrome://tracing or Perfetto.
+
+Profiling is enabled by setting the VIDI3D_PROFILE environment variable, or by
+calling enable().  The slots of viewers opened before enable() is called are
+not timed.  If VIDI3D_PROFILE is the name of a .json file, the trace is
+saved to it when python exits.
+
+    VIDI3D_PROFILE=trace.json python script.py
+
+    from vidi3d import profiling
+    profiling.enable()
+    vidi3d.compare3d(images)
+    profiling.report()
+    profiling.save_trace('trace.json')
+"""
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+ENVIRONMENT_VARIABLE = 'VIDI3D_PROFILE'
+# upper edges in ms of the histogram bins, the last bin holds everything slower
+HISTOGRAM_EDGES = (1, 2, 4, 8, 16, 33, 66, 133, 266, 533, 1000)
+
+enabled = False
+_histograms = {}
+_trace_events = deque(maxlen=2 ** 20)
+_thread_names = {}
+_lock = threading.Lock()
+_epoch = time.perf_counter()
+_no_stage = contextlib.nullcontext()
+# classes decorated by instrument and the names of their methods to time
+_instrumented = []
+
+
+class LatencyHistogram:
+    """
+    Latencies in ms of the latest calls of a slot or stage, at most window of
+    them, and the number of calls since it was created.
+    """
+
+    def __init__(self, window=4096):
+        self.latencies = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, latency):
+        self.latencies.append(latency)
+        self.count += 1
+
+    def counts(self, edges=HISTOGRAM_EDGES):
+        # number of latencies in each bin, below the first edge up to above the last
+        return np.bincount(np.searchsorted(edges, list(self.latencies)), minlength=len(edges) + 1)
+
+    def summary(self):
+        latencies = np.array(self.latencies)
+        if latencies.size == 0:
+            return {'count': self.count}
+        p50, p90, p99 = np.percentile(latencies, (50, 90, 99))
+        return {'count': self.count,
+                'mean_ms': float(latencies.mean()),
+                'p50_ms': float(p50),
+                'p90_ms': float(p90),
+                'p99_ms': float(p99),
+                'max_ms': float(latencies.max())}
+
+
+def enable():
+    global enabled
+    enabled = True
+    for cls, names in _instrumented:
+        _wrap_methods(cls, names)
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    # forget the recorded latencies and trace events
+    with _lock:
+        _histograms.clear()
+        _trace_events.clear()
+
+
+def _record(name, category, start, end):
+    latency = (end - start) * 1e3
+    thread = threading.current_thread()
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = LatencyHistogram()
+        histogram.record(latency)
+        _thread_names[thread.ident] = thread.name
+        _trace_events.append({'name': name,
+                              'cat': category,
+                              'ph': 'X',
+                              'ts': (start - _epoch) * 1e6,
+                              'dur': latency * 1e3,
+                              'pid': os.getpid(),
+                              'tid': thread.ident})
+
+
+@contextlib.contextmanager
+def _timed(name, category):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, category, start, time.perf_counter())
+
+
+def stage(name):
+    """
+    Context manager timing a named stage of a slot.  It does nothing when
+    profiling is disabled.
+    """
+    if not enabled:
+        return _no_stage
+    return _timed(name, 'stage')
+
+
+def instrument(*names):
+    """
+    Class decorator naming the slots and render methods of the class that are
+    timed while profiling is enabled.  The class is left unchanged until
+    profiling is enabled, after which the methods are looked up in their timed
+    form when viewers connect them to signals.
+    """
+    def decorator(cls):
+        _instrumented.append((cls, names))
+        if enabled:
+            _wrap_methods(cls, names)
+        return cls
+
+    return decorator
+
+
+def _wrap_methods(cls, names):
+    for attribute in names:
+        function = cls.__dict__[attribute]
+        if not hasattr(function, 'profiling_name'):
+            setattr(cls, attribute, _timed_slot(function, f'{cls.__name__}.{attribute}'))
+
+
+def _timed_slot(function, name):
+    # PyQt only drops surplus signal arguments for slots it calls directly, so signals with more arguments than a
+    # timed slot takes must be connected through a lambda
+    @functools.wraps(function)
+    def timed_slot(*args, **kwargs):
+        if not enabled:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _record(name, 'slot', start, time.perf_counter())
+
+    timed_slot.profiling_name = name
+    return timed_slot
+
+
+def histograms():
+    # LatencyHistogram of every slot and stage called so far, by name
+    with _lock:
+        return dict(_histograms)
+
+
+def summary():
+    return {name: histogram.summary() for name, histogram in sorted(histograms().items())}
+
+
+def report(file=None):
+    """
+    Print the latency percentiles of every slot and stage, slowest p90 first.
+    """
+    file = sys.stdout if file is None else file
+    rows = sorted(summary().items(), key=lambda item: item[1].get('p90_ms', 0), reverse=True)
+    print(f'{"name":50s} {"count":>8s} {"mean":>9s} {"p50":>9s} {"p90":>9s} {"p99":>9s} {"max":>9s}', file=file)
+    for name, stats in rows:
+        if 'mean_ms' not in stats:
+            continue
+        print(f'{name:50s} {stats["count"]:8d} ' + ' '.join(f'{stats[key]:9.2f}' for key in
+                                                             ('mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')),
+              file=file)
+
+
+def save_trace(fname):
+    """
+    Save the recorded calls in the Chrome trace event format.
+    """
+    with _lock:
+        events = list(_trace_events)
+        thread_names = dict(_thread_names)
+    metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': ident, 'args': {'name': name}}
+                for ident, name in thread_names.items()]
+    with open(fname, 'w') as f:
+        json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+
+
+def _enable_from_environment():
+    value = os.environ.get(ENVIRONMENT_VARIABLE, '')
+    if value in ('', '0'):
+        return
+    enable()
+    if value.lower().endswith('.json'):
+        atexit.register(save_trace, value)
+
+
+_enable_from_environment()
@@ -0,0 +1,64 @@
+"""
+Multi-resolution levels of display slices.  Level n of a slice is the display
+slice downsampled 2**n times in x and y.  When a large slice is shown on a
+panel with fewer screen pixels than data pixels, a level with about one data
+pixel per screen pixel is drawn instead of the whole slice.
+"""
+import numpy as np
+
+from .definitions import ImageDisplayType
+from .helpers import apply_display_type
+
+
+def downsample2(image, display_type=ImageDisplayType.mag):
+    """
+    Halve both dimensions of a display slice by averaging 2x2 blocks.  Odd
+    sizes are padded by repeating the last row or column.  Phase values wrap
+    around, so they are subsampled instead of averaged.
+    """
+    nx, ny = image.shape[:2]
+    if nx % 2 or ny % 2:
+        image = np.pad(image, ((0, nx % 2), (0, ny % 2)), mode='edge')
+    if display_type == ImageDisplayType.phase:
+        return np.ascontiguousarray(image[::2, ::2])
+    downsampled = image[::2, ::2] + image[1::2, ::2]
+    downsampled += image[::2, 1::2]
+    downsampled += image[1::2, 1::2]
+    downsampled *= 0.25
+    return downsampled
+
+
+def downsample_display_slice(complex_image, display_type, chunk_bytes=64 * 2 ** 20):
+    # level 1 straight from the complex slice, display transformed a slab of rows at a time
+    nx, ny = complex_image.shape[:2]
+    row_bytes = max(ny * complex_image.dtype.itemsize, 1)
+    step = max(2, int(chunk_bytes // row_bytes) // 2 * 2)
+    level = np.empty(((nx + 1) // 2, (ny + 1) // 2), dtype=np.float32)
+    for start in range(0, nx, step):
+        rows = apply_display_type(np.asarray(complex_image[start:start + step]), display_type)
+        level[start // 2:(start + step + 1) // 2] = downsample2(rows.astype(np.float32, copy=False), display_type)
+    return level
+
+
+def level_bounds(crop, shape, level):
+    """
+    Bounds in level pixels of the pixels covering crop, given as (x0, x1, y0,
+    y1) in slice pixels or None for the whole slice.
+    """
+    nx, ny = shape[:2]
+    x0, x1, y0, y1 = crop if crop is not None else (0, nx, 0, ny)
+    scale = 2 ** level
+    return x0 // scale, -(-x1 // scale), y0 // scale, -(-y1 // scale)
+
+
+def pyramid_level(view_size, screen_size, max_level):
+    """
+    Highest level that still has at least one level pixel per screen pixel,
+    given the (x, y) size of the view in slice pixels and on screen.
+    """
+    if min(screen_size) <= 0:
+        return 0
+    density = min(view / screen for view, screen in zip(view_size, screen_size))
+    if density < 2:
+        return 0
+    return int(min(np.log2(density), max_level))
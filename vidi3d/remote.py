@@ -0,0 +1,411 @@
+"""
+Viewers that run in a child process, so that analysis in the calling
+interpreter and the GUI do not hold each other up.  Images are handed to the
+child in shared memory instead of being pickled.  Arrays created with
+shared_array are shared without a copy, volumes memory-mapped from a file are
+mapped again by the child, and other arrays are copied into shared memory
+once.  Commands such as moving the cursor, showing new data or closing the
+viewer are sent over a pipe.
+
+    from vidi3d import remote
+    images = remote.shared_array((256, 256, 64), np.complex64)
+    viewer = remote.compare3d(images)
+    images[...] = reconstruct(raw)
+    viewer.refresh()
+    viewer.set_location(z=10)
+    viewer.close()
+
+Shared arrays and writeable memory-mapped volumes are live: the viewer shows
+changes made to them by the caller after refresh() is called.  Pass
+snapshot=True to copy them when the viewer is opened instead.
+"""
+import atexit
+import mmap
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import traceback
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from .volume import Volume
+
+AUTHKEY_VARIABLE = 'VIDI3D_REMOTE_AUTHKEY'
+# methods of the viewers that can be called through a RemoteViewer
+REMOTE_METHODS = ('set_location', 'set_image', 'refresh', 'setWindowTitle', 'close')
+
+# viewers are kept open when the caller drops its RemoteViewer, as non-blocking viewers are
+_open_viewers = set()
+
+
+class SharedArray(np.ndarray):
+    """
+    ndarray in a shared memory block, see shared_array.  Views of it keep the
+    block alive and are passed to remote viewers without a copy.
+    """
+
+    def __array_finalize__(self, obj):
+        self.shared_memory = getattr(obj, 'shared_memory', None)
+
+
+def _unlink(name):
+    try:
+        block = shared_memory.SharedMemory(name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def shared_array(shape, dtype=np.float64):
+    """
+    Return a zero filled array in a new shared memory block.  The block is
+    freed when the array and all views of it are deleted.
+    """
+    dtype = np.dtype(dtype)
+    block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    weakref.finalize(block, _unlink, block.name)
+    array = np.ndarray(shape, dtype, buffer=block.buf).view(SharedArray)
+    array.shared_memory = block
+    return array
+
+
+def as_shared(array):
+    # copy of array in shared memory
+    array = np.asanyarray(array)
+    shared = shared_array(array.shape, array.dtype)
+    shared[...] = array
+    return shared
+
+
+def _byte_bounds(array):
+    low = high = array.__array_interface__['data'][0]
+    for size, stride in zip(array.shape, array.strides):
+        if stride < 0:
+            low += (size - 1) * stride
+        else:
+            high += (size - 1) * stride
+    return low, high + array.itemsize
+
+
+def _shared_memory_spec(array):
+    # results of operations on a SharedArray are SharedArrays too, but are not in its block
+    block = array.shared_memory
+    if block is None or array.size == 0:
+        return None
+    start = np.frombuffer(block.buf, np.uint8).__array_interface__['data'][0]
+    low, high = _byte_bounds(array)
+    if low < start or high > start + block.size:
+        return None
+    offset = array.__array_interface__['data'][0] - start
+    return 'shared_memory', block.name, offset, array.shape, array.strides, array.dtype
+
+
+def _memmap_spec(array):
+    mapping = getattr(array, '_mmap', None)
+    if mapping is None or array.filename is None or array.size == 0:
+        return None
+    start = np.frombuffer(mapping, np.uint8).__array_interface__['data'][0]
+    # np.memmap maps the file from the allocation boundary below its offset
+    offset = array.offset - array.offset % mmap.ALLOCATIONGRANULARITY
+    offset += array.__array_interface__['data'][0] - start
+    return 'memmap', array.filename, offset, array.shape, array.strides, array.dtype
+
+
+def share(array, snapshot=False, copies=None):
+    """
+    Description of array that a remote viewer uses to map it.  Arrays that
+    cannot be shared, or must be copied because of snapshot, are copied into
+    shared memory, and the copy is appended to copies to keep it alive until
+    the viewer has mapped it.
+    """
+    if isinstance(array, Volume):
+        array = array.data
+    array = np.asanyarray(array)
+    spec = None
+    if isinstance(array, np.memmap):
+        # read-only mappings cannot change, so they are shared even for a snapshot
+        if array.mode == 'r' or (array.mode in ('r+', 'w+') and not snapshot):
+            spec = _memmap_spec(array)
+    elif isinstance(array, SharedArray) and not snapshot:
+        spec = _shared_memory_spec(array)
+    if spec is None:
+        copy = as_shared(array)
+        if copies is not None:
+            copies.append(copy)
+        spec = _shared_memory_spec(copy)
+    return spec
+
+
+def attach(spec, blocks):
+    """
+    Read-only array described by share.  Shared memory blocks are appended to
+    blocks, they must stay open while the array is used.
+    """
+    kind, name, offset, shape, strides, dtype = spec
+    if kind == 'shared_memory':
+        if sys.version_info >= (3, 13):
+            block = shared_memory.SharedMemory(name, track=False)
+        else:
+            block = shared_memory.SharedMemory(name)
+            # the block belongs to the caller, the resource tracker of this process must not free it at exit
+            resource_tracker.unregister(block._name, 'shared_memory')
+        blocks.append(block)
+        buffer = block.buf
+    else:
+        buffer = np.memmap(name, np.uint8, mode='r')
+    array = np.ndarray(shape, dtype, buffer=buffer, offset=offset, strides=strides)
+    array.flags.writeable = False
+    return array
+
+
+class RemoteViewer:
+    """
+    A viewer running in a child process, returned by the viewer functions of
+    this module.  Its methods are sent to the viewer and wait for it to carry
+    them out.
+    """
+
+    def __init__(self, viewer_function, data, overlays=None, snapshot=False, connect_timeout=60, **kwargs):
+        self.viewer_function = viewer_function
+        self.snapshot = snapshot
+        self.lock = threading.Lock()
+        authkey = secrets.token_bytes(32)
+        listener = Listener(authkey=authkey)
+        environment = dict(os.environ)
+        environment[AUTHKEY_VARIABLE] = authkey.hex()
+        # the child imports this copy of vidi3d
+        package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        environment['PYTHONPATH'] = os.pathsep.join(filter(None, [package_parent, os.environ.get('PYTHONPATH')]))
+        self.process = subprocess.Popen([sys.executable, '-m', 'vidi3d.remote', listener.address], env=environment)
+        try:
+            self.connection = self.accept(listener, connect_timeout)
+        finally:
+            listener.close()
+
+        copies = []
+        data = [data] if isinstance(data, (np.ndarray, Volume)) else list(data)
+        specs = [share(image, snapshot, copies) for image in data]
+        if overlays is not None:
+            overlays = [overlays] if isinstance(overlays, np.ndarray) else list(overlays)
+            overlays = [None if overlay is None else share(overlay, snapshot, copies) for overlay in overlays]
+        try:
+            with self.lock:
+                self.connection.send((viewer_function, specs, overlays, kwargs))
+                self.receive_reply(viewer_function)
+        except RuntimeError:
+            self.connection.close()
+            self.process.wait()
+            raise
+        # the viewer has mapped the copies, which are freed here and stay in memory while it has them open
+        del copies
+        _open_viewers.add(self)
+
+    def accept(self, listener, timeout):
+        # wait for the child to connect, giving up if it exits first
+        connection = []
+        thread = threading.Thread(target=lambda: connection.append(listener.accept()), daemon=True)
+        thread.start()
+        waited = 0.0
+        while thread.is_alive() and self.process.poll() is None and waited < timeout:
+            thread.join(0.1)
+            waited += 0.1
+        if not connection:
+            self.process.kill()
+            raise RuntimeError(f'the viewer process did not start, exit status {self.process.wait()}')
+        return connection[0]
+
+    def receive_reply(self, method):
+        try:
+            status, value = self.connection.recv()
+        except (EOFError, OSError):
+            raise RuntimeError('the viewer has been closed') from None
+        if status == 'error':
+            raise RuntimeError(f'{method} failed in the viewer process\n{value}')
+        return value
+
+    def call(self, method, *args, image=None, **kwargs):
+        """
+        Call a method of the viewer with the given arguments, followed by image
+        if it is given, which is passed in shared memory.
+        """
+        copies = []
+        spec = None if image is None else share(image, self.snapshot, copies)
+        with self.lock:
+            try:
+                self.connection.send((method, args, kwargs, spec))
+            except (EOFError, OSError):
+                raise RuntimeError('the viewer has been closed') from None
+            return self.receive_reply(method)
+
+    def set_location(self, x=None, y=None, z=None, t=None):
+        self.call('set_location', x, y, z, t)
+
+    @property
+    def location(self):
+        # (x, y, z, t) of the cursor
+        return self.call('get_location')
+
+    def set_image(self, image, indx=0):
+        """
+        Show image, in panel indx of a compare viewer.  It must have the same
+        number of values as the image it replaces.
+        """
+        if self.viewer_function == 'imshow3d':
+            self.call('set_image', image=image)
+        else:
+            self.call('set_image', indx, image=image)
+
+    def refresh(self):
+        # redraw after shared data was changed in place
+        self.call('refresh')
+
+    def set_window_title(self, title):
+        self.call('setWindowTitle', title)
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def wait(self, timeout=None):
+        # wait for the viewer to be closed and return the exit status of its process
+        return self.process.wait(timeout)
+
+    def close(self, timeout=10):
+        if self.is_alive():
+            try:
+                self.call('close')
+            except RuntimeError:
+                pass
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.connection.close()
+        _open_viewers.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@atexit.register
+def close_all():
+    for viewer in list(_open_viewers):
+        viewer.close()
+
+
+def imshow3d(data, snapshot=False, **kwargs):
+    """
+    imshow3d in a child process, see vidi3d.imshow3d for the keyword arguments.
+    Returns a RemoteViewer.
+    """
+    return RemoteViewer('imshow3d', data, snapshot=snapshot, **kwargs)
+
+
+def compare2d(data, overlays=None, snapshot=False, **kwargs):
+    """
+    compare2d in a child process, see vidi3d.compare2d for the keyword
+    arguments.  Returns a RemoteViewer.
+    """
+    return RemoteViewer('compare2d', data, overlays, snapshot, **kwargs)
+
+
+def compare3d(data, overlays=None, snapshot=False, **kwargs):
+    """
+    compare3d in a child process, see vidi3d.compare3d for the keyword
+    arguments.  Returns a RemoteViewer.
+    """
+    return RemoteViewer('compare3d', data, overlays, snapshot, **kwargs)
+
+
+def open_viewer(viewer_function, images, overlays, kwargs):
+    from . import viewers
+    from .core import start_viewer
+    from .imshow.main import Imshow3d
+
+    if viewer_function == 'imshow3d':
+        # viewers.imshow3d would take a snapshot of the shared data
+        image = images[0] if images[0].ndim == 4 else images[0][..., np.newaxis]
+        viewer = start_viewer(Imshow3d(image, **kwargs), block=False)
+    else:
+        viewer = getattr(viewers, viewer_function)(images, overlays=overlays, block=False, **kwargs)
+    viewer.show()
+    return viewer
+
+
+def get_location(viewer):
+    loc = viewer.loc if hasattr(viewer, 'loc') else viewer.image4d.cursor_loc
+    return int(loc.x), int(loc.y), int(loc.z), int(loc.t)
+
+
+def serve(connection, poll_interval=20):
+    """
+    Open the viewer requested over connection and carry out the commands sent
+    to it until it is closed.  Runs in the child process.
+    """
+    from PyQt5 import QtCore
+
+    from . import core
+
+    blocks = []
+    viewer_function, specs, overlay_specs, kwargs = connection.recv()
+    try:
+        images = [attach(spec, blocks) for spec in specs]
+        overlays = None
+        if overlay_specs is not None:
+            overlays = [None if spec is None else attach(spec, blocks) for spec in overlay_specs]
+        viewer = open_viewer(viewer_function, images, overlays, kwargs)
+    except Exception:
+        connection.send(('error', traceback.format_exc()))
+        return 1
+    connection.send(('ok', None))
+
+    def receive():
+        try:
+            while connection.poll():
+                method, args, kwargs, spec = connection.recv()
+                try:
+                    if method == 'get_location':
+                        value = get_location(viewer)
+                    elif method in REMOTE_METHODS:
+                        if spec is not None:
+                            args = args + (attach(spec, blocks),)
+                        value = getattr(viewer, method)(*args, **kwargs)
+                    else:
+                        raise ValueError(f'{method} cannot be called remotely')
+                except Exception:
+                    connection.send(('error', traceback.format_exc()))
+                else:
+                    connection.send(('ok', value))
+        except (EOFError, OSError):
+            # the caller has exited, the viewer goes with it as a non-blocking viewer would
+            timer.stop()
+            viewer.close()
+
+    timer = QtCore.QTimer()
+    timer.timeout.connect(receive)
+    timer.start(poll_interval)
+    core.create_qapp().exec_()
+    return 0
+
+
+def main(address):
+    authkey = bytes.fromhex(os.environ.pop(AUTHKEY_VARIABLE))
+    connection = Client(address, authkey=authkey)
+    return serve(connection)
+
+
+if __name__ == '__main__':
+    status = main(sys.argv[1])
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # skip interpreter teardown, the mapped arrays are still exported from their shared memory blocks
+    os._exit(status)
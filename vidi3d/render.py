@@ -0,0 +1,177 @@
+"""
+Raster engine that draws image slices with Qt instead of matplotlib.  The
+display slice is mapped through a colour lookup table into an RGBA buffer that
+is painted by QPainter underneath the transparent matplotlib canvas, so cursor
+lines, titles, overlays and toolbars are still drawn by matplotlib but the image
+itself skips normalisation, colour mapping and Agg resampling.  Qt is imported
+when a slice is first painted, so ColourLUT can be used by vidi3d.export
+without loading it.
+"""
+import numpy as np
+
+# images are painted without smoothing for these interpolation values
+NEAREST_INTERPOLATIONS = ('none', 'nearest', 'antialiased', None)
+
+
+class ColourLUT:
+    """
+    Colours of a colormap at size evenly spaced values between vmin and vmax,
+    stored as uint8 RGBA.  One extra entry holds the colour for NaN values.
+    """
+
+    def __init__(self, cmap, vmin=0.0, vmax=1.0, size=4096):
+        self.size = size
+        self.cmap = None
+        self.table = None
+        self.vmin = vmin
+        self.vmax = vmax
+        self.set_cmap(cmap)
+
+    def set_cmap(self, cmap):
+        # the table only depends on the colormap, window/level changes only rescale the indices
+        if cmap is self.cmap:
+            return
+        self.cmap = cmap
+        table = np.empty((self.size + 1, 4), dtype=np.uint8)
+        table[:-1] = cmap((np.arange(self.size) + 0.5) / self.size, bytes=True)
+        table[-1] = cmap(np.nan, bytes=True)
+        self.table = table
+
+    def set_clim(self, vmin, vmax):
+        self.vmin = vmin
+        self.vmax = vmax
+
+    def indices(self, values):
+        scale = (self.size / (self.vmax - self.vmin)) if self.vmax > self.vmin else 0.0
+        scaled = np.subtract(values, self.vmin, dtype=np.float32)
+        scaled *= scale
+        np.clip(scaled, 0, self.size - 1, out=scaled)
+        with np.errstate(invalid='ignore'):
+            indices = scaled.astype(np.uint16)
+        nan = np.isnan(values)
+        if nan.any():
+            indices[nan] = self.size
+        return indices
+
+    def __call__(self, values):
+        return np.take(self.table, self.indices(values), axis=0)
+
+
+class LUTRenderer:
+    """
+    Renders the data of an AxesImage into a QImage.  The image artist keeps its
+    data and limits but is hidden; the renderer is told about every change to
+    the data, colour limits and colormap and paints the image when the canvas
+    is painted.
+    """
+
+    def __init__(self, img, lut_size=4096):
+        self.img = img
+        vmin, vmax = img.get_clim()
+        self.lut = ColourLUT(img.get_cmap(), vmin, vmax, lut_size)
+        self.values = None
+        # uint16 codes of a QuantisedVolume slice and the colour of every code
+        self.codes = None
+        self.code_values = None
+        self.code_table = None
+        self.rgba = None
+        self.qimage = None
+        self.mirrored_qimage = None
+        self.mirrored = None
+        # values and codes are colour-mapped when they are next painted, once for any number of changes
+        self.stale = False
+
+    def set_data(self, data):
+        # data is either the display slice, mapped through the LUT, or an already colour-mapped RGBA frame
+        data = np.asarray(data)
+        self.codes = None
+        if data.ndim == 3:
+            self.values = None
+            self.set_rgba(data)
+        else:
+            self.values = data
+            self.stale = True
+
+    def set_codes(self, codes, code_values):
+        # codes of a quantised slice, drawn with one colour lookup per pixel
+        self.values = None
+        self.codes = codes
+        if code_values is not self.code_values:
+            self.code_values = code_values
+            self.code_table = None
+        self.stale = True
+
+    def set_clim(self, vmin, vmax):
+        # only the colour of each code changes, the codes are looked up when the image is painted
+        self.lut.set_clim(vmin, vmax)
+        self.code_table = None
+        self.stale = self.codes is not None or self.values is not None
+
+    def set_cmap(self, cmap):
+        self.lut.set_cmap(cmap)
+        self.code_table = None
+        self.stale = self.codes is not None or self.values is not None
+
+    def render(self):
+        self.stale = False
+        if self.codes is not None:
+            # the size of the code table is fixed, so rebuilding it does not depend on the image size
+            # each RGBA colour is gathered as one uint32
+            if self.code_table is None:
+                self.code_table = np.ascontiguousarray(self.lut(self.code_values)).view(np.uint32).ravel()
+            rgba = np.take(self.code_table, self.codes)
+            self.set_rgba(rgba.view(np.uint8).reshape(rgba.shape + (4,)))
+        elif self.values is not None:
+            self.set_rgba(self.lut(self.values))
+
+    def set_rgba(self, rgba):
+        from PyQt5 import QtGui
+
+        # the QImage refers to the buffer of self.rgba, which must stay alive while it is painted
+        self.rgba = np.ascontiguousarray(rgba, dtype=np.uint8)
+        height, width = self.rgba.shape[:2]
+        self.qimage = QtGui.QImage(self.rgba.data, width, height, 4 * width, QtGui.QImage.Format_RGBA8888)
+        self.mirrored_qimage = None
+
+    def get_qimage(self, horizontal, vertical):
+        if self.mirrored_qimage is None or self.mirrored != (horizontal, vertical):
+            self.mirrored = (horizontal, vertical)
+            if horizontal or vertical:
+                self.mirrored_qimage = self.qimage.mirrored(horizontal, vertical)
+            else:
+                self.mirrored_qimage = self.qimage
+        return self.mirrored_qimage
+
+    def paint(self, painter, canvas):
+        from PyQt5 import QtCore, QtGui
+
+        if self.stale:
+            self.render()
+        if self.qimage is None:
+            return
+        axes = self.img.axes
+        ratio = canvas.device_pixel_ratio
+        height = canvas.figure.bbox.height
+
+        def to_widget(points):
+            # display coordinates are physical pixels from the bottom left, the widget uses logical pixels from the top left
+            points = np.atleast_2d(points)
+            return np.column_stack((points[:, 0] / ratio, (height - points[:, 1]) / ratio))
+
+        (ax0, ay0), (ax1, ay1) = to_widget(axes.bbox.get_points())
+        clip = QtCore.QRectF(min(ax0, ax1), min(ay0, ay1), abs(ax1 - ax0), abs(ay1 - ay0))
+        painter.fillRect(clip, QtGui.QColor.fromRgbF(*axes.patch.get_facecolor()))
+
+        left, right, bottom, top = self.img.get_extent()
+        # origin 'lower' puts the first row of the data at the bottom of the extent
+        first_row, last_row = (bottom, top) if self.img.origin == 'lower' else (top, bottom)
+        (x0, y0), (x1, y1) = to_widget(axes.transData.transform([[left, first_row], [right, last_row]]))
+        target = QtCore.QRectF(min(x0, x1), min(y0, y1), abs(x1 - x0), abs(y1 - y0))
+        qimage = self.get_qimage(bool(x0 > x1), bool(y0 > y1))
+
+        painter.save()
+        painter.setClipRect(clip)
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform,
+                              self.img.get_interpolation() not in NEAREST_INTERPOLATIONS)
+        painter.drawImage(target, qimage)
+        painter.restore()
@@ -0,0 +1,74 @@
+"""
+ROI masks and ROI statistics.  Lasso contours are rasterised with a scanline
+even-odd fill restricted to the bounding box of each contour, which gives the
+same result as testing every pixel centre with
+matplotlib.path.Path.contains_points.  ROI statistics only read and transform
+the voxels inside the mask.
+"""
+import numpy as np
+
+from .helpers import apply_display_type
+
+
+def rasterize_polygon(verts, shape):
+    """
+    Mask of the pixels [x, y] whose centres lie inside the closed polygon verts.
+
+    Returns the slices of the polygon's bounding box within an array of the given
+    shape and the mask of that bounding box.
+    """
+    verts = np.asarray(verts, dtype=float).reshape(-1, 2)
+    empty = (slice(0, 0), slice(0, 0)), np.zeros((0, 0), dtype=bool)
+    if len(verts) < 3 or not np.all(np.isfinite(verts)):
+        return empty
+    xa, ya = verts[:, 0], verts[:, 1]
+    x0 = max(int(np.floor(xa.min())), 0)
+    x1 = min(int(np.ceil(xa.max())) + 1, shape[0])
+    y0 = max(int(np.floor(ya.min())), 0)
+    y1 = min(int(np.ceil(ya.max())) + 1, shape[1])
+    if x1 <= x0 or y1 <= y0:
+        return empty
+    width = x1 - x0
+
+    # edges from each vertex to the next, the polygon is closed if it isn't already
+    xb, yb = np.roll(xa, -1), np.roll(ya, -1)
+    rows = np.arange(y0, y1)
+    # half open rule so a vertex on a scanline is only counted once and horizontal edges are skipped
+    crosses = (rows[:, None] > np.minimum(ya, yb)) & (rows[:, None] <= np.maximum(ya, yb))
+    row, edge = np.nonzero(crosses)
+    x_cross = xa[edge] + (rows[row] - ya[edge]) * (xb[edge] - xa[edge]) / (yb[edge] - ya[edge])
+
+    # a pixel is inside if an odd number of edges cross its scanline to the right of it.
+    # pixels exactly on an edge belong to the polygon for upward edges, as in contains_points
+    last_left = np.where(yb[edge] > ya[edge], np.floor(x_cross), np.ceil(x_cross) - 1).astype(int) - x0
+    keep = last_left >= 0
+    toggles = np.zeros((len(rows), width), dtype=np.int32)
+    np.add.at(toggles, (row[keep], np.minimum(last_left[keep], width - 1)), 1)
+    inside = np.cumsum(toggles[:, ::-1], axis=1)[:, ::-1] % 2 == 1
+    return (slice(x0, x1), slice(y0, y1)), inside.T
+
+
+def roi_values(volume, mask, display_type, t):
+    """
+    Display values of the voxels in the (x, y, z) mask at time point t.  Only the
+    masked voxels are read and transformed.
+    """
+    return apply_display_type(volume[np.nonzero(mask) + (t,)], display_type)
+
+
+def roi_mean_timecourse(volume, mask, display_type, chunk_bytes=64 * 2 ** 20):
+    """
+    Mean display value of the voxels in the (x, y, z) mask at every time point.
+
+    The masked voxels are gathered a few time points at a time, so the memory
+    used is proportional to the size of the ROI rather than the volume.
+    """
+    indices = np.nonzero(mask)
+    num_voxels = len(indices[0])
+    num_frames = volume.shape[3]
+    t_step = int(max(1, chunk_bytes // max(num_voxels * volume.dtype.itemsize, 1)))
+    timecourse = np.empty(num_frames)
+    for t in range(0, num_frames, t_step):
+        values = apply_display_type(volume[indices + (slice(t, t + t_step),)], display_type)
+        timecourse[t:t + t_step] = values.mean(axis=0)
+    return timecourse
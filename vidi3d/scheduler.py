@@ -0,0 +1,51 @@
+"""
+Coalescing of high-rate updates.  Mouse motion can emit cursor and window/level
+changes much faster than the viewers can redraw.  Instead of running every
+update, the UpdateScheduler keeps only the latest arguments of each slot and
+runs the pending slots once per display frame.
+"""
+import functools
+from collections import OrderedDict
+
+from PyQt5 import QtCore
+
+
+class UpdateScheduler(QtCore.QObject):
+    def __init__(self, parent=None, interval=16):
+        super(UpdateScheduler, self).__init__(parent)
+        self.pending = OrderedDict()
+        self.coalesced_slots = {}
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.flush)
+
+    def schedule(self, slot, *args):
+        # later calls replace the arguments of a pending call, the slot keeps its place in the queue
+        self.pending[slot] = args
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def coalesced(self, slot):
+        """
+        Return a callable that schedules slot instead of calling it.  The same
+        callable is returned for the same slot, so it can be used to disconnect
+        a signal connected with it.
+        """
+        if slot not in self.coalesced_slots:
+            self.coalesced_slots[slot] = functools.partial(self.schedule, slot)
+        return self.coalesced_slots[slot]
+
+    def discard(self, slot):
+        self.pending.pop(slot, None)
+
+    def flush(self):
+        self.timer.stop()
+        pending = self.pending
+        self.pending = OrderedDict()
+        for slot, args in pending.items():
+            slot(*args)
+
+    def clear(self):
+        self.timer.stop()
+        self.pending.clear()
@@ -34,6 +34,8 @@ class Signals:
     sig_movie_init = QtCore.pyqtSignal(int)
     sig_movie_destruct = QtCore.pyqtSignal(int)
     sig_movie_interval_change = QtCore.pyqtSignal(int)
+    sig_movie_playback_mode_change = QtCore.pyqtSignal(int)
+    sig_movie_export = QtCore.pyqtSignal()
 
     sig_overlay_lower_thresh_change = QtCore.pyqtSignal(float, float)
     sig_overlay_upper_thresh_change = QtCore.pyqtSignal(float, float)
@@ -41,3 +43,12 @@ class Signals:
 
     sig_lock_plots_x_change = QtCore.pyqtSignal()
     sig_lock_plots_y_change = QtCore.pyqtSignal()
+
+    sig_slice_ready = QtCore.pyqtSignal(int, object, object)
+    sig_movie_frame_ready = QtCore.pyqtSignal(int, object, object)
+    sig_statistics_computed = QtCore.pyqtSignal(int, int, object)
+    sig_volume_statistics_ready = QtCore.pyqtSignal(int, object)
+    sig_quantised_computed = QtCore.pyqtSignal(int, int, object)
+    sig_volume_quantised = QtCore.pyqtSignal(int, object)
+    sig_movie_export_progress = QtCore.pyqtSignal(int, int)
+    sig_movie_export_finished = QtCore.pyqtSignal(str, object)
@@ -0,0 +1,271 @@
+"""
+Image statistics used to choose default window/level values.  Statistics are
+estimated from a strided subsample of the data, and the iterative background
+removal used for the default level is done on sorted values so each iteration
+is a binary search instead of a pass over the data.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .definitions import ImageDisplayType
+
+# upper bound on the number of values used to estimate statistics
+MAX_SAMPLES = 2 ** 16
+
+
+def strided_sample(data, max_samples=MAX_SAMPLES):
+    # take every n-th value along each axis so that the sample is spread over the whole image
+    data = np.asarray(data)
+    if data.size <= max_samples or data.ndim == 0:
+        return np.ravel(data)
+    step = int(np.ceil((data.size / max_samples) ** (1.0 / data.ndim)))
+    return np.ravel(data[(slice(None, None, step),) * data.ndim])
+
+
+def valid_values(values):
+    # ignore background zeros and non-finite values
+    return values[np.isfinite(values) & (values != 0)]
+
+
+def dynamic_range_of_valid(values, n_stdv=3):
+    if values.size == 0:
+        return 1
+    stdv = values.std(dtype=np.float64)
+    # for masks, stdv of valid values is 0 but we still want a dynamic range
+    if stdv == 0:
+        return 1
+    return n_stdv * stdv
+
+
+def default_level_of_valid(values, background_threshold=0.05):
+    """
+    Median of values after iteratively removing low background values.
+
+    Values whose absolute value is below background_threshold times the mean
+    absolute value are removed, the mean is recalculated and the process is
+    repeated until the mean changes by less than 10%.
+    """
+    n = values.size
+    if n == 0:
+        return 0
+    abs_sorted = np.sort(np.abs(values))
+    cumulative = np.concatenate(([0], np.cumsum(abs_sorted, dtype=np.float64)))
+    start = 0
+    mean_prev = np.inf
+    mean = cumulative[-1] / n
+    max_iter = 25
+    count = 0
+    while np.abs((mean_prev - mean) / mean) > 0.1 and count < max_iter:
+        # values above the threshold are a suffix of the sorted absolute values
+        new_start = np.searchsorted(abs_sorted, mean * background_threshold, side='right')
+        if new_start == n:
+            break
+        start = new_start
+        mean_prev = mean
+        mean = (cumulative[-1] - cumulative[start]) / (n - start)
+        count += 1
+    threshold = abs_sorted[start - 1] if start else -np.inf
+
+    # median of the kept values, which are the two tails of the sorted values
+    signed_sorted = np.sort(values)
+    lower = np.searchsorted(signed_sorted, -threshold, side='left')
+    upper = np.searchsorted(signed_sorted, threshold, side='right') if start else lower
+    num_kept = lower + n - upper
+
+    def kept_value(position):
+        return signed_sorted[position] if position < lower else signed_sorted[upper + position - lower]
+
+    return 0.5 * (kept_value((num_kept - 1) // 2) + kept_value(num_kept // 2))
+
+
+def dynamic_range(img, max_samples=MAX_SAMPLES):
+    return dynamic_range_of_valid(valid_values(strided_sample(img, max_samples)))
+
+
+def default_level(img, background_threshold=0.05, max_samples=MAX_SAMPLES):
+    return default_level_of_valid(valid_values(strided_sample(img, max_samples)), background_threshold)
+
+
+def default_window_levels(complex_image, background_threshold=0.05, max_samples=MAX_SAMPLES):
+    """
+    Default window and level for every display type, indexed by ImageDisplayType.
+
+    The complex data is sampled once and the real, imaginary and magnitude
+    statistics are all computed from that sample.
+    """
+    sample = strided_sample(complex_image, max_samples)
+    sample = sample[np.isfinite(sample)]
+    windows = np.ones(4)
+    levels = np.zeros(4)
+    for display_type, values in ((ImageDisplayType.real, np.real(sample)),
+                                 (ImageDisplayType.imag, np.imag(sample)),
+                                 (ImageDisplayType.mag, np.abs(sample))):
+        values = values[values != 0]
+        levels[display_type] = default_level_of_valid(values, background_threshold)
+        windows[display_type] = dynamic_range_of_valid(values)
+    levels[ImageDisplayType.phase] = 0.0
+    windows[ImageDisplayType.phase] = 2.0 * np.pi
+    return windows, levels
+
+
+class VolumeStatistics:
+    """
+    Statistics of every display type of a volume, indexed by ImageDisplayType.
+
+    Count, mean, standard deviation, minimum and maximum are exact.  Histograms,
+    percentiles and the default level are computed from a strided sample taken
+    from every chunk of the volume.
+    """
+    percentile_ranks = (1, 5, 25, 50, 75, 95, 99)
+
+    def __init__(self, count, mean, std, minimum, maximum, histograms, percentiles, levels, windows):
+        self.count = count
+        self.mean = mean
+        self.std = std
+        self.min = minimum
+        self.max = maximum
+        self.histograms = histograms
+        self.percentiles = percentiles
+        self.levels = levels
+        self.windows = windows
+
+    @property
+    def dynamic_range(self):
+        # same definition as dynamic_range_of_valid, used to scale mouse window/level changes
+        return np.where(self.std > 0, 3 * self.std, 1)
+
+
+def chunk_z_step(volume, chunk_bytes):
+    nx, ny, nz = volume.shape[:3]
+    slice_bytes = nx * ny * volume.dtype.itemsize
+    return int(max(1, min(nz, chunk_bytes // max(slice_bytes, 1))))
+
+
+def iter_chunks(volume, chunk_bytes=64 * 2 ** 20):
+    # slabs of consecutive z slices for every time point of a (x, y, z, t) volume
+    nz, nt = volume.shape[2:4]
+    z_step = chunk_z_step(volume, chunk_bytes)
+    for t in range(nt):
+        for z in range(0, nz, z_step):
+            yield np.asarray(volume[:, :, z:z + z_step, t])
+
+
+def compute_volume_statistics(volume, background_threshold=0.05, chunk_bytes=64 * 2 ** 20,
+                              max_samples=4 * MAX_SAMPLES, num_bins=256, cancel_event=None):
+    """
+    Compute VolumeStatistics one chunk at a time.  Returns None if cancel_event
+    is set before all chunks are read.
+    """
+    nz, nt = volume.shape[2:4]
+    num_chunks = nt * int(np.ceil(nz / chunk_z_step(volume, chunk_bytes)))
+    samples_per_chunk = max(1, max_samples // num_chunks)
+
+    count = np.zeros(4)
+    total = np.zeros(4)
+    total_sq = np.zeros(4)
+    minimum = np.full(4, np.inf)
+    maximum = np.full(4, -np.inf)
+    samples = [[] for _ in range(4)]
+    for chunk in iter_chunks(volume, chunk_bytes):
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        finite = np.isfinite(chunk)
+        nonzero = finite & (chunk != 0)
+        sample = strided_sample(chunk, samples_per_chunk)
+        sample = sample[np.isfinite(sample) & (sample != 0)]
+        for display_type, values, sample_values, valid in (
+                (ImageDisplayType.real, np.real(chunk), np.real(sample), None),
+                (ImageDisplayType.imag, np.imag(chunk), np.imag(sample), None),
+                (ImageDisplayType.mag, np.abs(chunk), np.abs(sample), nonzero),
+                (ImageDisplayType.phase, np.angle(chunk), np.angle(sample), nonzero)):
+            if valid is None:
+                valid = finite & (values != 0)
+                sample_values = sample_values[sample_values != 0]
+            values = values[valid]
+            if values.size == 0:
+                continue
+            count[display_type] += values.size
+            total[display_type] += values.sum(dtype=np.float64)
+            total_sq[display_type] += np.square(values, dtype=np.float64).sum()
+            minimum[display_type] = min(minimum[display_type], values.min())
+            maximum[display_type] = max(maximum[display_type], values.max())
+            samples[display_type].append(sample_values)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        std = np.sqrt(np.maximum(total_sq / count - mean ** 2, 0))
+    mean[count == 0] = 0
+    std[count == 0] = 0
+    histograms = []
+    percentiles = np.zeros((4, len(VolumeStatistics.percentile_ranks)))
+    levels = np.zeros(4)
+    windows = np.ones(4)
+    for display_type in range(4):
+        sample = np.concatenate(samples[display_type]) if samples[display_type] else np.zeros(0)
+        if sample.size:
+            histograms.append(np.histogram(sample, bins=num_bins, range=(minimum[display_type], maximum[display_type])))
+            percentiles[display_type] = np.percentile(sample, VolumeStatistics.percentile_ranks)
+        else:
+            histograms.append((np.zeros(num_bins, dtype=int), np.linspace(0, 1, num_bins + 1)))
+        levels[display_type] = default_level_of_valid(sample, background_threshold)
+        windows[display_type] = 3 * std[display_type] if std[display_type] > 0 else 1
+    levels[ImageDisplayType.phase] = 0.0
+    windows[ImageDisplayType.phase] = 2.0 * np.pi
+    return VolumeStatistics(count, mean, std, minimum, maximum, histograms, percentiles, levels, windows)
+
+
+def iter_leading_chunks(array, chunk_bytes=64 * 2 ** 20):
+    # slabs along the first axis, which are contiguous for C ordered arrays and memmaps
+    n = array.shape[0] if array.ndim else 1
+    row_bytes = max(array.nbytes // max(n, 1), 1)
+    step = int(max(1, chunk_bytes // row_bytes))
+    for start in range(0, n, step):
+        yield array[start:start + step] if array.ndim else array
+
+
+def finite_range_of_chunk(chunk, max_samples):
+    """
+    Minimum, maximum and a strided sample of the finite values of a chunk.
+    Only chunks containing infinities are copied, NaNs are skipped by fmin/fmax.
+    """
+    chunk = np.asarray(chunk)
+    if chunk.size == 0:
+        return np.inf, -np.inf, np.zeros(0)
+    minimum = np.fmin.reduce(chunk, axis=None)
+    maximum = np.fmax.reduce(chunk, axis=None)
+    if not (np.isfinite(minimum) and np.isfinite(maximum)):
+        finite = chunk[np.isfinite(chunk)]
+        if finite.size == 0:
+            return np.inf, -np.inf, np.zeros(0)
+        minimum, maximum = finite.min(), finite.max()
+    sample = strided_sample(chunk, max_samples)
+    return minimum, maximum, sample[np.isfinite(sample)]
+
+
+def scan_finite_range(arrays, percentile_ranks=(), chunk_bytes=64 * 2 ** 20, max_samples=MAX_SAMPLES,
+                      max_workers=None):
+    """
+    Minimum and maximum of the finite values of all arrays, and percentiles
+    estimated from a strided sample of every chunk.  The arrays are read one
+    chunk at a time on a thread pool, so no masked or finite copy of a whole
+    array is made.  Returns (minimum, maximum, percentiles); minimum and
+    maximum are NaN if no value is finite.
+    """
+    chunks = [chunk for array in arrays if array is not None
+              for chunk in iter_leading_chunks(np.asanyarray(array), chunk_bytes)]
+    samples_per_chunk = max(1, max_samples // max(len(chunks), 1))
+    if max_workers is None:
+        max_workers = min(4, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='vidi3d-range') as executor:
+        results = list(executor.map(lambda chunk: finite_range_of_chunk(chunk, samples_per_chunk), chunks))
+
+    minimum = min((result[0] for result in results), default=np.inf)
+    maximum = max((result[1] for result in results), default=-np.inf)
+    if minimum > maximum:
+        return np.nan, np.nan, np.full(len(percentile_ranks), np.nan)
+    percentiles = np.zeros(0)
+    if len(percentile_ranks):
+        percentiles = np.percentile(np.concatenate([result[2] for result in results]), percentile_ranks)
+    return minimum, maximum, percentiles
@@ -2,26 +2,26 @@
 This module contains all the functions a user needs to call and control the
 behaviour of the viewers.
 """
-import matplotlib.pyplot as plt
+import numpy as np
 
-plt.ion()
+from .compare.main import Compare
 from .core import start_viewer, to_list
-from vidi3d.imshow.main import Imshow3d as Imshow3d
-from vidi3d.compare.main import Compare as Compare
-import numpy as np
+from .imshow.main import Imshow3d
 
 
 def imshow3d(data,
              pixdim=None,
              interpolation='none',
-             block=True):
+             block=True,
+             render_engine='matplotlib'):
     """
     A viewer that displays cross sections of a 3D image.
 
     Parameters
     -----------
-    data : array_like, shape (x, y, z) 
-        The data to be displayed. 
+    data : array_like or Volume, shape (x, y, z[, t])
+        The data to be displayed.  Use open_volume to view data stored on disk
+        without reading it into memory.
 
     pixdim : list of voxel sizes for each dimesion. For nifti files this
              can be found using: nib.load(imgloc).get_header()['pixdim'][1:4]
@@ -39,6 +39,11 @@ def imshow3d(data,
     block : boolean, optional, default: False
         If true, block execution of further code until all viewers are closed. 
 
+    render_engine : {'matplotlib', 'lut'}, optional, default: 'matplotlib'
+        How image slices are drawn.  'lut' maps slices through a colour lookup
+        table and paints them with Qt, which is faster for large slices.
+        Interpolation is then either nearest or Qt's smooth scaling.
+
     Returns
     --------
     viewer : `imshow._MainWindow4D`
@@ -47,14 +52,16 @@ def imshow3d(data,
 
     if data.ndim == 3:
         data = data[..., np.newaxis]
-    viewer = Imshow3d(data, pixdim=pixdim, interpolation=interpolation)
+    viewer = Imshow3d(data, pixdim=pixdim, interpolation=interpolation, render_engine=render_engine)
     if not block:
-        viewer.image4d.complex_image = np.copy(viewer.image4d.complex_image)
+        viewer.image4d.complex_image = viewer.image4d.complex_image.snapshot()
         # if the viewer is run as not blocking, then the underlying data
         # can change later on in the script and effect the results shown
-        # in the viewer.  Therefore, we must make a copy.  If you have a
-        # large data set and don't want to wait for the copy or can't afford
-        # the memory, then you should run the viewer with block=True
+        # in the viewer.  Therefore, we must take a snapshot.  Volumes opened
+        # read-only with open_volume are shared, writeable arrays are copied.
+        # If you have a large writeable data set and don't want to wait for the
+        # copy or can't afford the memory, then you should run the viewer with
+        # block=True
     return start_viewer(viewer, block)
 
 
@@ -69,7 +76,12 @@ def compare2d(data,
               max_in_row=None,
               cmaps=None,
               overlays=None,
-              overlay_cmaps=None):
+              overlay_cmaps=None,
+              slice_cache_mb=256,
+              volume_statistics=False,
+              render_engine='matplotlib',
+              quantise=False,
+              quantised_cache_mb=1024):
     """
     A viewer that displays multiple 2D images for comparison.
 
@@ -119,6 +131,31 @@ def compare2d(data,
 
     overlay_cmaps : `~matplotlib.colors.Colormap`, optional, default: cm.Reds
 
+    slice_cache_mb : number, optional, default: 256
+        Memory budget in MB for display data of slices already viewed.
+
+    volume_statistics : boolean, optional, default: False
+        If true, default window/level values and window/level mouse sensitivity
+        are computed once from the whole volume instead of from each slice.
+        Large volumes are read in a background thread.
+
+    render_engine : {'matplotlib', 'lut'}, optional, default: 'matplotlib'
+        How image slices are drawn.  'lut' maps slices through a colour lookup
+        table and paints them with Qt, which is faster for large slices.
+        Interpolation is then either nearest or Qt's smooth scaling.
+
+    quantise : boolean, optional, default: False
+        If true, the displayed type of each volume is also stored as 16 bit
+        codes, computed in the background, and window/level and colormap
+        changes only recolour the codes.  Implies render_engine='lut' and
+        volume_statistics=True.
+
+    quantised_cache_mb : number, optional, default: 1024
+        Memory budget in MB for the codes of quantised volumes.  Codes of the
+        display types shown least recently are dropped to stay within it, and
+        are computed again if the display type is shown again.  The codes of
+        the display type being shown are always kept.
+
     Returns
     --------
     viewer : `compare._MainWindowCompare`
@@ -158,7 +195,12 @@ def compare2d(data,
                      max_in_row=max_in_row,
                      cmaps=cmaps,
                      overlays=overlays,
-                     overlay_cmaps=overlay_cmaps)
+                     overlay_cmaps=overlay_cmaps,
+                     slice_cache_mb=slice_cache_mb,
+                     volume_statistics=volume_statistics,
+                     render_engine=render_engine,
+                     quantise=quantise,
+                     quantised_cache_mb=quantised_cache_mb)
 
     return start_viewer(viewer, block, window_title)
 
@@ -176,15 +218,22 @@ def compare3d(data,
               overlays=None,
               overlay_cmaps=None,
               mmb_callback=None,
+              slice_cache_mb=256,
+              movie_cache_mb=256,
+              volume_statistics=False,
+              render_engine='matplotlib',
+              quantise=False,
+              quantised_cache_mb=1024,
               ):
     """
     A viewer that displays multiple 3D images for comparison.
 
     Parameters
     -----------
-    data : array_like, shape (x, y, z[, t])
+    data : array_like or Volume, shape (x, y, z[, t])
         The data to be displayed. Can be a single 2d image f(x,y,z[,t]) or a list of
-        3d images [f1(x,y,z[,t]),f2(x,y,z[,t]),...,fn(x,y,z[,t])].
+        3d images [f1(x,y,z[,t]),f2(x,y,z[,t]),...,fn(x,y,z[,t])].  Use open_volume
+        to view data stored on disk without reading it into memory.
 
     pixdim : list of voxel sizes for each dimesion. For nifti files this
              can be found using: nib.load(imgloc).get_header()['pixdim'][1:4]
@@ -226,6 +275,34 @@ def compare3d(data,
 
     overlay_cmap : `~matplotlib.colors.Colormap`, optional, default: cm.Reds
 
+    slice_cache_mb : number, optional, default: 256
+        Memory budget in MB for display data of slices already viewed.
+
+    movie_cache_mb : number, optional, default: 256
+        Memory budget in MB for colour-mapped movie frames.
+
+    volume_statistics : boolean, optional, default: False
+        If true, default window/level values and window/level mouse sensitivity
+        are computed once from the whole volume instead of from each slice.
+        Large volumes are read in a background thread.
+
+    render_engine : {'matplotlib', 'lut'}, optional, default: 'matplotlib'
+        How image slices are drawn.  'lut' maps slices through a colour lookup
+        table and paints them with Qt, which is faster for large slices.
+        Interpolation is then either nearest or Qt's smooth scaling.
+
+    quantise : boolean, optional, default: False
+        If true, the displayed type of each volume is also stored as 16 bit
+        codes, computed in the background, and window/level and colormap
+        changes only recolour the codes.  Implies render_engine='lut' and
+        volume_statistics=True.
+
+    quantised_cache_mb : number, optional, default: 1024
+        Memory budget in MB for the codes of quantised volumes.  Codes of the
+        display types shown least recently are dropped to stay within it, and
+        are computed again if the display type is shown again.  The codes of
+        the display type being shown are always kept.
+
     Returns
     --------
     viewer : `compare._MainWindowCompare`
@@ -252,5 +329,11 @@ def compare3d(data,
                      overlays=overlays,
                      overlay_cmaps=overlay_cmaps,
                      mmb_callback=mmb_callback,
+                     slice_cache_mb=slice_cache_mb,
+                     movie_cache_mb=movie_cache_mb,
+                     volume_statistics=volume_statistics,
+                     render_engine=render_engine,
+                     quantise=quantise,
+                     quantised_cache_mb=quantised_cache_mb,
                      )
     return start_viewer(viewer, block, window_title)
@@ -0,0 +1,188 @@
+"""
+Volume sources for the viewers.  A Volume wraps an in-memory ndarray or a
+np.memmap and hands out slices and profiles on request, so data stored on disk
+is only paged in as it is viewed.
+"""
+import numpy as np
+
+from .helpers import apply_display_type
+from .statistics import chunk_z_step, compute_volume_statistics
+
+
+class Volume:
+    def __init__(self, data):
+        if isinstance(data, Volume):
+            data = data.data
+        elif not isinstance(data, np.ndarray):
+            data = np.asarray(data)
+        self.data = data
+        # VolumeStatistics of the whole volume, see compute_statistics
+        self.statistics = None
+        # QuantisedVolume of each display type, see quantise
+        self.quantised = {}
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    @property
+    def is_mapped(self):
+        return isinstance(self.data, np.memmap)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        # indexing a memmap returns a memmap view, nothing is read until the values are used
+        return self.data[key]
+
+    def __array__(self, dtype=None, copy=None):
+        if copy:
+            return np.array(self.data, dtype=dtype)
+        return np.asarray(self.data, dtype=dtype)
+
+    def get_slice(self, z, t):
+        return self.data[:, :, z, t]
+
+    def compute_statistics(self, background_threshold=0.05):
+        self.statistics = compute_volume_statistics(self, background_threshold)
+        return self.statistics
+
+    def quantise(self, display_type, background_threshold=0.05):
+        """
+        Return the QuantisedVolume of a display type, quantising the volume the
+        first time it is requested.  The value range is taken from the volume
+        statistics, which are computed if they are not known.
+        """
+        if display_type not in self.quantised:
+            if self.statistics is None:
+                self.compute_statistics(background_threshold)
+            self.quantised[display_type] = quantise_volume(self, self.statistics, display_type)
+        return self.quantised[display_type]
+
+    def snapshot(self):
+        """
+        Return a Volume which is not affected by later changes to the source data.
+
+        Volumes opened read-only from disk cannot be modified in this process, so
+        they share the existing mapping and nothing is copied.  Writeable arrays
+        are copied.  The statistics and quantised volumes already computed are
+        kept, but the snapshot has its own dict of them, so they are not cleared
+        or replaced when the source volume is refreshed.
+        """
+        if self.is_mapped and self.data.mode == 'r':
+            snapshot = Volume(self.data)
+        else:
+            snapshot = Volume(np.copy(self.data))
+        snapshot.statistics = self.statistics
+        snapshot.quantised = dict(self.quantised)
+        return snapshot
+
+
+class QuantisedVolume:
+    """
+    Display values of one display type of a volume stored as uint16 codes, a
+    quarter of the memory of float64 values.  A code represents the value
+    offset + scale * code, and nan_code represents NaN.  Window/level changes
+    of a quantised slice only need a new colour for each of the 65536 codes.
+
+    Codes are stored with shape (t, z, y, x) so that each slice is contiguous
+    and already in the row order of the displayed image.
+    """
+    nan_code = 2 ** 16 - 1
+
+    def __init__(self, volume, display_type, minimum, maximum, chunk_bytes=64 * 2 ** 20):
+        self.display_type = display_type
+        self.offset = float(minimum)
+        self.scale = float(maximum - minimum) / (self.nan_code - 1) if maximum > minimum else 1.0
+        self.codes = np.empty(volume.shape[::-1], dtype=np.uint16)
+        nz, nt = volume.shape[2:4]
+        z_step = chunk_z_step(volume, chunk_bytes)
+        for t in range(nt):
+            for z in range(0, nz, z_step):
+                values = apply_display_type(np.asarray(volume[:, :, z:z + z_step, t]), display_type)
+                self.codes[t, z:z + z_step] = self.encode(values).transpose(2, 1, 0)
+
+    def slice_codes(self, z, t):
+        # codes of an (x, y) slice, transposed like the displayed image
+        return self.codes[t, z]
+
+    def encode(self, values):
+        codes = np.subtract(values, self.offset, dtype=np.float64)
+        codes /= self.scale
+        np.rint(codes, out=codes)
+        np.clip(codes, 0, self.nan_code - 1, out=codes)
+        codes[np.isnan(codes)] = self.nan_code
+        return codes.astype(np.uint16)
+
+    @property
+    def code_values(self):
+        # value represented by every code, indexed by code
+        values = self.offset + self.scale * np.arange(self.nan_code + 1)
+        values[self.nan_code] = np.nan
+        return values
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+
+def quantise_volume(volume, volume_statistics, display_type):
+    """
+    QuantisedVolume of a display type of volume, with the value range taken
+    from its VolumeStatistics.  Unlike Volume.quantise, the volume is not
+    changed, so it can be called from a worker thread.
+    """
+    # statistics leave out zeros, which are usually background and must still be representable
+    minimum = min(volume_statistics.min[display_type], 0)
+    maximum = max(volume_statistics.max[display_type], 0)
+    return QuantisedVolume(volume, display_type, minimum, maximum)
+
+
+def as_volume(data):
+    if isinstance(data, Volume):
+        return data
+    return Volume(data)
+
+
+def open_volume(fname, shape=None, dtype=None, offset=0, order='C', mmap_mode='r'):
+    """
+    Open an image volume stored on disk without reading it into memory.
+
+    .npy files are memory-mapped using their header.  Raw binary files need
+    the shape and dtype of the stored array.
+    """
+    if str(fname).endswith('.npy'):
+        return Volume(np.load(fname, mmap_mode=mmap_mode))
+    if shape is None or dtype is None:
+        raise ValueError(f'shape and dtype are required to open raw file {fname}')
+    return Volume(np.memmap(fname, dtype=dtype, mode=mmap_mode, offset=offset, shape=tuple(shape), order=order))
+
+
+def gather_profiles(volumes, x, y, z, t):
+    """
+    Profiles through (x, y, z, t) along each axis of every volume.
+
+    All four profiles of a volume are read with a single fancy index, and the
+    profiles of all volumes are stacked, so the x, y, z and t profiles are
+    returned as (number of volumes, axis length) arrays.
+    """
+    nx, ny, nz, nt = volumes[0].shape[:4]
+    indices = (np.concatenate((np.arange(nx), np.full(ny, x), np.full(nz, x), np.full(nt, x))),
+               np.concatenate((np.full(nx, y), np.arange(ny), np.full(nz, y), np.full(nt, y))),
+               np.concatenate((np.full(nx, z), np.full(ny, z), np.arange(nz), np.full(nt, z))),
+               np.concatenate((np.full(nx, t), np.full(ny, t), np.full(nz, t), np.arange(nt))))
+    profiles = np.stack([volume[indices] for volume in volumes])
+    return np.split(profiles, np.cumsum((nx, ny, nz)), axis=1)